@@ -0,0 +1,114 @@
+"""Compare a new event loop per Celery task against the persistent runtime
+
+Each simulated task makes a few HTTP calls, as the pipeline does to the LLM
+and GitHub APIs, against a local keep-alive HTTP server. With a loop per
+task (``asyncio.run``) every task needs a new client and new connections;
+on the persistent runtime tasks share one pooled client.
+
+Usage:
+    python -m benchmarks.bench_async_runtime [--tasks N] [--calls N] [--latency MS]
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+
+import httpx
+
+from repopal.core.async_runtime import AsyncRuntime
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so clients can pool connections
+    disable_nagle_algorithm = True
+    connections = 0
+    latency = 0.0
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        body = b'{"choices": [{"message": {"content": "<answer>ok</answer>"}}]}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+async def pipeline_task(client: httpx.AsyncClient, url: str, calls: int) -> None:
+    for _ in range(calls):
+        response = await client.post(url, json={"messages": []})
+        response.raise_for_status()
+
+
+def loop_per_task(url: str, tasks: int, calls: int) -> List[float]:
+    async def task():
+        async with httpx.AsyncClient() as client:
+            await pipeline_task(client, url, calls)
+
+    return [timed(lambda: asyncio.run(task())) for _ in range(tasks)]
+
+
+def persistent_runtime(url: str, tasks: int, calls: int) -> List[float]:
+    runtime = AsyncRuntime()
+    try:
+        client = runtime.shared("http", httpx.AsyncClient)
+        return [
+            timed(lambda: runtime.run(pipeline_task(client, url, calls)))
+            for _ in range(tasks)
+        ]
+    finally:
+        runtime.close()
+
+
+def timed(function: Callable[[], None]) -> float:
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--calls", type=int, default=4, help="HTTP calls per task")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Server latency per call in ms"
+    )
+    args = parser.parse_args()
+
+    Handler.latency = args.latency / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+    print(f"{args.tasks} tasks x {args.calls} calls, {args.latency:g} ms latency")
+    print(f"  {'runtime':<20} {'mean ms':>9} {'p95 ms':>9} {'connections':>12}")
+    try:
+        for name, strategy in (
+            ("loop per task", loop_per_task),
+            ("persistent runtime", persistent_runtime),
+        ):
+            Handler.connections = 0
+            durations = sorted(strategy(url, args.tasks, args.calls))
+            mean = sum(durations) / len(durations)
+            p95 = durations[int(len(durations) * 0.95) - 1]
+            print(
+                f"  {name:<20} {mean * 1000:>9.2f} {p95 * 1000:>9.2f} "
+                f"{Handler.connections:>12}"
+            )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
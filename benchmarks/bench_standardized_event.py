@@ -0,0 +1,168 @@
+"""Compare StandardizedEvent against the previous pydantic model
+
+Measures construction and serialization (to a Celery-ready JSON string and
+back) for a small issue event and a large installation event listing
+hundreds of repositories. The pydantic model is sent whole; the lazy event
+is sent as its claim-check envelope, which carries the standardized fields
+and a reference to the body in an in-memory blob store.
+
+Usage:
+    python -m benchmarks.bench_standardized_event [--number N]
+"""
+
+import argparse
+import json
+import timeit
+from datetime import datetime
+from typing import Any, Dict
+
+from pydantic import BaseModel, ConfigDict
+
+from repopal.schemas.service_handler import ServiceProvider, StandardizedEvent
+from repopal.services.claim_check import (
+    BlobNotFoundError,
+    BlobStore,
+    ClaimCheck,
+    blob_digest,
+)
+
+
+class PydanticStandardizedEvent(BaseModel):
+    """The StandardizedEvent model as it was before the lazy raw payload"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    provider: ServiceProvider
+    event_type: str
+    action: str | None = None
+    user_request: str
+    payload: Dict[str, Any]
+    raw_payload: Dict[str, Any]
+
+
+class MemoryBlobStore(BlobStore):
+    """Keeps blobs in a dict, so the numbers leave out storage latency"""
+
+    def __init__(self):
+        self.blobs: Dict[str, bytes] = {}
+
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        self.blobs.setdefault(digest, data)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        try:
+            return self.blobs[digest]
+        except KeyError:
+            raise BlobNotFoundError(digest) from None
+
+    def prune(self, stored_before: datetime) -> int:
+        return 0
+
+
+def issue_payload() -> Dict[str, Any]:
+    return {
+        "action": "opened",
+        "issue": {
+            "number": 42,
+            "title": "Replace world with everyone",
+            "body": "Please update the greeting. " * 20,
+            "user": {"login": "octocat", "id": 1, "type": "User"},
+            "labels": [{"name": f"label-{i}"} for i in range(5)],
+        },
+        "repository": {
+            "full_name": "octocat/hello-world",
+            "html_url": "https://github.com/octocat/hello-world",
+        },
+        "sender": {"login": "octocat", "type": "User"},
+    }
+
+
+def installation_payload() -> Dict[str, Any]:
+    return {
+        "action": "created",
+        "installation": {"id": 1, "account": {"login": "octo-org"}},
+        "repositories": [
+            {
+                "id": i,
+                "name": f"repo-{i}",
+                "full_name": f"octo-org/repo-{i}",
+                "private": bool(i % 2),
+                "description": "A repository " * 10,
+            }
+            for i in range(500)
+        ],
+        "sender": {"login": "octocat", "type": "User"},
+    }
+
+
+def bench(name: str, payload: Dict[str, Any], number: int) -> None:
+    body = json.dumps(payload).encode()
+    fields = {
+        "provider": ServiceProvider.GITHUB,
+        "event_type": "issue",
+        "action": payload.get("action"),
+        "user_request": "Check issue",
+        "payload": {"title": "t", "description": "d", "repository": "o/r"},
+    }
+
+    def build_pydantic():
+        return PydanticStandardizedEvent(**fields, raw_payload=payload)
+
+    def build_lazy():
+        return StandardizedEvent(**fields, raw_payload=payload, raw_body=body)
+
+    claim_check = ClaimCheck(MemoryBlobStore())
+    pydantic_event = build_pydantic()
+    lazy_event = build_lazy()
+    pydantic_json = pydantic_event.model_dump_json()
+    lazy_json = json.dumps(claim_check.check_in(lazy_event))
+
+    results = {
+        "construct": (
+            timeit.timeit(build_pydantic, number=number),
+            timeit.timeit(build_lazy, number=number),
+        ),
+        "serialize": (
+            timeit.timeit(pydantic_event.model_dump_json, number=number),
+            timeit.timeit(
+                lambda: json.dumps(claim_check.check_in(lazy_event)), number=number
+            ),
+        ),
+        "deserialize": (
+            timeit.timeit(
+                lambda: PydanticStandardizedEvent.model_validate_json(pydantic_json),
+                number=number,
+            ),
+            timeit.timeit(
+                lambda: claim_check.check_out(json.loads(lazy_json)),
+                number=number,
+            ),
+        ),
+    }
+
+    print(f"\n{name} ({len(body):,} byte body, {number:,} iterations)")
+    print(f"  {'operation':<12} {'pydantic µs':>12} {'lazy µs':>10} {'speedup':>8}")
+    for operation, (before, after) in results.items():
+        print(
+            f"  {operation:<12} {before / number * 1e6:>12.2f} "
+            f"{after / number * 1e6:>10.2f} {before / after:>7.1f}x"
+        )
+    print(
+        f"  {'message size':<12} {len(pydantic_json):>12,} {len(lazy_json):>10,} "
+        f"{len(pydantic_json) / len(lazy_json):>7.1f}x"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    bench("issue event", issue_payload(), args.number)
+    bench("installation event", installation_payload(), max(1, args.number // 20))
+
+
+if __name__ == "__main__":
+    main()
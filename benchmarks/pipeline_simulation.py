@@ -0,0 +1,435 @@
+"""Drive the real pipeline offline, with in-process stand-ins for its backends
+
+Runs ``PipelineRunner`` end to end for N jobs at a given concurrency, with
+every external service replaced behind the interface the pipeline already
+uses:
+
+- ``SimulatedLLM`` is an ``LLMService`` whose completions come from a
+  deterministic responder, so prompts are still built and answers parsed
+- ``SimulatedEnvironment`` is an ``EnvironmentManager`` that builds no
+  images and starts no containers; running the command sleeps, then makes
+  the command's change in the clone itself
+- ``RecordingHandler`` records ``send_response`` calls, and
+  ``SimulatedPullRequests`` records pull requests instead of opening them
+
+Cloning, committing and pushing are real git operations against a local
+bare repository, and runs are persisted to a throwaway SQLite database, so
+their cost is part of what is measured. Each stand-in sleeps for a sample
+of its latency distribution, given in milliseconds as ``fixed:MS``,
+``uniform:LOW:HIGH`` or ``lognormal:MEDIAN:SIGMA``.
+
+The report gives throughput, job latency, per-stage latency and the
+orchestration overhead: how much of a job's time was not spent inside the
+stages on its critical path.
+
+Usage:
+    python -m benchmarks.pipeline_simulation [--jobs N] [--concurrency 1,4,16]
+        [--llm-latency SPEC] [--execute-latency SPEC] [--seed N] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+# No network: litellm would otherwise fetch its model price list on import
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+from git import Repo  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from benchmarks.webhook_replay import percentile  # noqa: E402
+from repopal.core.database import Base  # noqa: E402
+from repopal.schemas.service_handler import ServiceProvider, StandardizedEvent  # noqa: E402
+from repopal.services.claim_check import ClaimCheck, FileBlobStore  # noqa: E402
+from repopal.services.command_selector import CommandSelectorService  # noqa: E402
+from repopal.services.environment_manager import EnvironmentManager  # noqa: E402
+from repopal.services.llm import LLMService  # noqa: E402
+from repopal.services.pipeline import PipelineRunner, PipelineServices  # noqa: E402
+
+USER_REQUEST = "Replace world with everyone"
+
+
+@dataclass(frozen=True)
+class Latency:
+    """A latency distribution in milliseconds"""
+
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        kind, *values = spec.split(":")
+        try:
+            numbers = [float(value) for value in values]
+        except ValueError:
+            numbers = []
+        if (kind, len(numbers)) in (("fixed", 1), ("uniform", 2), ("lognormal", 2)):
+            return cls(kind, *numbers)
+        raise ValueError(
+            f"Invalid latency {spec!r}: use fixed:MS, uniform:LOW:HIGH "
+            "or lognormal:MEDIAN:SIGMA"
+        )
+
+    def __str__(self) -> str:
+        values = (self.a,) if self.kind == "fixed" else (self.a, self.b)
+        return ":".join([self.kind, *(f"{value:g}" for value in values)])
+
+    def sample(self, rng: random.Random) -> float:
+        """One draw, in seconds"""
+        if self.kind == "uniform":
+            ms = rng.uniform(self.a, self.b)
+        elif self.kind == "lognormal":
+            ms = self.a * math.exp(rng.gauss(0, self.b))
+        else:
+            ms = self.a
+        return max(0.0, ms) / 1000
+
+
+@dataclass(frozen=True)
+class Latencies:
+    """Latency of each simulated backend"""
+
+    llm: Latency = Latency("lognormal", 800, 0.4)  # Per completion
+    build: Latency = Latency("fixed", 0)  # Image build; usually cached
+    container: Latency = Latency("lognormal", 600, 0.3)  # Container start
+    execute: Latency = Latency("lognormal", 5000, 0.5)  # The command itself
+    github: Latency = Latency("lognormal", 300, 0.3)  # Comments, PRs, messages
+
+
+class SimulatedLLM(LLMService):
+    """Answers each kind of prompt with a fixed response after a delay
+
+    Responses are chosen by the system prompt, which names the task, and
+    wrapped in the answer tags the real model is asked for. Command
+    selection always calls ``find_replace``.
+    """
+
+    TOOL_CALL = ("find_replace", {"find_pattern": "world", "replace_text": "everyone"})
+    RESPONSES = (
+        ("summarizes code changes", "Replaced 'world' with 'everyone'."),
+        ("commit messages", "Replace world with everyone\n\nAs requested."),
+        (
+            "pull request descriptions",
+            "Replace world with everyone\n\nReplaces 'world' with 'everyone'.",
+        ),
+        ("status updates", "Thanks! I'm working on your request."),
+    )
+
+    def __init__(self, latency: Latency, rng: random.Random):
+        super().__init__()
+        self.latency = latency
+        self.rng = rng
+        self.calls: Counter = Counter()
+
+    async def get_completion(
+        self, system_prompt: str, user_prompt: str, skip_reasoning: bool = False
+    ) -> str:
+        await asyncio.sleep(self.latency.sample(self.rng))
+        for marker, answer in self.RESPONSES:
+            if marker in system_prompt:
+                self.calls[marker] += 1
+                return self._extract_answer(
+                    f"<reasoning>Simulated.</reasoning><answer>{answer}</answer>"
+                )
+        raise ValueError(f"No simulated response for: {system_prompt}")
+
+    async def get_tool_call(self, system_prompt, user_prompt, tools):
+        await asyncio.sleep(self.latency.sample(self.rng))
+        self.calls["tool call"] += 1
+        name, arguments = self.TOOL_CALL
+        return name, dict(arguments)
+
+
+class SimulatedContainer:
+    def __init__(self, name: str):
+        self.id = name
+        self.name = name
+        self.status = "running"
+        self.killed = threading.Event()
+
+    def kill(self):
+        self.status = "exited"
+        self.killed.set()
+
+    def stop(self):
+        self.status = "exited"
+
+    def remove(self):
+        pass
+
+
+class SimulatedEnvironment(EnvironmentManager):
+    """Sleeps instead of building, starting and running containers"""
+
+    def __init__(self, latencies: Latencies, rng: random.Random):
+        self.docker_client = None
+        self.work_dir = None
+        self.container = None
+        self.logger = logging.getLogger(__name__)
+        self.latencies = latencies
+        self.rng = rng
+
+    def cached_image(self, command):
+        return None
+
+    def build_image(self, command):
+        time.sleep(self.latencies.build.sample(self.rng))
+        return f"simulated-{command.metadata.name}"
+
+    def has_image(self, image_id):
+        return True
+
+    def setup_container(self, command, environment=None, name=None, image=None):
+        time.sleep(self.latencies.container.sample(self.rng))
+        self.container = SimulatedContainer(name or command.metadata.name)
+
+    def attach_container(self, container_id):
+        return False
+
+    def run_in_container(self, command, budget=None):
+        container = self.container
+        if container.killed.wait(self.latencies.execute.sample(self.rng)):
+            return 137, "Killed"
+        # What the selected find_replace command would have done
+        path = self.work_dir / "README.md"
+        path.write_text(path.read_text().replace("world", "everyone"))
+        return 0, "Replacement complete"
+
+
+class RecordingHandler:
+    """Stands in for every provider's handler; records what it would send"""
+
+    def __init__(self, latency: Latency, rng: random.Random):
+        self.latency = latency
+        self.rng = rng
+        self.messages: List[str] = []
+
+    def send_response(self, payload, message, response_type, thread_id=None):
+        time.sleep(self.latency.sample(self.rng))
+        self.messages.append(message)
+        return thread_id or f"simulated-{len(self.messages)}"
+
+
+class SimulatedPullRequests:
+    def __init__(self, latency: Latency, rng: random.Random):
+        self.latency = latency
+        self.rng = rng
+        self.created: List[str] = []
+
+    def create_or_get(self, repo_full_name, branch_name, title, body, base=None):
+        time.sleep(self.latency.sample(self.rng))
+        self.created.append(branch_name)
+        return SimpleNamespace(
+            number=len(self.created),
+            html_url=f"https://github.com/{repo_full_name}/pull/{len(self.created)}",
+        )
+
+
+def make_origin(root: Path) -> Path:
+    """A bare repository for the simulated jobs to clone and push to"""
+    seed = Repo.init(root / "seed", initial_branch="main")
+    (root / "seed" / "README.md").write_text("Hello world!\n")
+    seed.index.add(["README.md"])
+    seed.index.commit("Initial commit")
+    Repo.clone_from(root / "seed", root / "origin.git", bare=True)
+    return root / "origin.git"
+
+
+@dataclass
+class SimulationReport:
+    """Throughput and latency of one simulated run of N jobs"""
+
+    jobs: int
+    concurrency: int
+    duration: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    overheads: List[float] = field(default_factory=list)
+    stage_latencies: Dict[str, List[float]] = field(
+        default_factory=lambda: defaultdict(list)
+    )
+    statuses: Counter = field(default_factory=Counter)
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.duration if self.duration else 0.0
+
+    @staticmethod
+    def _ms(values: List[float], *fractions: float) -> Dict[str, float]:
+        ordered = sorted(values)
+        names = {0.5: "p50", 0.95: "p95", 0.99: "p99", 1.0: "max"}
+        return {
+            names[fraction]: round(percentile(ordered, fraction) * 1000, 1)
+            for fraction in fractions
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "jobs": self.jobs,
+            "concurrency": self.concurrency,
+            "duration_seconds": round(self.duration, 3),
+            "throughput_jobs_per_s": round(self.throughput, 2),
+            "job_latency_ms": self._ms(self.latencies, 0.5, 0.95, 0.99, 1.0),
+            "overhead_ms": self._ms(self.overheads, 0.5, 0.95, 1.0),
+            "stage_latency_ms": {
+                stage: self._ms(values, 0.5, 0.95, 1.0)
+                for stage, values in self.stage_latencies.items()
+            },
+            "statuses": dict(sorted(self.statuses.items())),
+        }
+
+    def format(self) -> str:
+        summary = self.summary()
+        lines = [
+            f"jobs         {self.jobs} at concurrency {self.concurrency}",
+            f"duration     {summary['duration_seconds']:.2f}s",
+            f"throughput   {summary['throughput_jobs_per_s']:.2f} jobs/s",
+            "job ms       "
+            + "  ".join(f"{k} {v:.1f}" for k, v in summary["job_latency_ms"].items()),
+            "overhead ms  "
+            + "  ".join(f"{k} {v:.1f}" for k, v in summary["overhead_ms"].items()),
+            "statuses     "
+            + "  ".join(f"{k}: {n}" for k, n in summary["statuses"].items()),
+            f"  {'stage':<16} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}",
+        ]
+        for stage, ms in summary["stage_latency_ms"].items():
+            lines.append(
+                f"  {stage:<16} {ms['p50']:>9.1f} {ms['p95']:>9.1f} {ms['max']:>9.1f}"
+            )
+        return "\n".join(lines)
+
+
+async def simulate(
+    jobs: int,
+    concurrency: int,
+    latencies: Latencies = Latencies(),
+    seed: Optional[int] = None,
+) -> SimulationReport:
+    """Run ``jobs`` pipelines, at most ``concurrency`` at a time"""
+    rng = random.Random(seed)
+    report = SimulationReport(jobs=jobs, concurrency=concurrency)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        origin = make_origin(root)
+        engine = create_engine(
+            f"sqlite:///{root}/simulation.db", connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        llm = SimulatedLLM(latencies.llm, rng)
+        handler = RecordingHandler(latencies.github, rng)
+        services = PipelineServices(
+            llm=llm,
+            command_selector=CommandSelectorService(llm=llm),
+            pull_requests=SimulatedPullRequests(latencies.github, rng),
+            handler_for=lambda provider: handler,
+            environment_factory=lambda: SimulatedEnvironment(latencies, rng),
+        )
+        claim_check = ClaimCheck(FileBlobStore(root / "blobs"))
+        slots = asyncio.Semaphore(concurrency)
+
+        async def job(number: int) -> None:
+            event = StandardizedEvent(
+                provider=ServiceProvider.GITHUB,
+                event_type="issue",
+                action="opened",
+                user_request=USER_REQUEST,
+                payload={"repository": "simulated/repo", "url": str(origin)},
+                raw_payload={
+                    "repository": {
+                        "full_name": "simulated/repo",
+                        "default_branch": "main",
+                    },
+                    "issue": {"number": number},
+                },
+            )
+            async with slots:
+                db = session_factory()
+                try:
+                    runner = PipelineRunner(db, services, claim_check=claim_check)
+                    run_id = str(runner.create(event).id)
+                    started = time.perf_counter()
+                    run = await runner.run(run_id)
+                    elapsed = time.perf_counter() - started
+
+                    report.latencies.append(elapsed)
+                    report.statuses[run.status.value] += 1
+                    for stage in run.stages:
+                        if stage.duration_seconds is not None:
+                            report.stage_latencies[stage.stage].append(
+                                stage.duration_seconds
+                            )
+                    timings = run.stage_timings or {}
+                    working = sum(
+                        timings[name]["end"] - timings[name]["start"]
+                        for name in run.critical_path or ()
+                    )
+                    report.overheads.append(max(0.0, elapsed - working))
+                finally:
+                    db.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(job(number) for number in range(jobs)))
+        report.duration = time.perf_counter() - started
+        engine.dispose()
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument(
+        "--concurrency",
+        default="1,4,16",
+        help="Comma-separated concurrency levels to run in turn",
+    )
+    defaults = Latencies()
+    for name in ("llm", "build", "container", "execute", "github"):
+        default = getattr(defaults, name)
+        parser.add_argument(
+            f"--{name}-latency",
+            type=Latency.parse,
+            default=default,
+            help=f"Latency distribution in ms (default {default})",
+        )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Print the reports as JSON")
+    args = parser.parse_args()
+
+    # The simulation itself is the point; keep pipeline logs out of the report
+    logging.basicConfig(level=logging.WARNING)
+    latencies = Latencies(
+        llm=args.llm_latency,
+        build=args.build_latency,
+        container=args.container_latency,
+        execute=args.execute_latency,
+        github=args.github_latency,
+    )
+    reports = [
+        asyncio.run(simulate(args.jobs, int(level), latencies, seed=args.seed))
+        for level in args.concurrency.split(",")
+    ]
+    if args.json:
+        print(json.dumps([report.summary() for report in reports], indent=2))
+    else:
+        print("\n\n".join(report.format() for report in reports))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+"""Replay a corpus of recorded webhook deliveries against the ingest endpoint
+
+Each delivery is signed with the configured webhook secrets, exactly as
+GitHub and Slack sign them, and posted to the FastAPI app in-process over
+an ASGI transport. Everything outbound is replaced with offline stand-ins:
+enqueueing only records the delivery, handlers never call the GitHub or
+Slack APIs, the database is a throwaway SQLite file (unless
+``--database-url`` is given) and Redis is in-memory (fakeredis) or off.
+
+Each corpus file in ``benchmarks/corpus`` holds one recorded delivery:
+
+    {"provider": "github", "weight": 3, "headers": {"X-GitHub-Event": "issues"},
+     "encoding": "json", "payload": {...}}
+
+``weight`` sets how often it is picked relative to the others and
+``encoding`` is ``json`` (default) or ``form`` (Slack slash commands).
+
+Usage:
+    python -m benchmarks.webhook_replay [--requests N] [--concurrency C]
+        [--duplicate-ratio R] [--redis none|fake|URL] [--json]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import random
+import tempfile
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
+from fastapi import Depends
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from repopal.api.deps import get_deduplicator, get_webhook_inbox
+from repopal.core.config import settings
+from repopal.core.database import Base, get_db
+from repopal.main import app
+from repopal.schemas.service_handler import ServiceProvider
+from repopal.services.cancellation import get_cancellation_registry
+from repopal.services.delivery_dedup import DeliveryDeduplicator
+from repopal.services.event_coalescer import EventCoalescer, get_event_coalescer
+from repopal.services.rate_limiter import (
+    RateLimitResolver,
+    TenantRateLimiter,
+    get_rate_limit_resolver,
+    get_rate_limiter,
+)
+from repopal.services.service_handler_factory import ServiceHandlerFactory
+from repopal.services.service_handlers.base import ResponseType
+from repopal.services.service_handlers.github import GitHubHandler
+from repopal.services.service_handlers.slack import SlackHandler
+from repopal.services.webhook_inbox import WebhookInbox
+from repopal.services.workspace_speculation import get_workspace_preparation
+
+DEFAULT_CORPUS = Path(__file__).parent / "corpus"
+REPLAY_SECRET = "replay-secret"  # Used for providers with no configured secret
+
+
+@dataclass
+class CorpusEntry:
+    """One recorded delivery"""
+
+    name: str
+    provider: ServiceProvider
+    payload: Dict[str, Any]
+    headers: Dict[str, str] = field(default_factory=dict)
+    encoding: str = "json"
+    weight: float = 1.0
+
+
+def load_corpus(path: Path = DEFAULT_CORPUS) -> List[CorpusEntry]:
+    """Load every ``*.json`` delivery in a corpus directory"""
+    entries = []
+    for file in sorted(Path(path).glob("*.json")):
+        data = json.loads(file.read_text())
+        entries.append(
+            CorpusEntry(
+                name=file.stem,
+                provider=ServiceProvider(data["provider"]),
+                payload=data["payload"],
+                headers=data.get("headers", {}),
+                encoding=data.get("encoding", "json"),
+                weight=float(data.get("weight", 1)),
+            )
+        )
+    if not entries:
+        raise ValueError(f"No corpus files found in {path}")
+    return entries
+
+
+class DeliverySigner:
+    """Renders corpus entries as signed HTTP requests
+
+    Every request gets its own delivery ID (``X-GitHub-Delivery``, or the
+    Slack ``event_id``/``trigger_id``), so deduplication only kicks in for
+    deliberate replays of an earlier ID.
+    """
+
+    def __init__(self, github_secret: str, slack_secret: str):
+        self.github_secret = github_secret
+        self.slack_secret = slack_secret
+
+    def sign(
+        self, entry: CorpusEntry, delivery_id: str
+    ) -> Tuple[Dict[str, str], bytes]:
+        payload = dict(entry.payload)
+        headers = dict(entry.headers)
+
+        if entry.provider == ServiceProvider.SLACK:
+            if "command" in payload:
+                payload["trigger_id"] = delivery_id
+            else:
+                payload["event_id"] = delivery_id
+
+        if entry.encoding == "form":
+            body = urlencode(payload).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        else:
+            body = json.dumps(payload).encode()
+            headers["Content-Type"] = "application/json"
+
+        if entry.provider == ServiceProvider.GITHUB:
+            signature = hmac.new(
+                self.github_secret.encode(), body, hashlib.sha256
+            ).hexdigest()
+            headers["X-GitHub-Delivery"] = delivery_id
+            headers["X-Hub-Signature-256"] = f"sha256={signature}"
+        else:
+            timestamp = str(int(time.time()))
+            signature = hmac.new(
+                self.slack_secret.encode(),
+                f"v0:{timestamp}:".encode() + body,
+                hashlib.sha256,
+            ).hexdigest()
+            headers["X-Slack-Request-Timestamp"] = timestamp
+            headers["X-Slack-Signature"] = f"v0={signature}"
+
+        return headers, body
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+@dataclass
+class ReplayReport:
+    """Latency, throughput and outcome counts for one replay run"""
+
+    concurrency: int
+    duration: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    outcomes: Counter = field(default_factory=Counter)
+    errors: int = 0
+    enqueued: int = 0
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.duration if self.duration else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "concurrency": self.concurrency,
+            "duration_seconds": round(self.duration, 3),
+            "throughput_rps": round(self.throughput, 1),
+            "latency_ms": {
+                name: round(percentile(ordered, fraction) * 1000, 2)
+                for name, fraction in (
+                    ("p50", 0.50),
+                    ("p95", 0.95),
+                    ("p99", 0.99),
+                    ("max", 1.0),
+                )
+            },
+            "error_rate": round(self.error_rate, 4),
+            "statuses": dict(sorted(self.statuses.items())),
+            "outcomes": dict(sorted(self.outcomes.items())),
+            "enqueued": self.enqueued,
+        }
+
+    def format(self) -> str:
+        summary = self.summary()
+        latency = summary["latency_ms"]
+        lines = [
+            f"requests     {summary['requests']} at concurrency {self.concurrency}",
+            f"duration     {summary['duration_seconds']:.2f}s",
+            f"throughput   {summary['throughput_rps']:.1f} req/s",
+            "latency ms   "
+            + "  ".join(f"{name} {value:.2f}" for name, value in latency.items()),
+            f"error rate   {summary['error_rate']:.2%}",
+            "statuses     "
+            + "  ".join(f"{code}: {n}" for code, n in summary["statuses"].items()),
+            "outcomes     "
+            + "  ".join(f"{name}: {n}" for name, n in summary["outcomes"].items()),
+            f"enqueued     {summary['enqueued']}",
+        ]
+        return "\n".join(lines)
+
+
+class OfflineGitHubHandler(GitHubHandler):
+    """GitHub handler whose responses are recorded instead of posted"""
+
+    def __init__(self, webhook_secret: str):
+        super().__init__(webhook_secret, github_token="offline")
+        self.responses: List[str] = []
+
+    def send_response(
+        self,
+        payload: Dict[str, Any],
+        message: str,
+        response_type: ResponseType,
+        thread_id: Optional[str] = None,
+    ) -> str:
+        self.responses.append(message)
+        return f"offline-{len(self.responses)}"
+
+
+class OfflineSlackHandler(SlackHandler):
+    """Slack handler whose responses are recorded instead of posted"""
+
+    def __init__(self, signing_secret: str):
+        super().__init__(signing_secret, bot_token="offline")
+        self.responses: List[str] = []
+
+    def send_response(
+        self,
+        payload: Dict[str, Any],
+        message: str,
+        response_type: ResponseType,
+        thread_id: Optional[str] = None,
+    ) -> str:
+        self.responses.append(message)
+        return f"offline-{len(self.responses)}"
+
+
+def make_redis(redis: str):
+    """Build the Redis client for ``--redis``: ``none``, ``fake`` or a URL"""
+    if redis == "none":
+        return None
+    if redis == "fake":
+        import fakeredis
+
+        return fakeredis.FakeRedis()
+    import redis as redis_lib
+
+    return redis_lib.Redis.from_url(redis)
+
+
+@contextmanager
+def offline_app(
+    database_url: Optional[str] = None, redis_client=None
+) -> Iterator[Tuple[Any, DeliverySigner, List[str]]]:
+    """Point the app at throwaway infrastructure for the duration of a replay
+
+    Yields:
+        The app, a signer using the configured webhook secrets and the list
+        that enqueued delivery IDs are recorded in
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(
+            database_url or f"sqlite:///{tmp}/replay.db",
+            connect_args={} if database_url else {"check_same_thread": False},
+        )
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        enqueued: List[str] = []
+
+        def replay_db():
+            db = session_factory()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        def replay_inbox(
+            db: Session = Depends(get_db),
+            coalescer: Optional[EventCoalescer] = Depends(get_event_coalescer),
+        ):
+            return WebhookInbox(
+                db,
+                enqueue=lambda delivery_id, **options: enqueued.append(delivery_id),
+                coalescer=coalescer,
+            )
+
+        deduplicator = None
+        coalescer = None
+        rate_limiter = None
+        if redis_client is not None:
+            if settings.WEBHOOK_RATE_LIMIT_ENABLED:
+                # Default limits only; per-connection overrides need the real DB
+                rate_limiter = TenantRateLimiter(
+                    redis_client,
+                    RateLimitResolver(
+                        get_rate_limit_resolver().default, loader=lambda default: {}
+                    ),
+                )
+            if settings.WEBHOOK_DEDUP_TTL_SECONDS:
+                deduplicator = DeliveryDeduplicator(
+                    redis_client, settings.WEBHOOK_DEDUP_TTL_SECONDS
+                )
+            if any(window > 0 for window in settings.WEBHOOK_COALESCE_WINDOWS.values()):
+                coalescer = EventCoalescer(
+                    redis_client, settings.WEBHOOK_COALESCE_WINDOWS
+                )
+
+        # Sign with whatever secrets the app itself verifies against; an
+        # unset secret would reject every delivery, so stand one in
+        installed = ServiceHandlerFactory._handlers
+        ServiceHandlerFactory.initialize()
+        configured = ServiceHandlerFactory._handlers
+        github_secret = (
+            configured[ServiceProvider.GITHUB].webhook_secret or REPLAY_SECRET
+        )
+        slack_secret = configured[ServiceProvider.SLACK].signing_secret or REPLAY_SECRET
+        ServiceHandlerFactory._handlers = {
+            ServiceProvider.GITHUB: OfflineGitHubHandler(github_secret),
+            ServiceProvider.SLACK: OfflineSlackHandler(slack_secret),
+        }
+
+        overrides = {
+            get_db: replay_db,
+            get_webhook_inbox: replay_inbox,
+            get_deduplicator: lambda: deduplicator,
+            get_event_coalescer: lambda: coalescer,
+            get_rate_limiter: lambda: rate_limiter,
+            # Ingest-only: no pipelines are running to cancel
+            get_cancellation_registry: lambda: None,
+            get_workspace_preparation: lambda: None,
+        }
+        previous = dict(app.dependency_overrides)
+        app.dependency_overrides.update(overrides)
+        try:
+            yield app, DeliverySigner(github_secret, slack_secret), enqueued
+        finally:
+            app.dependency_overrides.clear()
+            app.dependency_overrides.update(previous)
+            ServiceHandlerFactory._handlers = installed
+            engine.dispose()
+
+
+async def replay(
+    asgi_app,
+    signer: DeliverySigner,
+    entries: List[CorpusEntry],
+    requests: int,
+    concurrency: int,
+    duplicate_ratio: float = 0.0,
+    seed: Optional[int] = None,
+) -> ReplayReport:
+    """Post ``requests`` signed deliveries with ``concurrency`` in flight
+
+    ``duplicate_ratio`` of the requests re-send an earlier delivery ID, the
+    way providers retry when an acknowledgement is slow or lost.
+    """
+    rng = random.Random(seed)
+    weights = [entry.weight for entry in entries]
+    plan: List[Tuple[CorpusEntry, str]] = []
+    for _ in range(requests):
+        if plan and rng.random() < duplicate_ratio:
+            plan.append(rng.choice(plan))
+        else:
+            entry = rng.choices(entries, weights=weights)[0]
+            plan.append((entry, str(uuid.uuid4())))
+
+    report = ReplayReport(concurrency=concurrency)
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://replay"
+    ) as client:
+
+        async def worker():
+            while True:
+                try:
+                    entry, delivery_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                headers, body = signer.sign(entry, delivery_id)
+                started = time.perf_counter()
+                try:
+                    response = await client.post(
+                        f"/webhooks/{entry.provider.value}",
+                        content=body,
+                        headers=headers,
+                    )
+                except Exception:
+                    report.latencies.append(time.perf_counter() - started)
+                    report.statuses["exception"] += 1
+                    report.errors += 1
+                    continue
+                report.latencies.append(time.perf_counter() - started)
+                report.statuses[str(response.status_code)] += 1
+                if response.status_code == 429:
+                    # Shedding over-limit tenants is by design, not a failure
+                    report.outcomes["rate_limited"] += 1
+                elif response.status_code >= 400:
+                    report.errors += 1
+                    report.outcomes["error"] += 1
+                else:
+                    content = response.json()
+                    report.outcomes[content.get("status", "handshake")] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        report.duration = time.perf_counter() - started
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--duplicate-ratio",
+        type=float,
+        default=0.05,
+        help="Fraction of requests that re-send an earlier delivery ID",
+    )
+    parser.add_argument(
+        "--redis",
+        default="fake",
+        help="'none' to disable dedup/coalescing, 'fake' for fakeredis, or a URL",
+    )
+    parser.add_argument(
+        "--database-url", help="Database to persist deliveries in (default: temp SQLite)"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    entries = load_corpus(args.corpus)
+    with offline_app(args.database_url, make_redis(args.redis)) as (
+        asgi_app,
+        signer,
+        enqueued,
+    ):
+        report = asyncio.run(
+            replay(
+                asgi_app,
+                signer,
+                entries,
+                requests=args.requests,
+                concurrency=args.concurrency,
+                duplicate_ratio=args.duplicate_ratio,
+                seed=args.seed,
+            )
+        )
+        report.enqueued = len(enqueued)
+
+    print(json.dumps(report.summary(), indent=2) if args.json else report.format())
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,10 @@ from repopal.core.config import settings
 
 # TODO: missing / incorrect import
 from repopal.core.database import get_db
+from repopal.core.redis import get_redis
+from repopal.services.delivery_dedup import DeliveryDeduplicator
+from repopal.services.event_coalescer import EventCoalescer, get_event_coalescer
+from repopal.services.webhook_inbox import WebhookInbox
 
 oauth2_scheme = OAuth2AuthorizationCodeBearer(
     authorizationUrl="https://github.com/login/oauth/authorize",
@@ -37,3 +41,16 @@ async def get_current_user(
     # TODO: Here you would typically query your user from the database
     # For now returning the decoded payload
     return payload
+
+
+def get_webhook_inbox(
+    db: Session = Depends(get_db),
+    coalescer: Optional[EventCoalescer] = Depends(get_event_coalescer),
+) -> WebhookInbox:
+    return WebhookInbox(db, coalescer=coalescer)
+
+
+def get_deduplicator() -> Optional[DeliveryDeduplicator]:
+    if not settings.WEBHOOK_DEDUP_TTL_SECONDS:
+        return None
+    return DeliveryDeduplicator(get_redis(), settings.WEBHOOK_DEDUP_TTL_SECONDS)
@@ -1,36 +1,187 @@
-from typing import Optional
+import hmac
+import math
+from typing import Callable, Optional
 
-from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 
-from repopal.schemas.service_handler import ServiceProvider
+from repopal.api.deps import get_deduplicator, get_webhook_inbox
+from repopal.core.config import settings
+from repopal.core.metrics import metrics
+from repopal.schemas.service_handler import RouteKey, SenderType, ServiceProvider
+from repopal.services.cancellation import (
+    CancellationRegistry,
+    get_cancellation_registry,
+)
+from repopal.services.delivery_dedup import DeliveryDeduplicator
+from repopal.services.event_router import EventRouter, get_event_router
+from repopal.services.rate_limiter import (
+    Admission,
+    AdmissionAction,
+    TenantRateLimiter,
+    get_rate_limiter,
+)
 from repopal.services.service_handler_factory import ServiceHandlerFactory
+from repopal.services.service_handlers.base import ServiceHandler
+from repopal.services.webhook_inbox import WebhookInbox
+from repopal.services.workspace_speculation import get_workspace_preparation
 
 router = APIRouter()
 
 
+async def _read_signed_body(request: Request, mac: hmac.HMAC, max_bytes: int) -> bytes:
+    """Read the request body, feeding each chunk to the HMAC as it streams in"""
+    body = bytearray()
+    async for chunk in request.stream():
+        if len(body) + len(chunk) > max_bytes:
+            raise HTTPException(status_code=413, detail="Webhook payload too large")
+        mac.update(chunk)
+        body.extend(chunk)
+    return bytes(body)
+
+
+def _ignored(
+    handler: ServiceHandler, provider: ServiceProvider, route_key: RouteKey
+) -> JSONResponse:
+    metrics.increment(
+        "webhook_events_ignored_total",
+        provider=provider.value,
+        event_type=route_key.event_type,
+    )
+    return JSONResponse(
+        status_code=handler.ack_status_code, content={"status": "ignored"}
+    )
+
+
 @router.post("/webhooks/{provider}")
 async def webhook_handler(
     provider: ServiceProvider,
     request: Request,
-    # TODO: not sure if these should be here
-    x_hub_signature_256: Optional[str] = Header(None),
-    x_slack_signature: Optional[str] = Header(None),
+    inbox: WebhookInbox = Depends(get_webhook_inbox),
+    deduplicator: Optional[DeliveryDeduplicator] = Depends(get_deduplicator),
+    event_router: EventRouter = Depends(get_event_router),
+    rate_limiter: Optional[TenantRateLimiter] = Depends(get_rate_limiter),
+    cancellations: Optional[CancellationRegistry] = Depends(
+        get_cancellation_registry
+    ),
+    prepare_workspace: Optional[Callable[[str], None]] = Depends(
+        get_workspace_preparation
+    ),
 ):
-    # Get the raw payload
-    payload = await request.json()
-
-    # Get all headers for validation
-    headers = dict(request.headers)
-
     try:
         handler = ServiceHandlerFactory.get_handler(provider)
-    except ValueError as e:
+    except KeyError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    # Validate the webhook
-    if not handler.validate_webhook(headers, payload):
+    headers = request.headers
+
+    # Reject oversized and unsigned requests before reading the body
+    content_length = headers.get("content-length")
+    if content_length is not None:
+        try:
+            declared_length = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length")
+        if declared_length > settings.WEBHOOK_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Webhook payload too large")
+
+    mac = handler.start_signature(headers)
+    if mac is None:
         raise HTTPException(status_code=401, detail="Invalid webhook signature")
 
-    # Process the webhook and return standardized event
-    event = handler.process_webhook(payload)
-    return event
+    # HMAC the exact bytes on the wire, then decode them once
+    body = await _read_signed_body(request, mac, settings.WEBHOOK_MAX_BODY_BYTES)
+    if not handler.verify_signature(headers, mac):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+    try:
+        payload = handler.decode_payload(body, headers.get("content-type"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed webhook payload")
+
+    # Handshakes (e.g. Slack URL verification) are answered inline
+    immediate = handler.immediate_response(payload)
+    if immediate is not None:
+        return immediate
+
+    route_key = handler.route_key(headers, payload)
+    routed = event_router.match(route_key) is not None
+    # A closed issue or deleted message stops the runs it started, even
+    # though the event itself is not routed
+    withdrawn = handler.cancellation_subject(payload)
+    if route_key.sender_type == SenderType.SELF:
+        withdrawn = None
+
+    # Drop noise (pushes, label changes, our own comments) before doing any work
+    if not routed and not withdrawn:
+        return _ignored(handler, provider, route_key)
+
+    # Redeliveries and retries are acknowledged but never processed twice.
+    # Checked before cancelling too: a redelivered "closed" must not stop
+    # runs started after the issue was reopened
+    delivery_id = handler.delivery_id(headers, payload)
+    if deduplicator and await run_in_threadpool(
+        deduplicator.is_duplicate, provider, delivery_id
+    ):
+        return JSONResponse(
+            status_code=handler.ack_status_code, content={"status": "duplicate"}
+        )
+
+    if cancellations and withdrawn:
+        await run_in_threadpool(cancellations.cancel, provider, withdrawn, "withdrawn")
+    if not routed:
+        return _ignored(handler, provider, route_key)
+
+    # Keep one noisy installation or workspace from flooding the workers
+    admission = Admission(AdmissionAction.ADMIT)
+    if rate_limiter:
+        admission = await run_in_threadpool(
+            rate_limiter.admit, provider, handler.tenant_id(payload)
+        )
+    if admission.action == AdmissionAction.SHED:
+        if deduplicator:
+            await run_in_threadpool(deduplicator.forget, provider, delivery_id)
+        retry_after = max(1, math.ceil(admission.retry_after))
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(retry_after)},
+            content={"status": "rate_limited", "retry_after": retry_after},
+        )
+    deferred = admission.action == AdmissionAction.DEFER
+
+    # A newer request about the same subject preempts runs for older ones.
+    # Cancel first: once accepted, this delivery's own run may start at once
+    subject = handler.subject_key(payload)
+    if cancellations and subject and subject != withdrawn:
+        await run_in_threadpool(cancellations.cancel, provider, subject, "superseded")
+
+    # Persist and enqueue; the pipeline runs in the worker, off the ingest path
+    try:
+        delivery = await run_in_threadpool(
+            inbox.accept,
+            provider,
+            headers,
+            body,
+            delivery_id=delivery_id,
+            subject=subject,
+            defer_seconds=admission.retry_after if deferred else 0.0,
+        )
+    except Exception:
+        # Let the provider's retry through since nothing was persisted
+        if deduplicator:
+            await run_in_threadpool(deduplicator.forget, provider, delivery_id)
+        raise
+
+    # Fetch the repository and build the likely image while the delivery is
+    # queued and the pipeline asks the LLM which command to run
+    repo_url = handler.repository_url(payload)
+    if prepare_workspace and repo_url and not deferred:
+        await run_in_threadpool(prepare_workspace, repo_url)
+    return JSONResponse(
+        status_code=handler.ack_status_code,
+        content={
+            "status": "deferred" if deferred else "accepted",
+            "delivery_id": str(delivery.id),
+        },
+    )
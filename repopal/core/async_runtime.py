@@ -0,0 +1,129 @@
+"""A long-lived event loop per worker process for running async pipeline code"""
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class AsyncRuntime:
+    """Runs coroutines on one event loop that lives as long as the process
+
+    Celery tasks are synchronous, and ``asyncio.run`` per task creates and
+    closes a loop each time, which throws away everything bound to it: HTTP
+    connection pools, litellm's cached clients, the default thread pool.
+    Here the loop runs forever in a daemon thread and tasks submit work to
+    it, so those survive from one task to the next. It works the same in
+    Celery's prefork pool (one runtime per child) and thread pool (tasks
+    share the loop and run concurrently on it).
+    """
+
+    def __init__(self, name: str = "repopal-async-runtime"):
+        self.loop = asyncio.new_event_loop()
+        self._shared: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run_loop, name=name, daemon=True
+        )
+        self._thread.start()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive() and not self.loop.is_closed()
+
+    def run(self, coroutine: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Run a coroutine on the runtime's loop and wait for its result
+
+        Must not be called from the loop's own thread, which would deadlock.
+        On timeout the coroutine is cancelled and TimeoutError raised.
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("AsyncRuntime.run called from its own event loop")
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def shared(self, name: str, factory: Callable[[], T]) -> T:
+        """A client created once per runtime and reused by every task
+
+        Use it for anything that pools connections or is bound to the loop,
+        e.g. ``runtime.shared("llm", LLMService)``.
+        """
+        with self._lock:
+            if name not in self._shared:
+                self._shared[name] = factory()
+            return self._shared[name]
+
+    def close(self, timeout: float = 10) -> None:
+        """Cancel outstanding work, close shared clients and stop the loop"""
+        if not self.running:
+            return
+
+        async def shutdown() -> None:
+            for client in self._shared.values():
+                aclose = getattr(client, "aclose", None)
+                if aclose is not None:
+                    try:
+                        await aclose()
+                    except Exception as e:
+                        logging.getLogger(__name__).warning(
+                            f"Closing {client!r} failed: {e}"
+                        )
+            tasks = [
+                task
+                for task in asyncio.all_tasks()
+                if task is not asyncio.current_task()
+            ]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.loop.shutdown_asyncgens()
+            await self.loop.shutdown_default_executor()
+
+        try:
+            self.run(shutdown(), timeout=timeout)
+        finally:
+            self._shared.clear()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                self.loop.close()
+
+
+_runtime: Optional[AsyncRuntime] = None
+_runtime_pid: Optional[int] = None
+_runtime_lock = threading.Lock()
+
+
+def get_async_runtime() -> AsyncRuntime:
+    """This process's runtime, started on first use
+
+    A runtime inherited across ``fork`` has no loop thread in the child, so
+    each process starts its own.
+    """
+    global _runtime, _runtime_pid
+    with _runtime_lock:
+        if _runtime is None or _runtime_pid != os.getpid() or not _runtime.running:
+            _runtime = AsyncRuntime()
+            _runtime_pid = os.getpid()
+        return _runtime
+
+
+def shutdown_async_runtime() -> None:
+    """Stop this process's runtime, if it started one"""
+    global _runtime, _runtime_pid
+    with _runtime_lock:
+        runtime, pid = _runtime, _runtime_pid
+        _runtime = _runtime_pid = None
+    if runtime is not None and pid == os.getpid():
+        runtime.close()
@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Dict, Optional
 
 from pydantic_settings import BaseSettings
 
@@ -8,15 +9,97 @@ class Settings(BaseSettings):
     SLACK_SIGNING_SECRET: str = ''
     SLACK_BOT_TOKEN: str = ''
     SLACK_APP_ID: str = ''
+    SLACK_BOT_ID: str = ''  # bot_id on messages we post
+    SLACK_BOT_USER_ID: str = ''  # user ID used in <@...> mentions
+    GITHUB_TOKEN: Optional[str] = None
+    GITHUB_APP_SLUG: str = "repopal"  # Comments by <slug>[bot] are our own
     PROJECT_NAME: str = "FastAPI Project"
     DATABASE_URL: str = "sqlite:///./test.db"  # Default for testing
     REDIS_URL: str = "redis://localhost:6379"  # Default for testing
+    REDIS_SOCKET_TIMEOUT_SECONDS: float = 0.5  # Keep ingest fast when Redis is unhealthy
     TESTING: bool = False
 
+    # Webhook ingest
+    WEBHOOK_MAX_BODY_BYTES: int = 25 * 1024 * 1024  # GitHub caps deliveries at 25MB
+    WEBHOOK_INBOX_STALE_SECONDS: int = 300  # Requeue deliveries not picked up by then
+    WEBHOOK_INBOX_SWEEP_SECONDS: int = 60
+    WEBHOOK_INBOX_PROCESSING_TIMEOUT_SECONDS: int = 900  # A claim older than this lost its worker
+    WEBHOOK_DEDUP_TTL_SECONDS: int = 3 * 24 * 3600  # 0 disables deduplication
+    # Seconds to wait for follow-up events on the same issue/PR/thread, per provider
+    WEBHOOK_COALESCE_WINDOWS: Dict[str, float] = {"github": 10.0, "slack": 0.0}
+    # Default per-installation/workspace intake; override per ServiceConnection
+    # with settings["rate_limit"] = {"per_minute", "burst", "max_deferred"}
+    WEBHOOK_RATE_LIMIT_ENABLED: bool = True
+    WEBHOOK_RATE_LIMIT_PER_MINUTE: float = 60  # 0 leaves tenants unlimited by default
+    WEBHOOK_RATE_LIMIT_BURST: int = 20
+    WEBHOOK_RATE_LIMIT_MAX_DEFERRED: int = 100  # Over-limit events queued before shedding
+    WEBHOOK_RATE_LIMIT_SETTINGS_TTL_SECONDS: float = 60
+    WEBHOOK_DEFERRED_PRIORITY: int = 9  # Celery priority for deferred events (0 is highest)
+
+    # Pipeline
+    PIPELINE_MAX_ATTEMPTS: int = 3  # Including the first; only transient errors retry
+    PIPELINE_RETRY_BACKOFF_SECONDS: int = 30  # Doubled on each further retry
+    PIPELINE_STALE_SECONDS: int = 3600  # A RUNNING run older than this lost its worker
+    # Wall-clock budget for a stage that does not declare its own; the
+    # execute stage's comes from the command's ResourceBudget
+    PIPELINE_STAGE_TIMEOUT_SECONDS: float = 600
+    PIPELINE_BUILD_TIMEOUT_SECONDS: float = 1800  # Image builds install packages
+    # Each cost class has its own queue, so quick questions never wait behind
+    # multi-minute PR jobs; run a worker per queue with its own concurrency
+    PIPELINE_INTERACTIVE_QUEUE: str = "pipeline.interactive"
+    PIPELINE_CHANGE_QUEUE: str = "pipeline.change"
+    # Pipelines for the same repository run one at a time, in order
+    REPO_LEASE_ENABLED: bool = True
+    REPO_LEASE_TTL_SECONDS: float = 600  # Renewed while the pipeline runs
+    REPO_LEASE_RETRY_SECONDS: float = 15  # How soon a job for a busy repository re-polls
+    # Closing an issue, deleting a Slack message or a newer request about the
+    # same subject cancels its running pipeline
+    PIPELINE_CANCELLATION_ENABLED: bool = True
+    PIPELINE_CANCEL_POLL_SECONDS: float = 5  # How often a running pipeline checks
+    # On accepting a GitHub event, fetch its repository into a local mirror
+    # and build the likely command's image while the pipeline is queued and
+    # selecting its command. Run a worker for the prepare queue on each host
+    # that runs change pipelines: mirrors are local to the host.
+    SPECULATIVE_PREPARE_ENABLED: bool = True
+    SPECULATIVE_PREPARE_QUEUE: str = "pipeline.prepare"
+    SPECULATIVE_PREPARE_EXPIRES_SECONDS: float = 120  # Dropped unrun after this
+    SPECULATIVE_DEFAULT_COMMAND: str = "aider"  # For repositories with no history
+    WORKSPACE_MIRROR_DIR: str = "./data/mirrors"
+
+    # Status messages are templates, sent at once; with this on the LLM
+    # rewrites each in the background and edits it in place
+    STATUS_MESSAGE_ENRICHMENT_ENABLED: bool = False
+
+    # Claim-check storage of large task payloads
+    CLAIM_CHECK_BACKEND: str = "database"  # "database" or "file"
+    CLAIM_CHECK_DIR: str = "./data/blobs"  # Used by the file backend; share between workers
+    CLAIM_CHECK_INLINE_MAX_BYTES: int = 1024  # Smaller payloads travel in the message
+    CLAIM_CHECK_TTL_SECONDS: int = 7 * 24 * 3600
+
     # LLM Settings
     LLM_MODEL: str = "claude-3-haiku-20240307"  # Default model
     LLM_API_KEY: str = ""     # API key for the model provider
     LLM_PROVIDER: str = "anthropic"  # Provider (openai, azure, anthropic, etc)
+    # Changes too large for one summary prompt are summarized in chunks,
+    # concurrently, and the chunk summaries combined
+    SUMMARY_PROMPT_MAX_TOKENS: int = 8000
+    SUMMARY_CHUNK_TOKENS: int = 4000
+    SUMMARY_CONCURRENCY: int = 4  # Chunk summaries in flight per job
+    SUMMARY_TOKEN_BUDGET: int = 60000  # Prompt tokens one job's summary may use
+    # This process's share of the provider's limits, per model; 0 is unlimited
+    LLM_GATEWAY_MAX_CONCURRENCY: int = 8  # Requests in flight
+    LLM_GATEWAY_REQUESTS_PER_MINUTE: float = 0
+    LLM_GATEWAY_TOKENS_PER_MINUTE: float = 0
+    LLM_GATEWAY_MAX_RETRIES: int = 3  # Retries of 429s, 5xx and connection errors
+    LLM_GATEWAY_BACKOFF_SECONDS: float = 1  # Doubled per retry, jittered
+    LLM_GATEWAY_MAX_BACKOFF_SECONDS: float = 60
+    # Stream completions, returning the answer as soon as it closes
+    LLM_STREAMING_ENABLED: bool = True
+    # Identical command selection and argument requests reuse earlier answers
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_REDIS_ENABLED: bool = True  # Share answers between workers
+    LLM_CACHE_TTL_SECONDS: int = 24 * 3600
+    LLM_CACHE_MEMORY_ENTRIES: int = 1024  # Per process
 
     model_config = {
         "env_file": ".env"
@@ -18,6 +18,36 @@ class PipelineStateError(PipelineError):
     """Raised when an invalid pipeline state transition is attempted"""
     pass
 
+class PipelineCancelledError(PipelineError):
+    """Raised inside a pipeline when its run has been cancelled"""
+    pass
+
+class StageTimeoutError(PipelineError):
+    """Raised when a pipeline stage exceeds its wall-clock budget"""
+    def __init__(self, stage: str, timeout: float):
+        self.stage = stage
+        self.timeout = timeout
+        super().__init__(f"Stage {stage} timed out after {timeout:g}s")
+
+class CommandFailedError(PipelineError):
+    """Raised when a pipeline's command runs but does not succeed"""
+    def __init__(self, command: str, message: str):
+        self.command = command
+        super().__init__(f"Command {command} failed: {message}")
+
+class RepositoryBusyError(PipelineError):
+    """Raised when another pipeline holds the repository's lease"""
+    def __init__(self, repository: str):
+        self.repository = repository
+        super().__init__(f"Repository busy: {repository}")
+
+class CommandTimeoutError(CoreError):
+    """Raised when a command is killed for exceeding its wall-clock budget"""
+    def __init__(self, command: str, timeout: float):
+        self.command = command
+        self.timeout = timeout
+        super().__init__(f"Command timed out after {timeout:g}s: {command}")
+
 class ServiceConnectionError(CoreError):
     """Raised when there are issues with service connections"""
     pass
@@ -0,0 +1,88 @@
+"""In-process metrics registry
+
+Counters, gauges and timing samples keyed by name and labels. Each process
+keeps its own registry; the snapshot is exposed on ``/metrics`` and is meant
+to be scraped per process, the same way Prometheus client libraries work.
+"""
+
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Tuple
+
+# Number of recent samples kept per timing series for percentile estimates
+TIMING_WINDOW = 2048
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> MetricKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format(key: MetricKey) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class MetricsRegistry:
+    """Thread-safe store of counters, gauges and timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[MetricKey, float] = defaultdict(float)
+        self._gauges: Dict[MetricKey, float] = {}
+        self._timings: Dict[MetricKey, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=TIMING_WINDOW)
+        )
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record a timing sample (in seconds)"""
+        with self._lock:
+            self._timings[_key(name, labels)].append(value)
+
+    def counter(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return all metrics, with timing series summarised as percentiles"""
+        with self._lock:
+            counters = {_format(k): v for k, v in self._counters.items()}
+            gauges = {_format(k): v for k, v in self._gauges.items()}
+            samples = {_format(k): sorted(v) for k, v in self._timings.items() if v}
+
+        timings = {
+            name: {
+                "count": len(ordered),
+                "p50": _percentile(ordered, 0.50),
+                "p95": _percentile(ordered, 0.95),
+                "p99": _percentile(ordered, 0.99),
+                "max": ordered[-1],
+            }
+            for name, ordered in samples.items()
+        }
+        return {"counters": counters, "gauges": gauges, "timings": timings}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,22 @@
+from functools import lru_cache
+
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from repopal.core.config import settings
+
+
+@lru_cache
+def get_redis() -> redis.Redis:
+    """Shared Redis client; the underlying connection pool is thread-safe
+
+    Retries are disabled so an unhealthy Redis costs ingest one short timeout
+    rather than several backoff rounds; callers decide how to fail.
+    """
+    return redis.Redis.from_url(
+        settings.REDIS_URL,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        retry=Retry(NoBackoff(), 0),
+    )
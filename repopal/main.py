@@ -4,6 +4,7 @@ from repopal.api.routes import router as api_router
 from repopal.api.auth import router as auth_router
 from repopal.api.webhook_routes import router as webhook_router
 from repopal.core.config import settings
+from repopal.core.metrics import metrics
 
 app = FastAPI(title=settings.PROJECT_NAME)
 
@@ -15,3 +16,8 @@ app.include_router(webhook_router)
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+
+@app.get("/metrics")
+async def metrics_snapshot():
+    return metrics.snapshot()
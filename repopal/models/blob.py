@@ -0,0 +1,23 @@
+"""Content-addressed blob model for claim-checked task payloads"""
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, String
+
+from repopal.core.database import Base
+
+
+class Blob(Base):
+    """A payload stored once under the SHA-256 digest of its bytes"""
+
+    __tablename__ = "blobs"
+
+    digest = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    # Refreshed whenever the same bytes are stored again, so pruning by age
+    # never drops a payload a recent task still references
+    stored_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<Blob {self.digest[:12]} {self.size} bytes>"
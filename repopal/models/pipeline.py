@@ -0,0 +1,160 @@
+"""Pipeline run models"""
+
+import uuid
+from datetime import datetime
+from enum import Enum
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    text,
+)
+from sqlalchemy import Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
+from sqlalchemy.types import JSON
+
+from repopal.core.database import Base
+from repopal.schemas.service_handler import ServiceProvider
+
+
+class PipelineStatus(str, Enum):
+    """Lifecycle of a pipeline run"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    RETRYING = "retrying"  # Failed at a stage; the next attempt resumes there
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"  # Its issue was closed, message deleted, or superseded
+
+
+# Runs that are not finished yet. Partial indexes cover only these rows, so
+# they stay small however many finished runs accumulate. Queries must use
+# the same literal condition (SQLEnum stores member names): a planner cannot
+# match a partial index against bound parameters.
+ACTIVE_RUN = text("status IN ('PENDING', 'RUNNING', 'RETRYING')")
+
+
+class StageStatus(str, Enum):
+    """Outcome of one stage in one attempt"""
+
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"  # Abandoned mid-run when the pipeline was cancelled
+    TIMED_OUT = "timed_out"  # Exceeded its wall-clock budget
+
+
+RUNNING_STAGE = text("status = 'RUNNING'")
+
+
+class PipelineRun(Base):
+    """One execution of the event pipeline, with a checkpoint per finished stage
+
+    ``checkpoints`` maps stage names to claim-check envelopes of their
+    outputs, so a retried run resumes at the first stage without one.
+    ``stage_timings`` holds the latest attempt's stage start and end offsets
+    in seconds, and ``critical_path`` the chain of stages that bounded it.
+    Every attempt at every stage is kept in ``stages``.
+    """
+
+    __tablename__ = "pipeline_runs"
+    __table_args__ = (
+        # Unfinished runs on a repository, oldest first
+        Index(
+            "ix_pipeline_runs_active_repository",
+            "repository",
+            "created_at",
+            postgresql_where=ACTIVE_RUN,
+            sqlite_where=ACTIVE_RUN,
+        ),
+        # An organization's runs over a time range
+        Index("ix_pipeline_runs_organization_created", "organization", "created_at"),
+        # Unfinished runs that have not made progress for a while
+        Index(
+            "ix_pipeline_runs_active_updated",
+            "updated_at",
+            postgresql_where=ACTIVE_RUN,
+            sqlite_where=ACTIVE_RUN,
+        ),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Webhook inbox delivery the run was started for
+    delivery_id = Column(UUID(as_uuid=True), nullable=True, index=True)
+    provider = Column(SQLEnum(ServiceProvider), nullable=False)
+    event_type = Column(String, nullable=True)
+    job_class = Column(String, nullable=True)  # JobClass; picks the Celery queue
+    organization = Column(String, nullable=True)  # Repository owner or Slack team
+    repository = Column(String, nullable=True)  # e.g. org/repo; runs on it take turns
+    subject = Column(String, nullable=True)  # e.g. org/repo#42; for cancellation
+    event = Column(JSON, nullable=False)  # Claim-check envelope of the event
+    status = Column(
+        SQLEnum(PipelineStatus), nullable=False, default=PipelineStatus.PENDING
+    )
+    current_stage = Column(String, nullable=True)
+    checkpoints = Column(JSON, nullable=False, default=dict)
+    attempts = Column(Integer, nullable=False, default=0)
+    stage_timings = Column(JSON, nullable=True)
+    critical_path = Column(JSON, nullable=True)
+    command = Column(String, nullable=True)  # The command selected for the event
+    pull_request_url = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)  # First attempt
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)  # started_at to finished_at
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    stages = relationship(
+        "PipelineStageRun",
+        back_populates="run",
+        order_by="PipelineStageRun.id",
+        cascade="all, delete-orphan",
+    )
+
+    def __repr__(self):
+        return f"<PipelineRun {self.id} {self.status} at {self.current_stage}>"
+
+
+class PipelineStageRun(Base):
+    """One attempt at one stage of a pipeline run"""
+
+    __tablename__ = "pipeline_stage_runs"
+    __table_args__ = (
+        # Durations of a stage over a time range, to find slow stages
+        Index("ix_pipeline_stage_runs_stage_started", "stage", "started_at"),
+        # Stages still running, to find stuck ones
+        Index(
+            "ix_pipeline_stage_runs_running_started",
+            "started_at",
+            postgresql_where=RUNNING_STAGE,
+            sqlite_where=RUNNING_STAGE,
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("pipeline_runs.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    stage = Column(String, nullable=False)
+    attempt = Column(Integer, nullable=False)
+    status = Column(SQLEnum(StageStatus), nullable=False, default=StageStatus.RUNNING)
+    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    error = Column(String, nullable=True)
+
+    run = relationship("PipelineRun", back_populates="stages")
+
+    def __repr__(self):
+        return f"<PipelineStageRun {self.run_id} {self.stage} #{self.attempt} {self.status}>"
@@ -0,0 +1,52 @@
+"""Webhook inbox model"""
+
+import uuid
+from datetime import datetime
+from enum import Enum
+
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, String
+from sqlalchemy import Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.types import JSON
+
+from repopal.core.database import Base
+from repopal.schemas.service_handler import ServiceProvider
+
+
+class DeliveryStatus(str, Enum):
+    """Processing state of a webhook delivery"""
+
+    RECEIVED = "received"
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    SUPERSEDED = "superseded"  # Replaced by a later event about the same subject
+
+
+class WebhookDelivery(Base):
+    """A verified webhook delivery, persisted before it is handed to the worker"""
+
+    __tablename__ = "webhook_deliveries"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    provider = Column(SQLEnum(ServiceProvider), nullable=False)
+    delivery_id = Column(String, nullable=True)  # e.g. X-GitHub-Delivery
+    subject = Column(String, nullable=True)  # e.g. "org/repo#42"
+    content_type = Column(String, nullable=True)
+    headers = Column(JSON, default=dict)
+    body = Column(LargeBinary, nullable=False)
+    status = Column(
+        SQLEnum(DeliveryStatus), nullable=False, default=DeliveryStatus.RECEIVED, index=True
+    )
+    attempts = Column(Integer, nullable=False, default=0)
+    # When the delivery may first be processed, and the queue priority to
+    # use, if it was deferred (coalescing window or tenant rate limit)
+    not_before = Column(DateTime, nullable=True)
+    priority = Column(Integer, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<WebhookDelivery {self.provider} {self.id} {self.status}>"
@@ -0,0 +1,121 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from repopal.models.pipeline import (
+    ACTIVE_RUN,
+    RUNNING_STAGE,
+    PipelineRun,
+    PipelineStageRun,
+)
+from repopal.repositories.base import BaseRepository
+
+
+class PipelineRunRepository(BaseRepository[PipelineRun]):
+    """Repository for managing pipeline runs
+
+    The queries below are each served by one of the indexes declared on the
+    models; keep their filters in step with the index definitions.
+    """
+
+    def __init__(self):
+        super().__init__(PipelineRun)
+
+    def add(self, db: Session, run: PipelineRun) -> PipelineRun:
+        """Persist a new run"""
+        db.add(run)
+        db.commit()
+        return run
+
+    def get_by_delivery(self, db: Session, delivery_id: UUID) -> Optional[PipelineRun]:
+        """Get the run started for a webhook delivery"""
+        return (
+            db.query(self.model).filter(PipelineRun.delivery_id == delivery_id).first()
+        )
+
+    def get_active_by_repository(
+        self, db: Session, repository: str
+    ) -> List[PipelineRun]:
+        """Unfinished runs on a repository, oldest first"""
+        return (
+            db.query(self.model)
+            .filter(
+                PipelineRun.repository == repository,
+                ACTIVE_RUN,
+            )
+            .order_by(PipelineRun.created_at)
+            .all()
+        )
+
+    def get_by_organization(
+        self,
+        db: Session,
+        organization: str,
+        since: datetime,
+        until: Optional[datetime] = None,
+        limit: int = 100,
+    ) -> List[PipelineRun]:
+        """An organization's runs created in [since, until), newest first
+
+        To page through a long range, pass the oldest ``created_at`` returned
+        as the next ``until``.
+        """
+        query = db.query(self.model).filter(
+            PipelineRun.organization == organization,
+            PipelineRun.created_at >= since,
+        )
+        if until is not None:
+            query = query.filter(PipelineRun.created_at < until)
+        return query.order_by(PipelineRun.created_at.desc()).limit(limit).all()
+
+    def get_stuck(
+        self, db: Session, idle_since: datetime, limit: int = 100
+    ) -> List[PipelineRun]:
+        """Unfinished runs that have not been updated since ``idle_since``"""
+        return (
+            db.query(self.model)
+            .filter(
+                ACTIVE_RUN,
+                PipelineRun.updated_at < idle_since,
+            )
+            .order_by(PipelineRun.updated_at)
+            .limit(limit)
+            .all()
+        )
+
+    def get_running_stages(
+        self, db: Session, started_before: datetime, limit: int = 100
+    ) -> List[PipelineStageRun]:
+        """Stage attempts still running that started before ``started_before``"""
+        return (
+            db.query(PipelineStageRun)
+            .filter(
+                RUNNING_STAGE,
+                PipelineStageRun.started_at < started_before,
+            )
+            .order_by(PipelineStageRun.started_at)
+            .limit(limit)
+            .all()
+        )
+
+    def get_stage_durations(
+        self, db: Session, stage: str, since: datetime
+    ) -> Dict[str, Any]:
+        """Count, mean and max duration of a stage's finished attempts since a time"""
+        count, mean, longest = (
+            db.query(
+                func.count(PipelineStageRun.id),
+                func.avg(PipelineStageRun.duration_seconds),
+                func.max(PipelineStageRun.duration_seconds),
+            )
+            .filter(
+                PipelineStageRun.stage == stage,
+                PipelineStageRun.started_at >= since,
+                PipelineStageRun.duration_seconds.isnot(None),
+            )
+            .one()
+        )
+        return {"stage": stage, "count": count, "mean": mean, "max": longest}
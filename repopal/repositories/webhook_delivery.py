@@ -0,0 +1,48 @@
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from repopal.models.webhook_delivery import DeliveryStatus, WebhookDelivery
+from repopal.repositories.base import BaseRepository
+
+
+class WebhookDeliveryRepository(BaseRepository[WebhookDelivery]):
+    """Repository for managing webhook inbox deliveries"""
+
+    def __init__(self):
+        super().__init__(WebhookDelivery)
+
+    def add(self, db: Session, delivery: WebhookDelivery) -> WebhookDelivery:
+        """Persist a new delivery"""
+        db.add(delivery)
+        db.commit()
+        return delivery
+
+    def get_stale(
+        self,
+        db: Session,
+        statuses: List[DeliveryStatus],
+        updated_before: datetime,
+        now: datetime,
+        limit: int = 100,
+    ) -> List[WebhookDelivery]:
+        """Get deliveries stuck in one of the given states since before a cutoff
+
+        Deliveries deferred until after ``now`` are not stuck yet.
+        """
+        return (
+            db.query(self.model)
+            .filter(
+                WebhookDelivery.status.in_(statuses),
+                WebhookDelivery.updated_at < updated_before,
+                or_(
+                    WebhookDelivery.not_before.is_(None),
+                    WebhookDelivery.not_before <= now,
+                ),
+            )
+            .order_by(WebhookDelivery.created_at)
+            .limit(limit)
+            .all()
+        )
@@ -9,6 +9,12 @@ class CommandMetadata(BaseModel):
     description: str
     documentation: str
 
+class ResourceBudget(BaseModel):
+    """Limits on one run of a command, enforced wherever it runs"""
+    wall_clock_seconds: float = 600  # Killed by the watchdog after this long
+    cpu_seconds: Optional[int] = None  # CPU time before the kernel kills it
+    cpus: Optional[float] = None  # Share of the host's CPUs for its container
+
 class CommandArgs(BaseModel):
     """Base class for command arguments"""
     pass
@@ -22,3 +28,4 @@ class CommandResult(BaseModel):
     error: Optional[str] = None
     changes: Optional[RepositoryChanges] = None
     data: Optional[Dict[str, Any]] = None
+    timed_out: bool = False  # Killed for exceeding its wall-clock budget
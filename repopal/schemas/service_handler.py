@@ -1,7 +1,9 @@
+import json
+from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
 
-from pydantic import BaseModel, ConfigDict
+from repopal.utils.payloads import decode_body
 
 
 class ServiceProvider(str, Enum):
@@ -10,12 +12,137 @@ class ServiceProvider(str, Enum):
     LINEAR = "linear"
 
 
-class StandardizedEvent(BaseModel):
-    model_config = ConfigDict(arbitrary_types_allowed=True)
+class SenderType(str, Enum):
+    USER = "user"
+    BOT = "bot"
+    SELF = "self"  # Our own app, e.g. comments RepoPal posted
+
+
+@dataclass(frozen=True)
+class RouteKey:
+    """The cheap-to-extract facts about a delivery that decide whether to handle it"""
 
     provider: ServiceProvider
-    event_type: str  # e.g. "pull_request", "issue", "push"
-    action: str | None = None  # e.g. "opened", "closed", "updated"
-    user_request: str  # Human readable description of the event
-    payload: Dict[str, Any]  # Standardized payload with common fields
-    raw_payload: Dict[str, Any]  # Original provider-specific payload
+    event_type: str
+    action: str | None
+    sender_type: SenderType
+    mentions_bot: bool
+
+
+class StandardizedEvent:
+    """A provider event reduced to the fields the pipeline uses
+
+    The original delivery is kept as the raw body bytes and only decoded
+    into ``raw_payload`` when something actually needs provider-specific
+    fields (e.g. ``send_response``). The serialized form (``to_dict``) holds
+    only the standardized fields; the body travels separately, by reference
+    (the claim check stores it under its digest), and is fetched through
+    ``raw_body_loader`` the first time it is needed.
+    """
+
+    __slots__ = (
+        "provider",
+        "event_type",
+        "action",
+        "user_request",
+        "payload",
+        "content_type",
+        "_raw_body",
+        "_raw_payload",
+        "_load_raw_body",
+    )
+
+    def __init__(
+        self,
+        provider: ServiceProvider | str,
+        event_type: str,  # e.g. "pull_request", "issue", "push"
+        user_request: str,  # Human readable description of the event
+        payload: Dict[str, Any],  # Standardized payload with common fields
+        action: str | None = None,  # e.g. "opened", "closed", "updated"
+        raw_body: Optional[bytes] = None,  # Original delivery body
+        content_type: Optional[str] = None,
+        raw_payload: Optional[Dict[str, Any]] = None,  # Already-decoded raw_body
+        raw_body_loader: Optional[Callable[[], bytes]] = None,  # Fetches raw_body
+    ):
+        if raw_body is None and raw_payload is None and raw_body_loader is None:
+            raise ValueError("StandardizedEvent needs raw_body or raw_payload")
+        self.provider = ServiceProvider(provider)
+        self.event_type = event_type
+        self.action = action
+        self.user_request = user_request
+        self.payload = payload
+        self.content_type = content_type
+        self._raw_body = bytes(raw_body) if raw_body is not None else None
+        self._raw_payload = raw_payload
+        self._load_raw_body = raw_body_loader
+
+    @property
+    def raw_body(self) -> bytes:
+        """The original delivery body (encoded from raw_payload if built from a dict)"""
+        if self._raw_body is None:
+            if self._load_raw_body is not None:
+                self._raw_body = bytes(self._load_raw_body())
+                self._load_raw_body = None
+            else:
+                self._raw_body = json.dumps(self._raw_payload).encode()
+                self.content_type = "application/json"
+        return self._raw_body
+
+    @property
+    def raw_payload(self) -> Dict[str, Any]:
+        """Original provider-specific payload, decoded on first access"""
+        if self._raw_payload is None:
+            self._raw_payload = decode_body(self.raw_body, self.content_type)
+        return self._raw_payload
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the standardized fields to a JSON-safe dict
+
+        The body is not included; pass it by reference alongside, and give
+        it back to ``from_dict``.
+        """
+        return {
+            "provider": self.provider.value,
+            "event_type": self.event_type,
+            "action": self.action,
+            "user_request": self.user_request,
+            "payload": self.payload,
+            "content_type": self.content_type,
+        }
+
+    @classmethod
+    def from_dict(
+        cls,
+        data: Dict[str, Any],
+        raw_body: Optional[bytes] = None,
+        raw_body_loader: Optional[Callable[[], bytes]] = None,
+    ) -> "StandardizedEvent":
+        """Rebuild an event serialized with ``to_dict``; the body stays undecoded"""
+        return cls(
+            provider=data["provider"],
+            event_type=data["event_type"],
+            action=data.get("action"),
+            user_request=data["user_request"],
+            payload=data["payload"],
+            raw_body=raw_body,
+            content_type=data.get("content_type"),
+            raw_body_loader=raw_body_loader,
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, StandardizedEvent):
+            return NotImplemented
+        return (
+            self.provider == other.provider
+            and self.event_type == other.event_type
+            and self.action == other.action
+            and self.user_request == other.user_request
+            and self.payload == other.payload
+            and self.raw_payload == other.raw_payload
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"<StandardizedEvent {self.provider.value} {self.event_type} "
+            f"action={self.action}>"
+        )
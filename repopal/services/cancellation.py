@@ -0,0 +1,76 @@
+"""Cancellation of pipeline runs when the event they were started for goes away"""
+
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import redis
+
+from repopal.core.config import settings
+from repopal.core.metrics import metrics
+from repopal.core.redis import get_redis
+from repopal.schemas.service_handler import ServiceProvider
+
+
+class CancellationRegistry:
+    """Cancellation notices keyed by subject (an issue, PR or Slack thread)
+
+    Ingest records when a subject's runs were cancelled: its issue was
+    closed, its Slack message deleted, or a newer request about it arrived.
+    A run is cancelled if it was created before the latest notice for its
+    subject, so a run started for the superseding request is unaffected.
+    Running pipelines poll for notices, kill their container and stop
+    without starting another stage.
+    """
+
+    KEY_PREFIX = "repopal:cancel"
+
+    def __init__(self, redis_client: redis.Redis, ttl_seconds: int = 86400):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.logger = logging.getLogger(__name__)
+
+    def _key(self, provider: ServiceProvider, subject: str) -> str:
+        return f"{self.KEY_PREFIX}:{provider.value}:{subject}"
+
+    def cancel(
+        self, provider: ServiceProvider, subject: str, reason: str = "cancelled"
+    ) -> None:
+        """Cancel every run for the subject created up to now"""
+        try:
+            self.redis.set(
+                self._key(provider, subject), time.time(), ex=self.ttl_seconds
+            )
+        except redis.RedisError as e:
+            self.logger.warning(f"Could not cancel runs for {subject}: {e}")
+            return
+        metrics.increment(
+            "pipeline_cancellations_requested_total",
+            provider=provider.value,
+            reason=reason,
+        )
+
+    def is_cancelled(
+        self, provider: ServiceProvider, subject: Optional[str], created_at: datetime
+    ) -> bool:
+        """Whether a run for the subject, created at ``created_at`` (UTC), is cancelled"""
+        if not subject:
+            return False
+        try:
+            cancelled_at = self.redis.get(self._key(provider, subject))
+        except redis.RedisError as e:
+            # Fail open: the run finishes as though nothing was cancelled
+            self.logger.warning(f"Cancellations unavailable: {e}")
+            return False
+        if cancelled_at is None:
+            return False
+        created = created_at.replace(tzinfo=timezone.utc).timestamp()
+        return created <= float(cancelled_at)
+
+
+def get_cancellation_registry() -> Optional[CancellationRegistry]:
+    """The cancellation registry, or None if runs cannot be cancelled"""
+    if not settings.PIPELINE_CANCELLATION_ENABLED:
+        return None
+    return CancellationRegistry(get_redis())
@@ -0,0 +1,230 @@
+"""Change summaries that stay within a token budget however large the change
+
+The one-prompt summary sends every diff and every new file's content to
+the model at once. A large find/replace or a generated file pushes that
+past the context window, and well before then makes the call slow and
+expensive. ``ChangeSummarizer`` keeps the one prompt for change sets that
+fit, and otherwise maps and reduces: the changes are packed into chunks
+(small files together, large files split on line boundaries), the chunks
+are summarized concurrently, and the partial summaries are combined.
+
+Every prompt is charged against a per-job budget of prompt tokens, part of
+which is held back for the combining prompt. Chunks that do not fit in
+what is left are not sent; their files are named in the summary instead.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from repopal.core.config import settings
+from repopal.core.metrics import metrics
+from repopal.schemas.changes import RepositoryChanges
+from repopal.services.llm import LLMService
+
+# The instructions around the changes in each prompt
+PROMPT_OVERHEAD_TOKENS = 200
+# What a partial summary is assumed to cost in the combining prompt
+PARTIAL_SUMMARY_TOKENS = 150
+
+
+class TokenBudget:
+    """Prompt tokens a job may still spend"""
+
+    def __init__(self, tokens: int):
+        self.remaining = tokens
+
+    def charge(self, tokens: int) -> bool:
+        """Spend ``tokens`` if they are left; returns whether they were"""
+        if tokens > self.remaining:
+            return False
+        self.remaining -= tokens
+        return True
+
+
+@dataclass
+class Chunk:
+    """Changes summarized in one prompt: whole small files or part of a large one"""
+
+    sections: List[str] = field(default_factory=list)
+    paths: List[str] = field(default_factory=list)
+    tokens: int = 0
+
+    def add(self, path: str, section: str, tokens: int) -> None:
+        self.sections.append(section)
+        if path not in self.paths:
+            self.paths.append(path)
+        self.tokens += tokens
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(self.sections)
+
+
+def split_lines(text: str, max_chars: int) -> List[str]:
+    """Split text into pieces of at most ``max_chars``, on line boundaries
+    where lines allow"""
+    pieces: List[str] = []
+    current: List[str] = []
+    size = 0
+    for line in text.splitlines(keepends=True):
+        if current and size + len(line) > max_chars:
+            pieces.append("".join(current))
+            current, size = [], 0
+        # A line longer than a piece (minified or generated files) is cut
+        while len(line) > max_chars:
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if line:
+            current.append(line)
+            size += len(line)
+    if current:
+        pieces.append("".join(current))
+    return pieces
+
+
+class ChangeSummarizer:
+    """Summarizes a command's changes in one prompt, or map-reduce if they are large"""
+
+    def __init__(
+        self,
+        llm: LLMService,
+        prompt_max_tokens: int = 8000,
+        chunk_tokens: int = 4000,
+        concurrency: int = 4,
+        budget_tokens: int = 60000,
+        output_max_tokens: int = 1000,
+    ):
+        self.llm = llm
+        self.prompt_max_tokens = prompt_max_tokens
+        self.chunk_tokens = chunk_tokens
+        self.concurrency = concurrency
+        self.budget_tokens = budget_tokens
+        self.output_max_tokens = output_max_tokens
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def default(cls, llm: LLMService) -> "ChangeSummarizer":
+        return cls(
+            llm,
+            prompt_max_tokens=settings.SUMMARY_PROMPT_MAX_TOKENS,
+            chunk_tokens=settings.SUMMARY_CHUNK_TOKENS,
+            concurrency=settings.SUMMARY_CONCURRENCY,
+            budget_tokens=settings.SUMMARY_TOKEN_BUDGET,
+        )
+
+    async def summarize(
+        self,
+        user_request: str,
+        command_name: str,
+        command_output: Optional[str],
+        changes: RepositoryChanges,
+    ) -> str:
+        budget = TokenBudget(self.budget_tokens)
+        command_output = self._tail(command_output)
+        files = [(c.path, c.diff) for c in changes.tracked_changes] + [
+            (c.path, c.content) for c in changes.untracked_changes
+        ]
+        sized = [(path, content, self.llm.count_tokens(content)) for path, content in files]
+        # The part of every summary prompt that is not the changes
+        fixed = self.llm.count_tokens(command_output or "") + PROMPT_OVERHEAD_TOKENS
+
+        tokens = sum(size for _, _, size in sized) + fixed
+        if tokens <= self.prompt_max_tokens and budget.charge(tokens):
+            self._record("single", tokens, omitted=0)
+            return await self.llm.generate_change_summary(
+                user_request, command_name, command_output, changes
+            )
+
+        # Hold back enough for the prompt that combines the partial summaries
+        reserve = min(self.prompt_max_tokens, budget.remaining)
+        map_budget = TokenBudget(budget.remaining - reserve)
+        max_chunks = max(1, (reserve - fixed) // PARTIAL_SUMMARY_TOKENS)
+        chunks, omitted = [], []
+        for chunk in self._chunks(sized):
+            cost = chunk.tokens + PROMPT_OVERHEAD_TOKENS
+            if len(chunks) < max_chunks and map_budget.charge(cost):
+                chunks.append(chunk)
+            else:
+                omitted.extend(p for p in chunk.paths if p not in omitted)
+        spent = self.budget_tokens - reserve - map_budget.remaining
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def summarize_chunk(chunk: Chunk) -> str:
+            async with semaphore:
+                return await self.llm.generate_partial_change_summary(
+                    user_request, command_name, chunk.text
+                )
+
+        summaries = list(await asyncio.gather(*map(summarize_chunk, chunks)))
+
+        reduce_budget = TokenBudget(reserve)
+        reduce_budget.charge(fixed)
+        kept = []
+        for summary, chunk in zip(summaries, chunks):
+            if reduce_budget.charge(self.llm.count_tokens(summary)):
+                kept.append(summary)
+            else:
+                omitted.extend(p for p in chunk.paths if p not in omitted)
+        # The left-out files are listed by name, as far as the budget goes
+        listed = []
+        for path in omitted:
+            if not reduce_budget.charge(self.llm.count_tokens(path) + 2):
+                listed.append(f"and {len(omitted) - len(listed)} more")
+                break
+            listed.append(path)
+        spent += reserve - reduce_budget.remaining
+
+        self._record("map_reduce", spent, omitted=len(omitted))
+        if omitted:
+            self.logger.info(f"Summary leaves out {len(omitted)} files over budget")
+        return await self.llm.combine_change_summaries(
+            user_request, command_name, command_output, kept, listed
+        )
+
+    def _chunks(self, sized: List[Tuple[str, str, int]]) -> List[Chunk]:
+        """Pack files into chunks of at most ``chunk_tokens``, smallest first
+
+        Smallest first, so a budget that runs out leaves out the fewest files.
+        """
+        chunks: List[Chunk] = []
+        current = Chunk()
+        for path, content, tokens in sorted(sized, key=lambda item: item[2]):
+            if tokens <= self.chunk_tokens:
+                sections = [(f"File: {path}\n{content}", tokens)]
+            else:
+                max_chars = max(1, len(content) * self.chunk_tokens // tokens)
+                pieces = split_lines(content, max_chars)
+                sections = [
+                    (
+                        f"File: {path} (part {i} of {len(pieces)})\n{piece}",
+                        self.llm.count_tokens(piece),
+                    )
+                    for i, piece in enumerate(pieces, start=1)
+                ]
+            for section, section_tokens in sections:
+                if current.sections and current.tokens + section_tokens > self.chunk_tokens:
+                    chunks.append(current)
+                    current = Chunk()
+                current.add(path, section, section_tokens)
+        if current.sections:
+            chunks.append(current)
+        return chunks
+
+    def _tail(self, output: Optional[str]) -> Optional[str]:
+        """The end of a command's output, where its result usually is"""
+        if not output:
+            return output
+        tokens = self.llm.count_tokens(output)
+        if tokens <= self.output_max_tokens:
+            return output
+        keep = len(output) * self.output_max_tokens // tokens
+        return "[earlier output omitted]\n" + output[-keep:]
+
+    def _record(self, strategy: str, tokens: int, omitted: int) -> None:
+        metrics.increment("change_summaries_total", strategy=strategy)
+        metrics.increment("change_summary_prompt_tokens_total", tokens, strategy=strategy)
+        if omitted:
+            metrics.increment("change_summary_files_omitted_total", omitted)
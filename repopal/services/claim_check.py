@@ -0,0 +1,289 @@
+"""Claim-check storage for large pipeline task payloads
+
+Celery arguments and results travel through Redis, so passing whole
+events, command results or diffs between tasks makes broker memory grow
+with the size of the payload. Instead, a task checks a payload in and
+passes on the small envelope it gets back; the receiving task checks it
+out again. Payloads are stored once, under the SHA-256 digest of their
+bytes, in the database or a local blob directory.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from repopal.core.config import settings
+from repopal.core.database import SessionLocal
+from repopal.core.metrics import metrics
+from repopal.models.blob import Blob
+from repopal.schemas.changes import RepositoryChanges
+from repopal.schemas.command import CommandResult
+from repopal.schemas.service_handler import StandardizedEvent
+
+
+class BlobNotFoundError(KeyError):
+    """Raised when a claim check refers to a payload that is not stored"""
+
+
+def blob_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore(ABC):
+    """Content-addressed storage of immutable payloads"""
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """Store bytes (idempotently) and return their digest"""
+        pass
+
+    @abstractmethod
+    def get(self, digest: str) -> bytes:
+        """Return the bytes stored under a digest
+
+        Raises:
+            BlobNotFoundError: If nothing is stored under the digest
+        """
+        pass
+
+    @abstractmethod
+    def prune(self, stored_before: datetime) -> int:
+        """Delete payloads not stored since before a cutoff
+
+        Returns:
+            The number of payloads deleted
+        """
+        pass
+
+
+class DatabaseBlobStore(BlobStore):
+    """Keeps payloads in the ``blobs`` table
+
+    Each operation uses its own short session so checking a payload in is
+    not tied to (or rolled back with) the caller's transaction.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        db = self.session_factory()
+        try:
+            blob = db.get(Blob, digest)
+            if blob is None:
+                db.add(Blob(digest=digest, size=len(data), data=data))
+            else:
+                blob.stored_at = datetime.utcnow()
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker stored the same bytes first
+                db.rollback()
+        finally:
+            db.close()
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        db = self.session_factory()
+        try:
+            blob = db.get(Blob, digest)
+            if blob is None:
+                raise BlobNotFoundError(digest)
+            return blob.data
+        finally:
+            db.close()
+
+    def prune(self, stored_before: datetime) -> int:
+        db = self.session_factory()
+        try:
+            deleted = (
+                db.query(Blob)
+                .filter(Blob.stored_at < stored_before)
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+
+class FileBlobStore(BlobStore):
+    """Keeps payloads as files under ``root/<digest[:2]>/<digest>``
+
+    Suitable when all workers share a volume. Files are written to a
+    temporary name and renamed into place, so readers never see a partial
+    payload.
+    """
+
+    def __init__(self, root: Path | str):
+        self.root = Path(root)
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        path = self._path(digest)
+        if path.exists():
+            os.utime(path)
+            return digest
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        try:
+            return self._path(digest).read_bytes()
+        except FileNotFoundError:
+            raise BlobNotFoundError(digest) from None
+
+    def prune(self, stored_before: datetime) -> int:
+        if stored_before.tzinfo is None:
+            stored_before = stored_before.replace(tzinfo=timezone.utc)
+        cutoff = stored_before.timestamp()
+        deleted = 0
+        for path in self.root.glob("??/*"):
+            if path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+                deleted += 1
+        return deleted
+
+
+@dataclass(frozen=True)
+class PayloadCodec:
+    """How to turn one kind of payload into bytes and back"""
+
+    type: type
+    encode: Callable[[Any], bytes]
+    decode: Callable[..., Any]
+    # Bytes that always travel by reference, such as an event's raw body;
+    # ``decode`` then also gets a function that fetches them from the store
+    body: Optional[Callable[[Any], bytes]] = None
+
+
+def _pydantic_codec(model: type) -> PayloadCodec:
+    return PayloadCodec(
+        type=model,
+        encode=lambda value: value.model_dump_json().encode(),
+        decode=model.model_validate_json,
+    )
+
+
+# Checked in order, so the generic JSON codec must stay last
+PAYLOAD_CODECS: Dict[str, PayloadCodec] = {
+    "event": PayloadCodec(
+        type=StandardizedEvent,
+        encode=lambda event: json.dumps(event.to_dict()).encode(),
+        decode=lambda data, load_body: StandardizedEvent.from_dict(
+            json.loads(data), raw_body_loader=load_body
+        ),
+        body=lambda event: event.raw_body,
+    ),
+    "command_result": _pydantic_codec(CommandResult),
+    "changes": _pydantic_codec(RepositoryChanges),
+    "bytes": PayloadCodec(type=bytes, encode=bytes, decode=bytes),
+    "json": PayloadCodec(
+        type=object,
+        encode=lambda value: json.dumps(value).encode(),
+        decode=json.loads,
+    ),
+}
+
+
+class ClaimCheck:
+    """Swaps payloads for small, JSON-safe envelopes and back
+
+    Payloads whose encoded form is at most ``inline_max_bytes`` of UTF-8
+    travel inline, since a store round trip would cost more than it saves;
+    anything bigger is put in the blob store and only its digest is passed
+    along. Either way the envelope records the payload kind, so
+    ``check_out`` returns the same type that was checked in. A codec's
+    ``body`` is always stored, and only read back when the checked-out
+    payload first needs it.
+    """
+
+    def __init__(self, store: BlobStore, inline_max_bytes: int = 1024):
+        self.store = store
+        self.inline_max_bytes = inline_max_bytes
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def _kind_for(value: Any) -> str:
+        for kind, codec in PAYLOAD_CODECS.items():
+            if isinstance(value, codec.type):
+                return kind
+        raise TypeError(f"No claim-check codec for {type(value).__name__}")
+
+    def check_in(self, value: Any) -> Dict[str, Any]:
+        """Store a payload if needed and return the envelope to pass along"""
+        kind = self._kind_for(value)
+        codec = PAYLOAD_CODECS[kind]
+        envelope = self._envelope(kind, codec.encode(value))
+        if codec.body is not None:
+            body = codec.body(value)
+            envelope["body"] = self.store.put(body)
+            metrics.increment("claim_check_stored_bytes_total", len(body), kind=kind)
+        return envelope
+
+    def _envelope(self, kind: str, data: bytes) -> Dict[str, Any]:
+        if len(data) <= self.inline_max_bytes:
+            try:
+                envelope = {"kind": kind, "inline": data.decode("utf-8")}
+            except UnicodeDecodeError:
+                pass
+            else:
+                metrics.increment("claim_check_inline_total", kind=kind)
+                return envelope
+
+        digest = self.store.put(data)
+        metrics.increment("claim_check_stored_total", kind=kind)
+        metrics.increment("claim_check_stored_bytes_total", len(data), kind=kind)
+        return {"kind": kind, "digest": digest, "size": len(data)}
+
+    def check_out(self, envelope: Dict[str, Any]) -> Any:
+        """Return the payload an envelope from ``check_in`` stands for
+
+        Raises:
+            BlobNotFoundError: If the stored payload has been pruned
+        """
+        codec = PAYLOAD_CODECS[envelope["kind"]]
+        if "inline" in envelope:
+            data = envelope["inline"].encode("utf-8")
+        else:
+            data = self.store.get(envelope["digest"])
+        if codec.body is not None:
+            return codec.decode(data, partial(self.store.get, envelope["body"]))
+        return codec.decode(data)
+
+
+def get_blob_store() -> BlobStore:
+    if settings.CLAIM_CHECK_BACKEND == "file":
+        return FileBlobStore(settings.CLAIM_CHECK_DIR)
+    if settings.CLAIM_CHECK_BACKEND == "database":
+        return DatabaseBlobStore()
+    raise ValueError(f"Unknown claim-check backend: {settings.CLAIM_CHECK_BACKEND}")
+
+
+@lru_cache
+def get_claim_check() -> ClaimCheck:
+    return ClaimCheck(get_blob_store(), settings.CLAIM_CHECK_INLINE_MAX_BYTES)
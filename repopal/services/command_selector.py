@@ -25,25 +25,14 @@ class CommandSelectorService:
         if not available_commands:
             raise ValueError("No commands available for this event type")
 
-        # Prepare command descriptions for LLM
-        command_descriptions = [
-            {"name": cmd.metadata.name, "description": cmd.metadata.description}
-            for cmd in available_commands
-        ]
-
-        # Use LLM to select the best command
-        selected_command_name = await self.llm.select_command(
-            event.user_request, command_descriptions
+        # One LLM call picks the command and fills in its arguments
+        command_name, command_args = await self.llm.select_command_with_args(
+            event.user_request, available_commands
         )
-        self.logger.info(f"LLM selected command: {selected_command_name}")
+        self.logger.info(f"LLM selected command: {command_name}")
+        self.logger.info(f"LLM generated arguments: {command_args}")
 
         # Get the selected command instance
-        command = CommandFactory.get_command(selected_command_name)
-
-        # Use LLM to generate appropriate arguments
-        command_args = await self.llm.generate_command_args(
-            event.user_request, command.metadata.documentation
-        )
-        self.logger.info(f"LLM generated arguments: {command_args}")
+        command = CommandFactory.get_command(command_name)
 
         return command, command_args
@@ -1,9 +1,8 @@
-import os
 import subprocess
 
 from pydantic import BaseModel
 
-from repopal.schemas.command import CommandMetadata, CommandResult
+from repopal.schemas.command import CommandMetadata, CommandResult, ResourceBudget
 from repopal.services.commands.base import Command
 
 
@@ -17,6 +16,9 @@ class AiderArgs(BaseModel):
 class AiderCommand(Command[AiderArgs]):
     """Command to run Aider AI assistant"""
 
+    # Aider loops on LLM calls; bound it so one hung run cannot pin a worker
+    budget = ResourceBudget(wall_clock_seconds=1200, cpu_seconds=600, cpus=2)
+
     @property
     def metadata(self) -> CommandMetadata:
         return CommandMetadata(
@@ -36,13 +38,13 @@ class AiderCommand(Command[AiderArgs]):
         return f"aider --no-git '{args.prompt}'"
 
     async def execute(self, args: AiderArgs) -> CommandResult:
+        # The pipeline runs get_execution_command in the container instead,
+        # where run_in_container enforces the budget
         try:
-            # Change to the working directory
-            os.chdir(args.working_dir)
-
             # Run Aider with the prompt
             process = subprocess.run(
                 ["aider", "--no-git", args.prompt],
+                cwd=args.working_dir,
                 capture_output=True,
                 text=True,
                 check=True,
@@ -1,11 +1,15 @@
+import inspect
 from abc import ABC, abstractmethod
-from typing import Generic, TypeVar, Dict, Any
-from repopal.schemas.command import CommandMetadata, CommandArgs
+from typing import Generic, Type, TypeVar, Dict, Any
+from repopal.schemas.command import CommandMetadata, CommandArgs, ResourceBudget
 
 TArgs = TypeVar('TArgs', bound=CommandArgs)
 
 class Command(Generic[TArgs], ABC):
     """Base class for all commands"""
+
+    # How long and how much CPU one run may use; override per command
+    budget: ResourceBudget = ResourceBudget()
     
     @property
     @abstractmethod
@@ -28,12 +32,31 @@ class Command(Generic[TArgs], ABC):
         """
         pass
 
-    def convert_args(self, args: Dict[str, Any]) -> TArgs:
-        """Convert dictionary arguments to the appropriate type"""
+    @property
+    def args_type(self) -> Type[TArgs]:
+        """The pydantic model of this command's arguments"""
         if not hasattr(self, '_args_type'):
             # Get the concrete type bound to TArgs for this class instance
             self._args_type = self.__class__.__orig_bases__[0].__args__[0]
-        return self._args_type(**args)
+        return self._args_type
+
+    def convert_args(self, args: Dict[str, Any]) -> TArgs:
+        """Convert dictionary arguments to the appropriate type"""
+        return self.args_type(**args)
+
+    def tool_definition(self) -> Dict[str, Any]:
+        """This command as a function-calling tool whose parameters are its arguments"""
+        metadata = self.metadata
+        return {
+            "type": "function",
+            "function": {
+                "name": metadata.name,
+                "description": (
+                    f"{metadata.description}\n\n{inspect.cleandoc(metadata.documentation)}"
+                ),
+                "parameters": self.args_type.model_json_schema(),
+            },
+        }
 
     @abstractmethod
     def get_execution_command(self, args: TArgs) -> str:
@@ -1,4 +1,6 @@
-from typing import Dict, Type, List
+import hashlib
+import json
+from typing import Dict, Type, List, Optional
 from repopal.services.commands.base import Command
 from repopal.schemas.command import CommandMetadata
 
@@ -6,12 +8,26 @@ class CommandFactory:
     """Factory for creating and managing commands"""
     
     _commands: Dict[str, Type[Command]] = {}
+    _fingerprint: Optional[str] = None
 
     @classmethod
     def register(cls, command_class: Type[Command]) -> None:
         """Register a new command"""
         command_instance = command_class()
         cls._commands[command_instance.metadata.name] = command_class
+        cls._fingerprint = None
+
+    @classmethod
+    def fingerprint(cls) -> str:
+        """Hash of the registered commands' metadata; changes when they do"""
+        if cls._fingerprint is None:
+            metadata = sorted(
+                (m.name, m.description, m.documentation) for m in cls.list_commands()
+            )
+            cls._fingerprint = hashlib.sha256(
+                json.dumps(metadata).encode()
+            ).hexdigest()[:16]
+        return cls._fingerprint
 
     @classmethod
     def get_command(cls, command_name: str) -> Command:
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 
-from repopal.schemas.command import CommandMetadata
+from repopal.schemas.command import CommandMetadata, ResourceBudget
 from repopal.services.commands.base import Command
 
 
@@ -15,6 +15,8 @@ class FindReplaceArgs(BaseModel):
 class FindReplaceCommand(Command[FindReplaceArgs]):
     """Command to perform find and replace operations"""
 
+    budget = ResourceBudget(wall_clock_seconds=120, cpu_seconds=60, cpus=1)
+
     dockerfile = """
 FROM python:3.9-slim
 
@@ -0,0 +1,62 @@
+"""Webhook delivery deduplication"""
+
+import logging
+from typing import Optional
+
+import redis
+
+from repopal.core.metrics import metrics
+from repopal.schemas.service_handler import ServiceProvider
+
+
+class DeliveryDeduplicator:
+    """Redis seen-set of delivery IDs with a TTL
+
+    GitHub redeliveries reuse ``X-GitHub-Delivery`` and Slack retries reuse
+    the ``event_id``, so a single ``SET NX EX`` per delivery tells a first
+    delivery from a repeat in O(1).
+    """
+
+    KEY_PREFIX = "repopal:delivery"
+
+    def __init__(self, redis_client: redis.Redis, ttl_seconds: int):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.logger = logging.getLogger(__name__)
+
+    def _key(self, provider: ServiceProvider, delivery_id: str) -> str:
+        return f"{self.KEY_PREFIX}:{provider.value}:{delivery_id}"
+
+    def is_duplicate(self, provider: ServiceProvider, delivery_id: Optional[str]) -> bool:
+        """Record a delivery ID, returning True if it has been seen before"""
+        metrics.increment("webhook_deliveries_total", provider=provider.value)
+        if not delivery_id:
+            return False
+
+        try:
+            first_seen = self.redis.set(
+                self._key(provider, delivery_id), 1, nx=True, ex=self.ttl_seconds
+            )
+        except redis.RedisError as e:
+            # Fail open: processing a duplicate beats dropping a delivery
+            self.logger.warning(f"Deduplication unavailable: {e}")
+            return False
+
+        duplicate = not first_seen
+        if duplicate:
+            metrics.increment("webhook_duplicates_total", provider=provider.value)
+        total = metrics.counter("webhook_deliveries_total", provider=provider.value)
+        duplicates = metrics.counter("webhook_duplicates_total", provider=provider.value)
+        metrics.set_gauge(
+            "webhook_duplicate_ratio", duplicates / total, provider=provider.value
+        )
+        return duplicate
+
+    def forget(self, provider: ServiceProvider, delivery_id: Optional[str]) -> None:
+        """Drop a delivery ID so a provider retry is not mistaken for a duplicate"""
+        if not delivery_id:
+            return
+        try:
+            self.redis.delete(self._key(provider, delivery_id))
+        except redis.RedisError as e:
+            self.logger.warning(f"Failed to forget delivery {delivery_id}: {e}")
@@ -1,3 +1,5 @@
+import asyncio
+import hashlib
 import logging
 import tempfile
 from pathlib import Path
@@ -5,9 +7,12 @@ from typing import Any, Dict, Optional, Tuple, List
 
 import docker
 import git
+import requests
 from docker.models.containers import Container
 
-from repopal.schemas.command import CommandResult
+from repopal.core.exceptions import CommandTimeoutError
+from repopal.core.metrics import metrics
+from repopal.schemas.command import CommandResult, ResourceBudget
 from repopal.schemas.environment import EnvironmentConfig
 from repopal.schemas.changes import (
     RepositoryChanges,
@@ -15,11 +20,23 @@ from repopal.schemas.changes import (
     UntrackedChange,
 )
 from repopal.services.commands.base import Command
+from repopal.services.watchdog import Watchdog
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     pass
 
 
+def is_transient_docker_error(error: Exception) -> bool:
+    """Whether a Docker failure is the daemon's and may pass on retry
+
+    Server errors (5xx) and failures to reach the daemon are; client
+    errors such as a missing image are not.
+    """
+    if isinstance(error, docker.errors.APIError):
+        return error.is_server_error()
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
 class EnvironmentManager:
     """Manages Docker environments and Git repositories for command execution"""
 
@@ -29,15 +46,25 @@ class EnvironmentManager:
         self.container: Container | None = None
         self.logger = logging.getLogger(__name__)
 
-    def setup_container(
-        self, command: Command, environment: Dict[str, str] = None
-    ) -> None:
-        """Create and start a Docker container with the working directory mounted"""
-        if not self.work_dir:
-            raise ValueError(
-                "Working directory not set up. Call git_repo_manager.clone_repo first."
-            )
+    @staticmethod
+    def image_tag(command: Command) -> str:
+        """Tag for a command's image; changes whenever its Dockerfile does"""
+        digest = hashlib.sha256(command.dockerfile.encode()).hexdigest()[:12]
+        return f"repopal-{command.metadata.name}:{digest}"
+
+    def cached_image(self, command: Command) -> Optional[str]:
+        """The ID of the command's image if it was built on this host before"""
+        try:
+            return self.docker_client.images.get(self.image_tag(command)).id
+        except docker.errors.ImageNotFound:
+            return None
+
+    def build_image(self, command: Command) -> str:
+        """Build the Docker image for a command and return its ID
 
+        Needs only the command, so it can run while the repository is cloned.
+        The image is tagged so later runs find it with cached_image.
+        """
         # Create a temporary directory for the Dockerfile
         with tempfile.TemporaryDirectory() as docker_build_dir:
             dockerfile_path = Path(docker_build_dir) / "Dockerfile"
@@ -45,22 +72,69 @@ class EnvironmentManager:
 
             # Build the image
             image, _ = self.docker_client.images.build(
-                path=str(docker_build_dir), rm=True, forcerm=True
+                path=str(docker_build_dir),
+                rm=True,
+                forcerm=True,
+                tag=self.image_tag(command),
             )
+        return image.id
+
+    def has_image(self, image_id: str) -> bool:
+        """Whether an image built earlier is still present on this Docker host"""
+        try:
+            self.docker_client.images.get(image_id)
+        except docker.errors.ImageNotFound:
+            return False
+        return True
+
+    def setup_container(
+        self,
+        command: Command,
+        environment: Dict[str, str] = None,
+        name: Optional[str] = None,
+        image: Optional[str] = None,
+    ) -> None:
+        """Create and start a Docker container with the working directory mounted
 
-            container_name = f"repopal-{command.metadata.name}"
-
-            # Run the container
-            self.container = self.docker_client.containers.run(
-                image,
-                name=container_name,
-                detach=True,
-                volumes={str(self.work_dir): {"bind": "/workspace", "mode": "rw"}},
-                working_dir="/workspace",
-                environment=environment or {},
-                user="1000:1000",  # Run as non-root user
+        Args:
+            command: The command whose Dockerfile to build
+            environment: Environment variables for the container
+            name: Container name; must be unique among concurrent runs
+            image: An image already built with build_image, to skip the build
+        """
+        if not self.work_dir:
+            raise ValueError(
+                "Working directory not set up. Call git_repo_manager.clone_repo first."
             )
 
+        container_name = name or f"repopal-{command.metadata.name}"
+        limits = {}
+        if command.budget.cpus:
+            limits["nano_cpus"] = int(command.budget.cpus * 1e9)
+
+        # Run the container
+        self.container = self.docker_client.containers.run(
+            image or self.build_image(command),
+            name=container_name,
+            detach=True,
+            volumes={str(self.work_dir): {"bind": "/workspace", "mode": "rw"}},
+            working_dir="/workspace",
+            environment=environment or {},
+            user="1000:1000",  # Run as non-root user
+            **limits,
+        )
+
+    def attach_container(self, container_id: str) -> bool:
+        """Reuse a running container from an earlier attempt, if it still exists"""
+        try:
+            container = self.docker_client.containers.get(container_id)
+        except docker.errors.NotFound:
+            return False
+        if container.status != "running":
+            return False
+        self.container = container
+        return True
+
     def get_repository_changes(self) -> RepositoryChanges:
         """Get the git diff of changes made in the repository
 
@@ -117,11 +191,25 @@ class EnvironmentManager:
             # Get the command to execute
             shell_command = command.get_execution_command(args)
 
-            # Execute in container
-            exit_code, output = self.run_in_container(shell_command)
+            # Execute in container, off the event loop: commands run for
+            # minutes and the pipeline keeps other stages moving meanwhile
+            try:
+                exit_code, output = await asyncio.to_thread(
+                    self.run_in_container, shell_command, command.budget
+                )
+            except CommandTimeoutError as e:
+                metrics.increment("command_timeouts_total", command=command.metadata.name)
+                return CommandResult(
+                    success=False,
+                    message=f"Command {command.metadata.name} timed out after {e.timeout:g}s",
+                    error=str(e),
+                    timed_out=True,
+                    changes=RepositoryChanges(tracked_changes=[], untracked_changes=[]),
+                    data={"command_name": command.metadata.name},
+                )
 
             # Get repository changes after command execution
-            changes = self.get_repository_changes()
+            changes = await asyncio.to_thread(self.get_repository_changes)
 
             return CommandResult(
                 success=exit_code == 0,
@@ -133,6 +221,9 @@ class EnvironmentManager:
                 data={"command_name": command.metadata.name}
             )
         except Exception as e:
+            if is_transient_docker_error(e):
+                # Docker, not the command, failed; the caller may retry
+                raise
             # Create an empty RepositoryChanges object for failed commands
             empty_changes = RepositoryChanges(tracked_changes=[], untracked_changes=[])
             return CommandResult(
@@ -142,8 +233,15 @@ class EnvironmentManager:
                 changes=empty_changes
             )
 
-    def run_in_container(self, command: str) -> Tuple[int, str]:
-        """Execute a raw command in the Docker container"""
+    def run_in_container(
+        self, command: str, budget: Optional[ResourceBudget] = None
+    ) -> Tuple[int, str]:
+        """Execute a raw command in the Docker container
+
+        With a budget, CPU time is capped with ``ulimit -t`` and a watchdog
+        kills the container once the wall-clock budget runs out, raising
+        CommandTimeoutError. The container cannot be reused after that.
+        """
         if not self.container:
             raise ValueError("Container not set up. Call setup_container first.")
 
@@ -153,8 +251,24 @@ class EnvironmentManager:
         if self.container.status != "running":
             self.container.start()
 
+        shell_command = command
+        if budget and budget.cpu_seconds:
+            shell_command = f"ulimit -t {budget.cpu_seconds} && {command}"
+
         # Use sh -c to ensure environment variables are expanded
-        exit_code, output = self.container.exec_run(["/bin/sh", "-c", command])
+        container = self.container
+        with Watchdog(
+            budget.wall_clock_seconds if budget else None,
+            container.kill,
+            name=f"exec in {container.name}",
+        ) as watchdog:
+            try:
+                exit_code, output = container.exec_run(["/bin/sh", "-c", shell_command])
+            except docker.errors.APIError:
+                if not watchdog.expired:
+                    raise
+        if watchdog.expired:
+            raise CommandTimeoutError(command, budget.wall_clock_seconds)
         return exit_code, output.decode("utf-8")
 
     def cleanup(self) -> None:
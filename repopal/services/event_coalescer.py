@@ -0,0 +1,101 @@
+"""Debouncing of bursts of events about the same issue, PR or thread"""
+
+import logging
+from typing import Dict, Optional
+
+import redis
+
+from repopal.core.config import settings
+from repopal.core.metrics import metrics
+from repopal.core.redis import get_redis
+from repopal.schemas.service_handler import ServiceProvider
+
+# Proceed if we are still the latest delivery for the subject (or the marker
+# is gone), clearing the marker so the next burst starts a fresh window
+CLAIM_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    return 1
+end
+if current == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+class EventCoalescer:
+    """Keeps only the latest pending delivery per subject
+
+    Each accepted delivery records itself as the latest for its subject
+    (e.g. ``org/repo#42``) and is enqueued with a countdown equal to the
+    provider's window. When a delivery's task runs it only proceeds if no
+    newer delivery has replaced it in the meantime, so a burst of edits or
+    comments results in a single pipeline run for the last one.
+    """
+
+    KEY_PREFIX = "repopal:coalesce"
+
+    def __init__(self, redis_client: redis.Redis, windows: Dict[str, float]):
+        self.redis = redis_client
+        self.windows = windows
+        self.logger = logging.getLogger(__name__)
+        self._claim = self.redis.register_script(CLAIM_SCRIPT)
+
+    def _key(self, provider: ServiceProvider, subject: str) -> str:
+        return f"{self.KEY_PREFIX}:{provider.value}:{subject}"
+
+    def window_for(self, provider: ServiceProvider) -> float:
+        return float(self.windows.get(provider.value, 0))
+
+    def register(
+        self, provider: ServiceProvider, subject: Optional[str], delivery_id: str
+    ) -> float:
+        """Mark a delivery as the latest for its subject
+
+        Returns:
+            The countdown in seconds to enqueue the delivery with
+        """
+        window = self.window_for(provider)
+        if not subject or window <= 0:
+            return 0
+
+        try:
+            # The marker must outlive the countdown plus any queueing delay
+            self.redis.set(
+                self._key(provider, subject),
+                delivery_id,
+                ex=max(int(window * 10), settings.WEBHOOK_INBOX_STALE_SECONDS),
+            )
+        except redis.RedisError as e:
+            self.logger.warning(f"Coalescing unavailable: {e}")
+            return 0
+        return window
+
+    def claim(
+        self, provider: ServiceProvider, subject: Optional[str], delivery_id: str
+    ) -> bool:
+        """Return True if the delivery should run, False if a newer one replaced it"""
+        if not subject or self.window_for(provider) <= 0:
+            return True
+
+        try:
+            latest = bool(
+                self._claim(keys=[self._key(provider, subject)], args=[delivery_id])
+            )
+        except redis.RedisError as e:
+            self.logger.warning(f"Coalescing unavailable: {e}")
+            return True
+
+        if not latest:
+            metrics.increment("webhook_events_coalesced_total", provider=provider.value)
+        return latest
+
+
+def get_event_coalescer() -> Optional[EventCoalescer]:
+    """The coalescer, or None if no provider has a window configured"""
+    windows = settings.WEBHOOK_COALESCE_WINDOWS
+    if not any(window > 0 for window in windows.values()):
+        return None
+    return EventCoalescer(get_redis(), windows)
@@ -0,0 +1,104 @@
+"""Declarative routing table deciding which webhook events are worth handling"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from repopal.schemas.service_handler import RouteKey, SenderType, ServiceProvider
+
+
+@dataclass(frozen=True)
+class RoutingRule:
+    """A class of events we act on
+
+    Attributes:
+        name: Identifier used in logs and metrics
+        actions: Actions to accept, or None for any action
+        sender_types: Who may trigger the rule; our own app never should
+        requires_mention: Only accept events that address the bot directly
+    """
+
+    name: str
+    provider: ServiceProvider
+    event_type: str
+    actions: Optional[FrozenSet[str]] = None
+    sender_types: FrozenSet[SenderType] = frozenset({SenderType.USER})
+    requires_mention: bool = False
+
+
+DEFAULT_ROUTES: Tuple[RoutingRule, ...] = (
+    RoutingRule(
+        name="github_issue",
+        provider=ServiceProvider.GITHUB,
+        event_type="issue",
+        # An edit supersedes the run for the issue's previous text
+        actions=frozenset({"opened", "reopened", "edited"}),
+    ),
+    RoutingRule(
+        name="github_comment",
+        provider=ServiceProvider.GITHUB,
+        event_type="comment",
+        actions=frozenset({"created"}),
+        requires_mention=True,
+    ),
+    RoutingRule(
+        name="github_pull_request",
+        provider=ServiceProvider.GITHUB,
+        event_type="pull_request",
+        actions=frozenset({"opened"}),
+        requires_mention=True,
+    ),
+    RoutingRule(
+        name="slack_message",
+        provider=ServiceProvider.SLACK,
+        event_type="message",
+        actions=frozenset({"message", "app_mention"}),
+        requires_mention=True,
+    ),
+    RoutingRule(
+        name="slack_slash_command",
+        provider=ServiceProvider.SLACK,
+        event_type="slash_command",
+    ),
+)
+
+TableKey = Tuple[ServiceProvider, str, Optional[str]]
+
+
+class EventRouter:
+    """Routing rules compiled into a hash table
+
+    Rules are indexed by (provider, event_type, action), with ``None`` as
+    the action slot for rules that accept any action. Matching is at most
+    two dict lookups plus a scan of the few rules sharing a slot, so
+    irrelevant deliveries can be dropped at ingest before any other work.
+    """
+
+    def __init__(self, rules: Iterable[RoutingRule]):
+        self._table: Dict[TableKey, List[RoutingRule]] = defaultdict(list)
+        for rule in rules:
+            for action in rule.actions or (None,):
+                self._table[(rule.provider, rule.event_type, action)].append(rule)
+        self._table = dict(self._table)
+
+    def match(self, key: RouteKey) -> Optional[RoutingRule]:
+        """Return the first rule accepting this event, or None to discard it"""
+        candidates = self._table.get((key.provider, key.event_type, key.action), [])
+        if key.action is not None:
+            candidates = candidates + self._table.get(
+                (key.provider, key.event_type, None), []
+            )
+        for rule in candidates:
+            if key.sender_type not in rule.sender_types:
+                continue
+            if rule.requires_mention and not key.mentions_bot:
+                continue
+            return rule
+        return None
+
+
+@lru_cache
+def get_event_router() -> EventRouter:
+    """The process-wide router, compiled once from the default rules"""
+    return EventRouter(DEFAULT_ROUTES)
@@ -1,9 +1,21 @@
 import logging
+import tempfile
 from pathlib import Path
 from typing import Optional
 
 import git
 
+from repopal.schemas.changes import RepositoryChanges
+
+
+def authenticated_url(repo_url: str, github_token: Optional[str] = None) -> str:
+    """Insert a GitHub token into an HTTPS GitHub URL, if there is one"""
+    if github_token and "github.com" in repo_url:
+        url_parts = repo_url.split("://")
+        if len(url_parts) == 2:
+            return f"{url_parts[0]}://x-access-token:{github_token}@{url_parts[1]}"
+    return repo_url
+
 
 class GitRepoManager:
     """Class to create PRs on GitHub"""
@@ -11,10 +23,15 @@ class GitRepoManager:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.repo: git.Repo | None = None
+        self.work_dir: Path | None = None
 
 
     def clone_repo(
-        self, repo_url: str, branch: str = "main", github_token: Optional[str] = None
+        self,
+        repo_url: str,
+        branch: str = "main",
+        github_token: Optional[str] = None,
+        reference: Optional[Path] = None,
     ) -> Path:
         """Clone a repository into a temporary working directory
 
@@ -22,6 +39,8 @@ class GitRepoManager:
             repo_url: The URL of the repository to clone
             branch: The branch to clone (defaults to "main")
             github_token: Optional GitHub token for authentication
+            reference: A local mirror to copy objects from, so only what it
+                lacks is fetched over the network
         """
         if not self.work_dir:
             self.work_dir = Path(tempfile.mkdtemp())
@@ -30,15 +49,18 @@ class GitRepoManager:
                 f"Working directory absolute path: {self.work_dir.absolute()}"
             )
 
-        if github_token and "github.com" in repo_url:
-            # Insert token into GitHub URL
-            url_parts = repo_url.split("://")
-            if len(url_parts) == 2:
-                repo_url = (
-                    f"{url_parts[0]}://x-access-token:{github_token}@{url_parts[1]}"
-                )
-
-        self.repo = git.Repo.clone_from(repo_url, self.work_dir, branch=branch)
+        options = {}
+        if reference is not None:
+            # Dissociate copies the objects, so the mirror can be fetched
+            # into or pruned while the clone is in use
+            options = {"reference": str(reference), "dissociate": True}
+
+        self.repo = git.Repo.clone_from(
+            authenticated_url(repo_url, github_token),
+            self.work_dir,
+            branch=branch,
+            **options,
+        )
         return self.work_dir
 
     def create_branch(self, branch_name: str) -> None:
@@ -49,12 +71,11 @@ class GitRepoManager:
         """
         if not self.repo:
             raise ValueError("Repository not initialized")
-        self.repo.git.checkout("HEAD", b="main")
-        # TODO: check if branch exists, raise error if it does
-        self.repo.git.checkout("HEAD", b=branch_name)
+        # -B resets the branch if it exists, so a retried run starts clean
+        self.repo.git.checkout("-B", branch_name)
         self.logger.debug(f"Created branch: {branch_name}")
 
-    def commit_changes(self, commit_message: str) -> None:
+    def commit_changes(self, commit_message: str) -> str:
         """Commit changes to the repository
         Args:
             work_dir: The path to the repository working directory
@@ -63,20 +84,44 @@ class GitRepoManager:
         if not self.repo:
             raise ValueError("Repository not initialized")
         self.repo.git.add(".")
-        self.repo.index.commit(commit_message)
+        commit = self.repo.index.commit(commit_message)
         self.logger.debug(f"Committed changes with message: {commit_message}")
-
-    def push_changes(self, branch_name: str) -> None:
+        return commit.hexsha
+
+    def push_changes(
+        self,
+        branch_name: str,
+        force: bool = False,
+        expected_sha: Optional[str] = None,
+    ) -> None:
         """Push changes to the remote repository
         Args:
             work_dir: The path to the repository working directory
             branch_name: The name of the branch to push
+            force: Overwrite the remote branch, e.g. one an earlier attempt pushed
+            expected_sha: Only overwrite the remote branch if it is still at
+                this commit ("" if it must not exist yet), so a concurrent
+                push is rejected instead of lost (git --force-with-lease)
         """
         if not self.repo:
             raise ValueError("Repository not initialized")
-        self.repo.remotes.origin.push(branch_name)
+        if expected_sha is not None:
+            self.repo.git.push(
+                "origin",
+                f"--force-with-lease=refs/heads/{branch_name}:{expected_sha}",
+                f"{branch_name}:refs/heads/{branch_name}",
+            )
+        else:
+            self.repo.remotes.origin.push(branch_name, force=force).raise_if_error()
         self.logger.debug(f"Pushed changes to branch: {branch_name}")
 
+    def remote_branch_sha(self, branch_name: str) -> Optional[str]:
+        """The commit a branch points at on the remote, or None if it doesn't exist"""
+        if not self.repo:
+            raise ValueError("Repository not initialized")
+        output = self.repo.git.ls_remote("origin", f"refs/heads/{branch_name}")
+        return output.split()[0] if output else None
+
     def push_changes_to_new_branch(self, commit_message: str, branch_name: str) -> None:
         """Push changes to a new branch in the remote repository
         Args:
@@ -94,3 +139,33 @@ class GitRepoManager:
 
 
 
+
+    def open_repo(self, work_dir: Path) -> None:
+        """Use an existing clone, e.g. one kept from an earlier attempt"""
+        self.work_dir = Path(work_dir)
+        self.repo = git.Repo(self.work_dir)
+
+    def apply_changes(self, changes: RepositoryChanges) -> None:
+        """Re-apply captured changes to a clean working tree
+
+        Lets a retried run commit the output of a command without running it
+        again when its original working directory is gone.
+        """
+        if not self.repo or not self.work_dir:
+            raise ValueError("Repository not initialized")
+
+        for change in changes.tracked_changes:
+            with tempfile.NamedTemporaryFile("w", suffix=".patch") as patch:
+                # git apply rejects patches without a trailing newline
+                patch.write(change.diff.rstrip("\n") + "\n")
+                patch.flush()
+                self.repo.git.apply(patch.name)
+
+        for change in changes.untracked_changes:
+            path = self.work_dir / change.path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(change.content)
+        self.logger.debug(
+            f"Applied {len(changes.tracked_changes)} diffs and "
+            f"{len(changes.untracked_changes)} new files"
+        )
@@ -0,0 +1,46 @@
+"""Cost classes for pipeline jobs, and the Celery queue each one runs on"""
+
+from enum import Enum
+from typing import Dict, Tuple
+
+from repopal.core.config import settings
+from repopal.schemas.service_handler import ServiceProvider, StandardizedEvent
+
+
+class JobClass(str, Enum):
+    """Predicted cost of a pipeline job
+
+    INTERACTIVE jobs answer a question in a conversation and should make no
+    changes, so they are short and someone is waiting on them. CHANGE jobs
+    run a command like aider and open a PR, which can take minutes.
+    """
+
+    INTERACTIVE = "interactive"
+    CHANGE = "change"
+
+
+# Keyed by (provider, event_type). Anything unlisted is assumed expensive,
+# so an unexpected event cannot clog the fast lane.
+DEFAULT_JOB_CLASSES: Dict[Tuple[ServiceProvider, str], JobClass] = {
+    (ServiceProvider.SLACK, "message"): JobClass.INTERACTIVE,
+    (ServiceProvider.SLACK, "slash_command"): JobClass.INTERACTIVE,
+    (ServiceProvider.GITHUB, "issue"): JobClass.CHANGE,
+    (ServiceProvider.GITHUB, "comment"): JobClass.CHANGE,
+    (ServiceProvider.GITHUB, "pull_request"): JobClass.CHANGE,
+}
+
+
+def classify_event(
+    event: StandardizedEvent,
+    job_classes: Dict[Tuple[ServiceProvider, str], JobClass] = DEFAULT_JOB_CLASSES,
+) -> JobClass:
+    """Predict a job's cost class from where its event came from"""
+    return job_classes.get((event.provider, event.event_type), JobClass.CHANGE)
+
+
+def queue_for(job_class: JobClass) -> str:
+    """The Celery queue that runs pipelines of a cost class"""
+    return {
+        JobClass.INTERACTIVE: settings.PIPELINE_INTERACTIVE_QUEUE,
+        JobClass.CHANGE: settings.PIPELINE_CHANGE_QUEUE,
+    }[job_class]
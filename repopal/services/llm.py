@@ -1,33 +1,197 @@
+import ast
+import json
 import logging
-import re
-from typing import Any, Dict, List
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
-from litellm import acompletion
+from litellm import token_counter
 
 from repopal.core.config import settings
+from repopal.core.metrics import metrics
 from repopal.schemas.changes import RepositoryChanges
+from repopal.services.commands.base import Command
+from repopal.services.commands.factory import CommandFactory
+from repopal.services.llm_cache import LLMResponseCache
+from repopal.services.llm_gateway import LLMGateway, get_llm_gateway
 
 
-class LLMService:
+ANSWER_OPEN = "<answer>"
+ANSWER_CLOSE = "</answer>"
+
+# Appended to the system prompt for decisions not worth the reasoning tokens
+SKIP_REASONING_INSTRUCTION = (
+    "\n\nSkip the reasoning: reply with only the <answer></answer> tags."
+)
+
+
+class AnswerParser:
+    """Finds the answer in a completion as its text arrives
+
+    Completions stop at the closing answer tag, which is a stop sequence and
+    so usually missing from the text: the answer is whatever follows
+    ``<answer>``, up to ``</answer>`` or the end. Text without the tags is
+    all answer.
+    """
+
     def __init__(self):
+        self.text = ""
+        self.done = False
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+
+    def feed(self, chunk: str) -> bool:
+        """Add more of the completion; returns True once the answer is closed"""
+        # A tag may be split across chunks, so look back a tag's length
+        scan_from = max(0, len(self.text) - len(ANSWER_CLOSE))
+        self.text += chunk
+        if self._start is None:
+            index = self.text.find(ANSWER_OPEN, scan_from)
+            if index == -1:
+                return False
+            self._start = index + len(ANSWER_OPEN)
+        end = self.text.find(ANSWER_CLOSE, max(scan_from, self._start))
+        if end != -1:
+            self._end = end
+            self.done = True
+        return self.done
+
+    @property
+    def answer(self) -> str:
+        if self._start is None:
+            return self.text.strip()
+        return self.text[self._start : self._end].strip()
+
+
+class LLMService:
+    def __init__(
+        self,
+        cache: Optional[LLMResponseCache] = None,
+        gateway: Optional[LLMGateway] = None,
+    ):
         self.model = f"{settings.LLM_PROVIDER}/{settings.LLM_MODEL}"
         self.api_key = settings.LLM_API_KEY
-
-    async def get_completion(self, system_prompt: str, user_prompt: str) -> str:
+        self.streaming = settings.LLM_STREAMING_ENABLED
+        # Every request goes through it: concurrency, pacing and retries
+        self.gateway = gateway or get_llm_gateway()
+        # Answers for command selection and arguments; see llm_cache
+        self.cache = cache
+
+    async def get_completion(
+        self, system_prompt: str, user_prompt: str, skip_reasoning: bool = False
+    ) -> str:
         """
         Get a completion from the LLM using the specified prompts.
+
+        Generation stops at the closing answer tag. When streaming, the
+        answer is parsed as it arrives and returned as soon as it closes.
+
+        Args:
+            skip_reasoning: Ask for the answer alone, without the reasoning
+                the prompt asks for; for cheap decisions
         """
-        response = await acompletion(
+        if skip_reasoning:
+            system_prompt += SKIP_REASONING_INSTRUCTION
+        started = time.monotonic()
+        response = await self.gateway.acompletion(
             model=self.model,
             api_key=self.api_key,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
+            stop=[ANSWER_CLOSE],
+            stream=self.streaming,
+        )
+        parser = AnswerParser()
+        if self.streaming:
+            try:
+                async for chunk in response:
+                    if parser.feed(chunk.choices[0].delta.content or ""):
+                        break
+            finally:
+                # Stop receiving whatever the model adds after the answer
+                await response.aclose()
+        else:
+            parser.feed(response.choices[0].message.content or "")
+        metrics.observe(
+            "llm_time_to_answer_seconds",
+            time.monotonic() - started,
+            streaming=str(self.streaming).lower(),
         )
-        completion = response.choices[0].message.content.strip()
-        logging.info(f"LLM Response: {completion}")
-        return self._extract_answer(completion)
+        logging.info(f"LLM Response: {parser.text.strip()}")
+        return parser.answer
+
+    async def get_tool_call(
+        self, system_prompt: str, user_prompt: str, tools: List[Dict[str, Any]]
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Have the LLM call one of the given tools, returning the tool's name
+        and the arguments it was called with.
+        """
+        response = await self.gateway.acompletion(
+            model=self.model,
+            api_key=self.api_key,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            tools=tools,
+            tool_choice="required",
+        )
+        tool_calls = response.choices[0].message.tool_calls
+        if not tool_calls:
+            raise ValueError("LLM did not call a tool")
+        function = tool_calls[0].function
+        logging.info(f"LLM Tool Call: {function.name}({function.arguments})")
+        try:
+            arguments = json.loads(function.arguments or "{}")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"LLM sent malformed arguments for {function.name}: {e}")
+        if not isinstance(arguments, dict):
+            raise ValueError(f"LLM sent non-object arguments for {function.name}")
+        return function.name, arguments
+
+    async def select_command_with_args(
+        self, user_request: str, commands: List[Command]
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Select a command and generate its arguments in a single LLM call.
+
+        Each command is offered as a tool whose parameters are the JSON schema
+        of its arguments model, so the reply names the command and carries its
+        arguments, which are validated against the same model.
+
+        Returns:
+            The command name and its validated arguments
+        """
+        tools = [command.tool_definition() for command in commands]
+        prompt = f"""
+Given the following user request:
+"{user_request}"
+
+Call the tool for the command that best handles this request, with the
+arguments that carry it out.
+"""
+        system_prompt = "You are a helpful assistant that selects the most appropriate command based on user requests and calls it with the right arguments."
+
+        key = self._cache_key(
+            "selection", system_prompt, f"{prompt}\n{json.dumps(tools, sort_keys=True)}"
+        )
+        if key:
+            hit, cached = self.cache.get("selection", key)
+            if hit:
+                name, args = cached
+                return name, dict(args)
+
+        name, arguments = await self.get_tool_call(system_prompt, prompt, tools)
+        command = next((c for c in commands if c.metadata.name == name), None)
+        if command is None:
+            raise ValueError(f"Command {name} not found")
+        # pydantic's ValidationError is a ValueError
+        args = command.convert_args(arguments).model_dump()
+        if key:
+            self.cache.set("selection", key, [name, args])
+        return name, args
 
     async def select_command(
         self, user_request: str, available_commands: List[Dict[str, str]]
@@ -38,7 +202,18 @@ class LLMService:
         prompt = self._build_command_selection_prompt(user_request, available_commands)
         system_prompt = "You are a helpful assistant that selects the most appropriate command based on user requests."
 
-        response = await self.get_completion(system_prompt, prompt)
+        key = self._cache_key("select_command", system_prompt, prompt)
+        if key:
+            hit, response = self.cache.get("select_command", key)
+            if hit:
+                return response
+
+        # Picking a name from a short list needs no reasoning
+        response = await self.get_completion(
+            system_prompt, prompt, skip_reasoning=True
+        )
+        if key and response in {cmd["name"] for cmd in available_commands}:
+            self.cache.set("select_command", key, response)
         return response
 
     async def generate_command_args(
@@ -50,13 +225,30 @@ class LLMService:
         prompt = self._build_args_generation_prompt(user_request, command_docs)
         system_prompt = "You are a helpful assistant that generates command arguments based on user requests."
 
+        key = self._cache_key("command_args", system_prompt, prompt)
+        if key:
+            hit, args = self.cache.get("command_args", key)
+            if hit:
+                return dict(args)  # Callers may modify their arguments
+
         response = await self.get_completion(system_prompt, prompt)
 
-        # Parse the response into a dictionary of arguments
+        # Parse the response into a dictionary of arguments; literals only
         try:
-            return eval(response)
+            args = ast.literal_eval(response)
         except Exception:
             return {}
+        # Only well-formed answers are worth repeating
+        if key and isinstance(args, dict) and args:
+            self.cache.set("command_args", key, args)
+        return args
+
+    def _cache_key(self, kind: str, system_prompt: str, prompt: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.key(
+            kind, self.model, f"{system_prompt}\n{prompt}", CommandFactory.fingerprint()
+        )
 
     def _build_command_selection_prompt(
         self, user_request: str, available_commands: List[Dict[str, str]]
@@ -99,7 +291,7 @@ Then return only the dictionary in a format that can be evaluated using Python's
         self,
         user_request: str,
         command_name: str,
-        command_output: str | None = None,
+        command_output: str | None,
         changes: RepositoryChanges,
     ) -> str:
         """
@@ -121,6 +313,89 @@ Then return only the dictionary in a format that can be evaluated using Python's
 
         return await self.get_completion(system_prompt, prompt)
 
+    def count_tokens(self, text: str) -> int:
+        """Prompt tokens ``text`` costs on this service's model"""
+        try:
+            return token_counter(model=self.model, text=text)
+        except Exception:
+            # Close enough for budgeting when the tokenizer is unknown
+            return len(text) // 4 + 1
+
+    async def generate_partial_change_summary(
+        self, user_request: str, command_name: str, changes: str
+    ) -> str:
+        """
+        Summarize some of the changes made by a command execution.
+
+        Args:
+            changes: Diffs or new file contents, each under a "File:" header
+                that says which part of the file it is if the file was split
+        """
+        prompt = f"""
+A command made changes to a repository in response to this request:
+"{user_request}"
+
+Command executed:
+{command_name}
+
+These are some of the changes:
+{changes}
+
+Summarize these changes in a few sentences per file, for someone who will
+combine them with summaries of the other changes.
+
+Then provide the summary between <answer></answer> tags.
+"""
+        system_prompt = "You are a helpful assistant that summarizes code changes in clear, concise language."
+        return await self.get_completion(system_prompt, prompt, skip_reasoning=True)
+
+    async def combine_change_summaries(
+        self,
+        user_request: str,
+        command_name: str,
+        command_output: str | None,
+        summaries: List[str],
+        omitted: List[str],
+    ) -> str:
+        """
+        Combine summaries of parts of a change set into one summary.
+
+        Args:
+            summaries: Summaries of the changes, one per file or part of a file
+            omitted: Paths whose changes were too large to summarize
+        """
+        omitted_text = ""
+        if omitted:
+            omitted_text = (
+                "\nThese files also changed, but were too large to summarize:\n"
+                + "\n".join(f"- {path}" for path in omitted)
+            )
+        summaries_text = "\n\n".join(summaries) or "No changes detected"
+        prompt = f"""
+Given the following information about changes made to a repository:
+
+User's original request:
+"{user_request}"
+
+Command executed:
+{command_name}
+
+Command output:
+{command_output}
+
+Summaries of the changes, file by file:
+{summaries_text}
+{omitted_text}
+
+Write a clear, concise summary of the changes that were made.
+
+Write out your analysis between <reasoning></reasoning> tags.
+
+Then provide a natural language summary of the changes between <answer></answer> tags.
+"""
+        system_prompt = "You are a helpful assistant that summarizes code changes in clear, concise language."
+        return await self.get_completion(system_prompt, prompt)
+
     def _build_change_summary_prompt(
         self,
         user_request: str,
@@ -169,6 +444,83 @@ Write out your analysis between <reasoning></reasoning> tags.
 Then provide a natural language summary of the changes between <answer></answer> tags.
 """
 
+    async def generate_commit_message(
+        self, user_request: str, command_name: str, changes_summary: str
+    ) -> str:
+        """
+        Generate a git commit message for changes made by a command.
+
+        Args:
+            user_request: The original user request
+            command_name: The name of the command that made the changes
+            changes_summary: The summary from generate_change_summary
+        """
+        prompt = f"""
+Given the following user request:
+"{user_request}"
+
+The command {command_name} made these changes:
+{changes_summary}
+
+Write a git commit message for the changes: a summary line of at most 72
+characters, a blank line, then a short body explaining what changed and why.
+
+Write out your reasoning between <reasoning></reasoning> tags.
+
+Then return only the commit message between <answer></answer> tags.
+"""
+        system_prompt = "You are a helpful assistant that writes clear, conventional git commit messages."
+        return await self.get_completion(system_prompt, prompt)
+
+    async def generate_pr_description(
+        self, user_request: str, command_name: str, changes_summary: str
+    ) -> Dict[str, str]:
+        """
+        Generate a pull request title and description for changes made by a command.
+
+        Returns:
+            A dictionary with "title" and "body" keys
+        """
+        prompt = f"""
+Given the following user request:
+"{user_request}"
+
+The command {command_name} made these changes:
+{changes_summary}
+
+Write a pull request for the changes. Put the title on the first line,
+then a blank line, then a description in Markdown.
+
+Write out your reasoning between <reasoning></reasoning> tags.
+
+Then return only the title and description between <answer></answer> tags.
+"""
+        system_prompt = "You are a helpful assistant that writes clear pull request descriptions."
+        response = await self.get_completion(system_prompt, prompt)
+        title, _, body = response.partition("\n")
+        return {"title": title.strip(), "body": body.strip()}
+
+    async def answer_question(self, user_request: str) -> str:
+        """
+        Answer a request that names no repository, e.g. a question in Slack.
+
+        Args:
+            user_request: The original user request
+        """
+        prompt = f"""
+Answer the following request:
+"{user_request}"
+
+No repository was given, so answer from what you know and say so if the
+request needs a repository to work on.
+
+Write out your reasoning between <reasoning></reasoning> tags.
+
+Then return only the answer between <answer></answer> tags.
+"""
+        system_prompt = "You are a helpful assistant that answers questions about software development."
+        return await self.get_completion(system_prompt, prompt)
+
     async def generate_status_message(self, stage: str, context: Dict[str, Any]) -> str:
         """
         Generate an appropriate status message for the current stage of processing.
@@ -215,11 +567,12 @@ Then provide the message between <answer></answer> tags.
         system_prompt = (
             "You are a helpful assistant providing status updates on automated tasks."
         )
-        return await self.get_completion(system_prompt, prompts[stage])
+        return await self.get_completion(
+            system_prompt, prompts[stage], skip_reasoning=True
+        )
 
     def _extract_answer(self, text: str) -> str:
         """Extract the content between <answer></answer> tags."""
-        match = re.search(r"<answer>(.*?)</answer>", text, re.DOTALL)
-        if match:
-            return match.group(1).strip()
-        return text  # Return original text if no tags found
+        parser = AnswerParser()
+        parser.feed(text)
+        return parser.answer
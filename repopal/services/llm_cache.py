@@ -0,0 +1,153 @@
+"""Read-through cache of LLM answers for command selection and arguments
+
+Bots, issue templates and repeated Slack questions send the same request
+about the same commands over and over, and each one costs a model round
+trip of seconds. The answer depends only on the model, the prompt and the
+registered commands, so it is cached under a hash of those three: a
+process-local LRU answers repeats in microseconds, and Redis shares answers
+between workers and across restarts.
+
+Registering, removing or redocumenting a command changes
+``CommandFactory.fingerprint()`` and with it every key, so stale answers are
+never read. ``invalidate()`` drops everything explicitly, e.g. after a
+deploy changes the prompts' meaning without changing their text.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+
+import redis
+
+from repopal.core.config import settings
+from repopal.core.metrics import metrics
+from repopal.core.redis import get_redis
+
+
+def normalize_prompt(prompt: str) -> str:
+    """The prompt with Unicode and whitespace differences removed"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", prompt)).strip()
+
+
+class LLMResponseCache:
+    """Two-tier cache: an in-process LRU in front of an optional Redis"""
+
+    KEY_PREFIX = "repopal:llm"
+    GENERATION_KEY = f"{KEY_PREFIX}:generation"
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        ttl_seconds: int = 86400,
+        max_entries: int = 1024,
+    ):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def key(self, kind: str, model: str, prompt: str, fingerprint: str) -> str:
+        """Cache key of one answer; ``fingerprint`` identifies the command set"""
+        digest = hashlib.sha256(
+            "\0".join(
+                (kind, model, fingerprint, normalize_prompt(prompt))
+            ).encode()
+        ).hexdigest()
+        return f"{self.KEY_PREFIX}:{kind}:{digest}"
+
+    def _generation(self) -> int:
+        """Bumped by ``invalidate``; part of every Redis key"""
+        if self.redis is None:
+            return 0
+        return int(self.redis.get(self.GENERATION_KEY) or 0)
+
+    def get(self, kind: str, key: str) -> Tuple[bool, Any]:
+        """(True, answer) for a hit, (False, None) for a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._record(kind, "memory")
+                return True, self._entries[key]
+
+        if self.redis is not None:
+            try:
+                cached = self.redis.get(f"{key}:{self._generation()}")
+            except redis.RedisError as e:
+                # Fail open: a miss costs one model call
+                self.logger.warning(f"LLM cache unavailable: {e}")
+                cached = None
+            if cached is not None:
+                value = json.loads(cached)
+                self._remember(key, value)
+                self._record(kind, "redis")
+                return True, value
+
+        self._record(kind, "miss")
+        return False, None
+
+    def set(self, kind: str, key: str, value: Any) -> None:
+        """Store an answer in both tiers"""
+        self._remember(key, value)
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(
+                f"{key}:{self._generation()}", json.dumps(value), ex=self.ttl_seconds
+            )
+        except redis.RedisError as e:
+            self.logger.warning(f"Could not cache LLM answer: {e}")
+
+    def invalidate(self) -> None:
+        """Forget every cached answer, in this process and in Redis
+
+        Other processes keep their in-memory entries until they restart or
+        evict them; register commands through ``CommandFactory`` to change
+        the keys everywhere at once.
+        """
+        with self._lock:
+            self._entries.clear()
+        if self.redis is None:
+            return
+        try:
+            self.redis.incr(self.GENERATION_KEY)
+        except redis.RedisError as e:
+            self.logger.warning(f"Could not invalidate LLM cache: {e}")
+
+    def _remember(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _record(self, kind: str, tier: str) -> None:
+        metrics.increment("llm_cache_requests_total", kind=kind, tier=tier)
+        hits = sum(
+            metrics.counter("llm_cache_requests_total", kind=kind, tier=t)
+            for t in ("memory", "redis")
+        )
+        total = hits + metrics.counter("llm_cache_requests_total", kind=kind, tier="miss")
+        metrics.set_gauge("llm_cache_hit_ratio", hits / total, kind=kind)
+
+
+@lru_cache
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """This process's LLM answer cache, or None if answers are not cached
+
+    One instance per process, so its in-memory tier outlives each pipeline.
+    """
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    return LLMResponseCache(
+        get_redis() if settings.LLM_CACHE_REDIS_ENABLED else None,
+        ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+        max_entries=settings.LLM_CACHE_MEMORY_ENTRIES,
+    )
@@ -0,0 +1,361 @@
+"""Process-wide gateway for LLM requests
+
+Every ``LLMService`` in a process sends its requests through one
+``LLMGateway``, which keeps the process inside the provider's limits
+instead of finding them with bursts of 429s:
+
+- a semaphore per model bounds the requests in flight
+- token buckets per model pace requests and tokens per minute, so a burst
+  queues here rather than being rejected by the provider
+- transient failures are retried with jittered exponential backoff; a
+  Retry-After from the provider is honored, and holds back every request to
+  that model, not just the one that was told
+
+litellm reuses its HTTP clients between calls, so connections are pooled
+already; the gateway only decides when a request may go out.
+"""
+
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+import weakref
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import litellm
+
+from repopal.core.config import settings
+from repopal.core.metrics import metrics
+
+# Failures worth another attempt; anything else is the caller's to handle
+RETRYABLE_ERRORS = (
+    litellm.RateLimitError,
+    litellm.APIConnectionError,
+    litellm.Timeout,
+    litellm.ServiceUnavailableError,
+    litellm.InternalServerError,
+)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait before retrying, if it said"""
+    headers = getattr(error, "litellm_response_headers", None)
+    if headers is None:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class TokenBucket:
+    """In-process token bucket that reserves ahead instead of refusing
+
+    A reservation always succeeds and returns how long to wait for it, so
+    callers are served in the order they asked, each waiting out the debt
+    of those before it.
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.clock = clock
+        self._tokens = per_minute
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` tokens; returns the seconds until they are available"""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            # A request bigger than the bucket would otherwise never fit
+            self._tokens -= min(amount, self.capacity)
+            return max(0.0, -self._tokens / self.rate)
+
+    def refund(self, amount: float) -> None:
+        """Return tokens reserved but not used, or charge more if negative"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def available(self) -> float:
+        """Tokens left now; negative while reservations wait for the refill"""
+        with self._lock:
+            elapsed = self.clock() - self._updated
+            return min(self.capacity, self._tokens + elapsed * self.rate)
+
+
+class ModelLimits:
+    """Pacing and backoff state for one model, shared by the whole process"""
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.requests: Optional[TokenBucket] = None
+        self.tokens: Optional[TokenBucket] = None
+        if requests_per_minute > 0:
+            self.requests = TokenBucket(requests_per_minute, clock)
+        if tokens_per_minute > 0:
+            self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.paused_until = 0.0  # Set from Retry-After; monotonic time
+
+
+class LLMGateway:
+    """Admission, pacing and retries for litellm completions"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_retries: int = 3,
+        backoff_seconds: float = 1,
+        max_backoff_seconds: float = 60,
+        expected_output_tokens: int = 500,
+        complete: Optional[Callable[..., Any]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.expected_output_tokens = expected_output_tokens
+        self.complete = complete  # Defaults to litellm.acompletion
+        self.clock = clock  # Of the token buckets
+        self.logger = logging.getLogger(__name__)
+        self._limits: Dict[str, ModelLimits] = {}
+        self._counts: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._lock = threading.Lock()
+        # Semaphores belong to an event loop, and a process may run several
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _limits_for(self, model: str) -> ModelLimits:
+        with self._lock:
+            if model not in self._limits:
+                self._limits[model] = ModelLimits(
+                    self.requests_per_minute, self.tokens_per_minute, self.clock
+                )
+            return self._limits[model]
+
+    def _semaphore_for(self, model: str) -> asyncio.Semaphore:
+        semaphores = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if model not in semaphores:
+            semaphores[model] = asyncio.Semaphore(self.max_concurrency)
+        return semaphores[model]
+
+    def _count(self, gauge: str, model: str, delta: int) -> None:
+        with self._lock:
+            self._counts[gauge, model] += delta
+            metrics.set_gauge(gauge, self._counts[gauge, model], model=model)
+
+    def _estimate_prompt_tokens(self, model: str, messages: Any) -> int:
+        try:
+            return litellm.token_counter(model=model, messages=messages)
+        except Exception:
+            return sum(len(str(m.get("content", ""))) for m in messages) // 4
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter, so retries from many requests do not arrive together
+        delay = random.uniform(
+            0, min(self.max_backoff_seconds, self.backoff_seconds * 2**attempt)
+        )
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, requested + random.uniform(0, self.backoff_seconds))
+        return delay
+
+    async def _admit(self, model: str, limits: ModelLimits, tokens: int) -> None:
+        """Wait until the model's pacing allows one more request
+
+        ``tokens`` is 0 for a retry: the first attempt reserved them already.
+        """
+        wait = 0.0
+        if limits.requests is not None:
+            wait = max(wait, limits.requests.reserve(1))
+        if limits.tokens is not None and tokens:
+            wait = max(wait, limits.tokens.reserve(tokens))
+        wait = max(wait, limits.paused_until - time.monotonic())
+        if wait > 0:
+            metrics.increment("llm_gateway_throttled_total", model=model)
+            await asyncio.sleep(wait)
+
+    async def acompletion(self, model: str, messages: Any, **kwargs: Any) -> Any:
+        """``litellm.acompletion`` through the model's limits, with retries
+
+        The estimated tokens are reserved once per call, not per attempt,
+        and settled against the reported usage when the response (or the
+        stream) is done; a call that fails gives them all back. A streamed
+        response holds its place in the concurrency limit until it is read
+        to the end or closed.
+        """
+        limits = self._limits_for(model)
+        semaphore = self._semaphore_for(model)
+        prompt_tokens = self._estimate_prompt_tokens(model, messages)
+        tokens = prompt_tokens + self.expected_output_tokens
+
+        def settle(used: Optional[int]) -> None:
+            # Settle the estimate against what the request really used
+            if limits.tokens is not None and used is not None:
+                limits.tokens.refund(tokens - used)
+
+        attempt = 0
+        try:
+            while True:
+                queued = time.monotonic()
+                self._count("llm_gateway_waiting", model, 1)
+                try:
+                    await self._admit(model, limits, tokens if attempt == 0 else 0)
+                    await semaphore.acquire()
+                finally:
+                    self._count("llm_gateway_waiting", model, -1)
+                metrics.observe("llm_gateway_queue_seconds", time.monotonic() - queued, model=model)
+                self._count("llm_gateway_in_flight", model, 1)
+                released = False
+
+                def release() -> None:
+                    nonlocal released
+                    if not released:
+                        released = True
+                        semaphore.release()
+                        self._count("llm_gateway_in_flight", model, -1)
+
+                try:
+                    complete = self.complete or litellm.acompletion
+                    response = await complete(model=model, messages=messages, **kwargs)
+                except RETRYABLE_ERRORS as e:
+                    release()
+                    if attempt >= self.max_retries:
+                        metrics.increment("llm_gateway_requests_total", model=model, outcome="failed")
+                        raise
+                    delay = self._backoff(attempt, e)
+                    if retry_after(e) is not None:
+                        # Everyone sending to this model waits, not just us
+                        limits.paused_until = max(limits.paused_until, time.monotonic() + delay)
+                    attempt += 1
+                    metrics.increment(
+                        "llm_gateway_retries_total", model=model, reason=type(e).__name__
+                    )
+                    self.logger.warning(
+                        f"LLM request to {model} failed ({e}); retry {attempt} in {delay:.1f}s"
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                except Exception:
+                    release()
+                    metrics.increment("llm_gateway_requests_total", model=model, outcome="failed")
+                    raise
+                except BaseException:
+                    release()
+                    raise
+                break
+        except BaseException:
+            # Nothing was used; give the reservation back
+            settle(0)
+            raise
+
+        metrics.increment("llm_gateway_requests_total", model=model, outcome="ok")
+        if kwargs.get("stream"):
+
+            def settle_stream(usage: Any, streamed_chars: int) -> None:
+                # Closed before the usage chunk: count what was streamed
+                used = used_tokens(usage)
+                settle(prompt_tokens + streamed_chars // 4 if used is None else used)
+
+            return GatedStream(response, release, settle_stream)
+        release()
+        settle(used_tokens(getattr(response, "usage", None)))
+        return response
+
+
+def used_tokens(usage: Any) -> Optional[int]:
+    """Tokens a response reports using, or None if it does not say"""
+    return getattr(usage, "total_tokens", None) or None
+
+
+class GatedStream:
+    """A streamed response that frees its concurrency slot when done
+
+    Once the stream ends or is closed, ``settle`` gets the usage the
+    provider reported (usually on the last chunk, so None if the stream was
+    closed early) and the number of content characters streamed.
+    """
+
+    def __init__(
+        self,
+        stream: Any,
+        release: Callable[[], None],
+        settle: Callable[[Any, int], None] = lambda usage, streamed_chars: None,
+    ):
+        self.stream = stream
+        self.release = release
+        self.settle = settle
+        self.usage = None
+        self.streamed_chars = 0
+        self._finished = False
+
+    def __aiter__(self) -> "GatedStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        try:
+            chunk = await self.stream.__anext__()
+        except BaseException:
+            # Exhausted or failed; either way the request is over
+            self._finish()
+            raise
+        self.usage = getattr(chunk, "usage", None) or self.usage
+        try:
+            self.streamed_chars += len(chunk.choices[0].delta.content or "")
+        except (AttributeError, IndexError, TypeError):
+            pass
+        return chunk
+
+    async def aclose(self) -> None:
+        try:
+            close = getattr(self.stream, "aclose", None)
+            if close is not None:
+                await close()
+        finally:
+            self._finish()
+
+    def _finish(self) -> None:
+        self.release()
+        if not self._finished:
+            self._finished = True
+            self.settle(self.usage, self.streamed_chars)
+
+
+@lru_cache
+def get_llm_gateway() -> LLMGateway:
+    """The gateway every LLM request in this process goes through"""
+    return LLMGateway(
+        max_concurrency=settings.LLM_GATEWAY_MAX_CONCURRENCY,
+        requests_per_minute=settings.LLM_GATEWAY_REQUESTS_PER_MINUTE,
+        tokens_per_minute=settings.LLM_GATEWAY_TOKENS_PER_MINUTE,
+        max_retries=settings.LLM_GATEWAY_MAX_RETRIES,
+        backoff_seconds=settings.LLM_GATEWAY_BACKOFF_SECONDS,
+        max_backoff_seconds=settings.LLM_GATEWAY_MAX_BACKOFF_SECONDS,
+    )
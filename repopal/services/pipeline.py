@@ -0,0 +1,1059 @@
+"""Checkpointed event pipeline
+
+Runs the stages from flows.md for one standardized event: acknowledge,
+select command, clone, build image and container, execute, diff,
+summarize, commit/push, create PR and notify. Stages declare the stages
+they depend on and run as soon as those finish, so cloning, building the
+command's image and the "received" message overlap with LLM command
+selection instead of waiting on it.
+
+Each finished stage's output is checkpointed (through the claim-check
+store) on the ``PipelineRun``, so a retry after a worker crash or a
+transient GitHub, Docker or LLM error resumes at the failed stage instead
+of cloning, selecting and running the command all over again.
+"""
+
+import asyncio
+import logging
+import shutil
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+import docker
+import git
+import litellm
+import requests
+from github.GithubException import GithubException, RateLimitExceededException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from repopal.core.config import settings
+from repopal.core.exceptions import (
+    CommandFailedError,
+    PipelineCancelledError,
+    PipelineError,
+    PipelineNotFoundError,
+    PipelineStateError,
+    StageTimeoutError,
+    RepositoryBusyError,
+)
+from repopal.core.metrics import metrics
+from repopal.models.pipeline import (
+    PipelineRun,
+    PipelineStageRun,
+    PipelineStatus,
+    StageStatus,
+)
+from repopal.repositories.pipeline_run import PipelineRunRepository
+from repopal.schemas.changes import RepositoryChanges
+from repopal.schemas.command import CommandResult
+from repopal.schemas.environment import EnvironmentConfig
+from repopal.schemas.service_handler import ServiceProvider, StandardizedEvent
+from repopal.services.cancellation import CancellationRegistry
+from repopal.services.change_summarizer import ChangeSummarizer
+from repopal.services.claim_check import ClaimCheck, get_claim_check
+from repopal.services.command_selector import CommandSelectorService
+from repopal.services.commands import CommandFactory
+from repopal.services.commands.base import Command
+from repopal.services.environment_manager import EnvironmentManager
+from repopal.services.git_repo_manager import GitRepoManager
+from repopal.services.job_classes import JobClass, classify_event
+from repopal.services.llm import LLMService
+from repopal.services.llm_cache import get_llm_cache
+from repopal.services.pr_creator import PullRequestCreator
+from repopal.services.repo_lease import Lease, RepositoryLeases
+from repopal.services.service_handler_factory import ServiceHandlerFactory
+from repopal.services.status_messages import StatusMessages, render_status_message
+from repopal.services.service_handlers.base import ResponseType, ServiceHandler
+from repopal.services.workspace_speculation import (
+    CommandPredictor,
+    RepositoryMirrors,
+    get_command_predictor,
+    get_repository_mirrors,
+)
+
+# Allowed status changes; anything else is a PipelineStateError
+PIPELINE_TRANSITIONS: Dict[PipelineStatus, Set[PipelineStatus]] = {
+    PipelineStatus.PENDING: {PipelineStatus.RUNNING, PipelineStatus.CANCELLED},
+    PipelineStatus.RUNNING: {
+        PipelineStatus.COMPLETED,
+        PipelineStatus.RETRYING,
+        PipelineStatus.FAILED,
+        PipelineStatus.CANCELLED,
+    },
+    PipelineStatus.RETRYING: {PipelineStatus.RUNNING, PipelineStatus.CANCELLED},
+    PipelineStatus.COMPLETED: set(),
+    PipelineStatus.FAILED: set(),
+    PipelineStatus.CANCELLED: set(),
+}
+
+# Errors worth another attempt; anything else fails the run straight away
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    requests.ConnectionError,
+    requests.Timeout,
+    git.GitCommandError,
+    RateLimitExceededException,
+    litellm.RateLimitError,
+    litellm.APIConnectionError,
+    litellm.Timeout,
+    litellm.ServiceUnavailableError,
+    litellm.InternalServerError,
+)
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether a stage failure may succeed if the stage is retried"""
+    if isinstance(error, PipelineError):
+        return False
+    if isinstance(error, GithubException) and not isinstance(
+        error, RateLimitExceededException
+    ):
+        return error.status == 429 or error.status >= 500
+    if isinstance(error, docker.errors.APIError):
+        return error.is_server_error()
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+@dataclass
+class PipelineServices:
+    """The collaborators pipeline stages use, injectable for tests"""
+
+    llm: LLMService
+    command_selector: CommandSelectorService
+    pull_requests: PullRequestCreator
+    handler_for: Callable[[ServiceProvider], ServiceHandler] = (
+        ServiceHandlerFactory.get_handler
+    )
+    git_factory: Callable[[], GitRepoManager] = GitRepoManager
+    environment_factory: Callable[[], EnvironmentManager] = EnvironmentManager
+    github_token: Optional[str] = None
+    # Speculatively prepared workspaces (see workspace_speculation)
+    mirrors: Optional[RepositoryMirrors] = None
+    predictor: Optional[CommandPredictor] = None
+    # Have the LLM rewrite template status messages in the background
+    enrich_status_messages: bool = False
+    # Token-budgeted summaries of large changes; None sends one prompt
+    summarizer: Optional[ChangeSummarizer] = None
+
+    @classmethod
+    def default(cls) -> "PipelineServices":
+        llm = LLMService(cache=get_llm_cache())
+        github = ServiceHandlerFactory.get_handler(ServiceProvider.GITHUB).github
+        return cls(
+            llm=llm,
+            command_selector=CommandSelectorService(llm=llm),
+            pull_requests=PullRequestCreator(github),
+            github_token=settings.GITHUB_TOKEN,
+            mirrors=get_repository_mirrors(),
+            predictor=get_command_predictor(),
+            enrich_status_messages=settings.STATUS_MESSAGE_ENRICHMENT_ENABLED,
+            summarizer=ChangeSummarizer.default(llm),
+        )
+
+
+def organization_of(event: StandardizedEvent) -> Optional[str]:
+    """Who a run is for: the repository's owner, or the Slack workspace"""
+    repository = event.payload.get("repository")
+    if repository and "/" in repository:
+        return repository.split("/", 1)[0]
+    raw_payload = event.raw_payload
+    return raw_payload.get("team_id") or (raw_payload.get("team") or {}).get("id")
+
+
+@dataclass
+class PipelineContext:
+    """Per-attempt state shared by the stages of one run"""
+
+    run_id: str
+    event: StandardizedEvent
+    services: PipelineServices
+    outputs: Dict[str, Any] = field(default_factory=dict)
+    cancelled: asyncio.Event = field(default_factory=asyncio.Event)
+    _git: Optional[GitRepoManager] = None
+    _environment: Optional[EnvironmentManager] = None
+    _status: Optional[StatusMessages] = None
+
+    @property
+    def git(self) -> GitRepoManager:
+        if self._git is None:
+            self._git = self.services.git_factory()
+        return self._git
+
+    @property
+    def environment(self) -> EnvironmentManager:
+        if self._environment is None:
+            self._environment = self.services.environment_factory()
+        return self._environment
+
+    @property
+    def status(self) -> StatusMessages:
+        if self._status is None:
+            self._status = StatusMessages(
+                self.services.handler_for(self.event.provider),
+                self.event.raw_payload,
+                llm=self.services.llm if self.services.enrich_status_messages else None,
+            )
+        return self._status
+
+    @property
+    def command(self) -> Command:
+        return CommandFactory.get_command(self.outputs["select_command"]["command"])
+
+    @property
+    def branch_name(self) -> str:
+        # Stable per run, so a retried push updates the same branch
+        return f"repopal/{self.run_id[:8]}"
+
+    @property
+    def default_branch(self) -> str:
+        repository = self.event.raw_payload.get("repository") or {}
+        return repository.get("default_branch") or "main"
+
+    def kill_container(self) -> None:
+        """Kill the command's container now, ending any command running in it"""
+        environment = self._environment
+        if environment and environment.container:
+            try:
+                environment.container.kill()
+            except docker.errors.APIError as e:
+                logging.getLogger(__name__).warning(f"Container kill failed: {e}")
+
+    def close(self, keep_workspace: bool = False) -> None:
+        """Remove the container, and the clone unless a retry will reuse it"""
+        if self._status is not None:
+            self._status.close()
+        environment = self._environment
+        if environment and environment.container:
+            try:
+                environment.container.stop()
+                environment.container.remove()
+            except docker.errors.APIError as e:
+                logging.getLogger(__name__).warning(f"Container cleanup failed: {e}")
+            environment.container = None
+        if not keep_workspace and self._git and self._git.work_dir:
+            shutil.rmtree(self._git.work_dir, ignore_errors=True)
+            self._git.work_dir = None
+
+
+@dataclass(frozen=True)
+class Stage:
+    """One pipeline step
+
+    ``requires`` names the stages that must finish first, usually because
+    this one reads their outputs; stages with no path between them run
+    concurrently. ``run`` is a coroutine function, or a plain function for
+    stages that block on git or Docker, which runs in a worker thread.
+
+    Stages that leave state on the worker (a clone, a container) provide
+    ``restore``, which re-attaches to that state from the checkpoint and
+    returns False if it is gone, in which case the stage runs again.
+    ``annotate`` copies parts of the output onto the run's queryable columns.
+
+    ``timeout`` is the stage's wall-clock budget in seconds, or a function
+    of the context for budgets that depend on e.g. the command; the default
+    is PIPELINE_STAGE_TIMEOUT_SECONDS. Over budget the stage raises
+    StageTimeoutError and the runner kills the container, which unblocks a
+    worker thread stuck on Docker.
+    """
+
+    name: str
+    run: Callable[[PipelineContext], Union[Any, Awaitable[Any]]]
+    requires: Tuple[str, ...] = ()
+    restore: Optional[Callable[[PipelineContext, Any], bool]] = None
+    annotate: Optional[Callable[[PipelineRun, Any], None]] = None
+    timeout: Union[float, Callable[[PipelineContext], float], None] = None
+
+    def budget(self, ctx: PipelineContext) -> float:
+        if self.timeout is None:
+            return settings.PIPELINE_STAGE_TIMEOUT_SECONDS
+        if callable(self.timeout):
+            return self.timeout(ctx)
+        return self.timeout
+
+    async def __call__(self, ctx: PipelineContext) -> Any:
+        if asyncio.iscoroutinefunction(self.run):
+            work = self.run(ctx)
+        else:
+            work = asyncio.to_thread(self.run, ctx)
+        timeout = self.budget(ctx)
+        try:
+            return await asyncio.wait_for(work, timeout)
+        except asyncio.TimeoutError:
+            raise StageTimeoutError(self.name, timeout) from None
+
+
+def critical_path(
+    stages: Tuple[Stage, ...], timings: Dict[str, Dict[str, float]]
+) -> List[str]:
+    """The chain of stages that determined how long an attempt took
+
+    Starts from the stage that finished last and follows, at each step, the
+    requirement that finished last, i.e. the one the stage waited for.
+    Stages without timings (restored from a checkpoint) end the chain.
+    """
+    requires = {stage.name: stage.requires for stage in stages}
+    path: List[str] = []
+    current = max(timings, key=lambda name: timings[name]["end"], default=None)
+    while current is not None:
+        path.append(current)
+        waited_on = [name for name in requires.get(current, ()) if name in timings]
+        current = max(
+            waited_on, key=lambda name: timings[name]["end"], default=None
+        )
+    return list(reversed(path))
+
+
+async def acknowledge(ctx: PipelineContext) -> Dict[str, Any]:
+    # A template, so the requester hears back without waiting on the LLM
+    thread_id = await ctx.status.send(
+        "received", {"user_request": ctx.event.user_request}, ResponseType.INITIAL
+    )
+    return {"thread_id": thread_id}
+
+
+async def select_command(ctx: PipelineContext) -> Dict[str, Any]:
+    selector = ctx.services.command_selector
+    command, args = await selector.select_and_prepare_command(ctx.event)
+    repo_url = ctx.event.payload.get("url")
+    if ctx.services.predictor is not None and repo_url:
+        # Teaches speculative preparation which image to build next time
+        await asyncio.to_thread(
+            ctx.services.predictor.record, repo_url, command.metadata.name
+        )
+    return {"command": command.metadata.name, "args": args}
+
+
+async def announce(ctx: PipelineContext) -> Dict[str, Any]:
+    # Replaces the acknowledgement, so the requester sees what will run
+    thread_id = await ctx.status.send(
+        "selected",
+        {
+            "user_request": ctx.event.user_request,
+            "command_name": ctx.outputs["select_command"]["command"],
+        },
+        ResponseType.UPDATE,
+        thread_id=ctx.outputs["acknowledge"]["thread_id"],
+    )
+    return {"thread_id": thread_id}
+
+
+def annotate_command(run: PipelineRun, output: Dict[str, Any]) -> None:
+    run.command = output["command"]
+
+
+def clone(ctx: PipelineContext) -> Dict[str, Any]:
+    repo_url = ctx.event.payload.get("url")
+    if not repo_url:
+        raise PipelineError("Event has no repository to work on")
+    mirror = None
+    if ctx.services.mirrors is not None:
+        mirror = ctx.services.mirrors.get(repo_url)
+        metrics.increment(
+            "workspace_speculation_total",
+            resource="clone",
+            outcome="hit" if mirror else "miss",
+        )
+    work_dir = ctx.git.clone_repo(
+        repo_url,
+        branch=ctx.default_branch,
+        github_token=ctx.services.github_token,
+        reference=mirror,
+    )
+    return {"work_dir": str(work_dir)}
+
+
+def restore_clone(ctx: PipelineContext, output: Dict[str, Any]) -> bool:
+    work_dir = Path(output["work_dir"])
+    if not (work_dir / ".git").exists():
+        return False
+    ctx.git.open_repo(work_dir)
+    return True
+
+
+def build_image(ctx: PipelineContext) -> Dict[str, Any]:
+    # A hit means the image was prepared speculatively or by an earlier run
+    image_id = ctx.environment.cached_image(ctx.command)
+    metrics.increment(
+        "workspace_speculation_total",
+        resource="image",
+        outcome="hit" if image_id else "miss",
+    )
+    return {"image_id": image_id or ctx.environment.build_image(ctx.command)}
+
+
+def restore_image(ctx: PipelineContext, output: Dict[str, Any]) -> bool:
+    return ctx.environment.has_image(output["image_id"])
+
+
+def build_container(ctx: PipelineContext) -> Dict[str, Any]:
+    ctx.environment.work_dir = ctx.git.work_dir
+    ctx.environment.setup_container(
+        ctx.command,
+        name=f"repopal-{ctx.run_id}",
+        image=ctx.outputs["build_image"]["image_id"],
+    )
+    return {"container_id": ctx.environment.container.id}
+
+
+def restore_container(ctx: PipelineContext, output: Dict[str, Any]) -> bool:
+    if ctx.git.work_dir is None:
+        return False
+    ctx.environment.work_dir = ctx.git.work_dir
+    return ctx.environment.attach_container(output["container_id"])
+
+
+EXECUTE_TIMEOUT_GRACE_SECONDS = 60
+
+
+async def execute(ctx: PipelineContext) -> CommandResult:
+    config = EnvironmentConfig(
+        repo_url=ctx.event.payload["url"], branch=ctx.default_branch
+    )
+    result = await ctx.environment.execute_command(
+        ctx.command, ctx.outputs["select_command"]["args"], config
+    )
+    if result.timed_out:
+        # Whatever it left in the workspace is half-done; don't push it
+        raise StageTimeoutError("execute", ctx.command.budget.wall_clock_seconds)
+    if not result.success:
+        # Nothing to summarize, commit or open a pull request for
+        raise CommandFailedError(ctx.command.metadata.name, result.error or result.message)
+    return result
+
+
+def execute_timeout(ctx: PipelineContext) -> float:
+    """The command's own budget, plus slack for its watchdog to act first"""
+    return ctx.command.budget.wall_clock_seconds + EXECUTE_TIMEOUT_GRACE_SECONDS
+
+
+def diff(ctx: PipelineContext) -> RepositoryChanges:
+    result: CommandResult = ctx.outputs["execute"]
+    if result.changes is not None:
+        return result.changes
+    return ctx.environment.get_repository_changes()
+
+
+async def summarize(ctx: PipelineContext) -> str:
+    result: CommandResult = ctx.outputs["execute"]
+    if ctx.services.summarizer is not None:
+        summarize_changes = ctx.services.summarizer.summarize
+    else:
+        summarize_changes = ctx.services.llm.generate_change_summary
+    return await summarize_changes(
+        ctx.event.user_request,
+        ctx.outputs["select_command"]["command"],
+        result.output or result.error,
+        ctx.outputs["diff"],
+    )
+
+
+def _has_changes(changes: RepositoryChanges) -> bool:
+    return bool(changes.tracked_changes or changes.untracked_changes)
+
+
+def _prepare_commit(ctx: PipelineContext) -> Optional[str]:
+    """Get the workspace ready to commit; returns the sha if already committed"""
+    repo = ctx.git.repo
+    dirty = repo.is_dirty(untracked_files=True)
+    if (
+        not dirty
+        and not repo.head.is_detached
+        and repo.active_branch.name == ctx.branch_name
+    ):
+        # An earlier attempt committed but failed to push
+        return repo.head.commit.hexsha
+    if not dirty:
+        # Fresh clone on retry: replay the command's output, don't re-run it
+        ctx.git.apply_changes(ctx.outputs["diff"])
+    return None
+
+
+def _commit(ctx: PipelineContext, message: str) -> str:
+    ctx.git.create_branch(ctx.branch_name)
+    return ctx.git.commit_changes(message)
+
+
+async def commit_push(ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+    changes: RepositoryChanges = ctx.outputs["diff"]
+    if not _has_changes(changes):
+        return None
+
+    branch = ctx.branch_name
+    commit_sha = await asyncio.to_thread(_prepare_commit, ctx)
+    if commit_sha is None:
+        message = await ctx.services.llm.generate_commit_message(
+            ctx.event.user_request,
+            ctx.outputs["select_command"]["command"],
+            ctx.outputs["summarize"],
+        )
+        commit_sha = await asyncio.to_thread(_commit, ctx, message)
+
+    remote_sha = await asyncio.to_thread(ctx.git.remote_branch_sha, branch)
+    if remote_sha != commit_sha:
+        # The branch belongs to this run, so another commit there is from an
+        # earlier attempt; the lease rejects anything pushed since we looked
+        await asyncio.to_thread(
+            ctx.git.push_changes, branch, expected_sha=remote_sha or ""
+        )
+    return {"branch": branch, "commit_sha": commit_sha}
+
+
+async def create_pr(ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+    pushed = ctx.outputs["commit_push"]
+    if pushed is None:
+        return None
+
+    description = await ctx.services.llm.generate_pr_description(
+        ctx.event.user_request,
+        ctx.outputs["select_command"]["command"],
+        ctx.outputs["summarize"],
+    )
+    pull = await asyncio.to_thread(
+        ctx.services.pull_requests.create_or_get,
+        ctx.event.payload["repository"],
+        pushed["branch"],
+        title=description["title"],
+        body=description["body"],
+        base=ctx.default_branch,
+    )
+    return {"number": pull.number, "url": pull.html_url}
+
+
+def annotate_pull_request(run: PipelineRun, output: Optional[Dict[str, Any]]) -> None:
+    run.pull_request_url = output["url"] if output else None
+
+
+async def answer(ctx: PipelineContext) -> str:
+    return await ctx.services.llm.answer_question(ctx.event.user_request)
+
+
+async def notify(ctx: PipelineContext) -> Dict[str, Any]:
+    # Interactive jobs without a repository reply with an answer instead
+    summary = ctx.outputs.get("summarize") or ctx.outputs["answer"]
+    context = {"user_request": ctx.event.user_request, "changes_summary": summary}
+    message = render_status_message("completed", context)
+    pull = ctx.outputs.get("create_pr")  # Interactive jobs open none
+    if pull:
+        message += f"\n\nPull request: {pull['url']}"
+    thread_id = await ctx.status.send(
+        "completed",
+        context,
+        ResponseType.FINAL,
+        # Update the acknowledgement rather than posting a second reply
+        thread_id=ctx.outputs["acknowledge"]["thread_id"],
+        message=message,
+        # The summary is the LLM's already, and a rewrite would drop the link
+        enrich=False,
+    )
+    return {"thread_id": thread_id}
+
+
+# Every stage comes after the stages it requires. acknowledge, select_command
+# and clone start together; announce and build_image overlap with the rest
+# of the clone.
+DEFAULT_STAGES: Tuple[Stage, ...] = (
+    Stage("acknowledge", acknowledge),
+    Stage("select_command", select_command, annotate=annotate_command),
+    Stage("announce", announce, requires=("acknowledge", "select_command")),
+    Stage("clone", clone, restore=restore_clone),
+    Stage(
+        "build_image",
+        build_image,
+        requires=("select_command",),
+        restore=restore_image,
+        timeout=settings.PIPELINE_BUILD_TIMEOUT_SECONDS,
+    ),
+    Stage(
+        "build_container",
+        build_container,
+        requires=("select_command", "clone", "build_image"),
+        restore=restore_container,
+    ),
+    Stage(
+        "execute",
+        execute,
+        requires=("select_command", "clone", "build_container"),
+        timeout=execute_timeout,
+    ),
+    Stage("diff", diff, requires=("execute",)),
+    Stage("summarize", summarize, requires=("select_command", "execute", "diff")),
+    Stage(
+        "commit_push",
+        commit_push,
+        requires=("select_command", "clone", "diff", "summarize"),
+    ),
+    Stage(
+        "create_pr",
+        create_pr,
+        requires=("select_command", "summarize", "commit_push"),
+        annotate=annotate_pull_request,
+    ),
+    Stage(
+        "notify",
+        notify,
+        requires=("acknowledge", "announce", "summarize", "create_pr"),
+    ),
+)
+
+# Interactive jobs without a repository (e.g. a Slack question) are answered
+# by the LLM directly: with no repository there is nothing for a command to
+# work on, so no image, container, clone, push or pull request either.
+INTERACTIVE_STAGES: Tuple[Stage, ...] = (
+    Stage("acknowledge", acknowledge),
+    Stage("answer", answer),
+    Stage("notify", notify, requires=("acknowledge", "answer")),
+)
+
+
+class PipelineRunner:
+    """Creates pipeline runs and executes them stage by stage
+
+    A run may be started while PENDING, RETRYING, or RUNNING for longer than
+    ``stale_after`` (its worker died without acknowledging the task). Each
+    attempt skips stages that already have a checkpoint, restores the
+    worker-local state later stages need, and runs the rest concurrently,
+    each as soon as the stages it requires have finished.
+
+    With ``leases``, runs on the same repository take turns: an attempt
+    holds the repository's lease throughout, and one that cannot get it
+    raises RepositoryBusyError without starting so it can be re-enqueued.
+
+    With ``cancellations``, a running attempt polls for a cancellation of
+    its subject. When one arrives the container is killed at once, no
+    further stage starts, the workspace is removed and the run is CANCELLED.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        services: Optional[PipelineServices] = None,
+        stages: Tuple[Stage, ...] = DEFAULT_STAGES,
+        interactive_stages: Tuple[Stage, ...] = INTERACTIVE_STAGES,
+        claim_check: Optional[ClaimCheck] = None,
+        max_attempts: Optional[int] = None,
+        stale_after: Optional[timedelta] = None,
+        leases: Optional[RepositoryLeases] = None,
+        cancellations: Optional[CancellationRegistry] = None,
+    ):
+        for stage_set in (stages, interactive_stages):
+            seen: Set[str] = set()
+            for stage in stage_set:
+                missing = set(stage.requires) - seen
+                if missing:
+                    raise ValueError(
+                        f"Stage {stage.name} requires {sorted(missing)}, "
+                        "which must come before it"
+                    )
+                seen.add(stage.name)
+
+        self.db = db
+        self.services = services
+        self.stages = stages
+        self.interactive_stages = interactive_stages
+        self.claim_check = claim_check or get_claim_check()
+        self.max_attempts = max_attempts or settings.PIPELINE_MAX_ATTEMPTS
+        self.stale_after = stale_after or timedelta(
+            seconds=settings.PIPELINE_STALE_SECONDS
+        )
+        self.leases = leases
+        self.cancellations = cancellations
+        self.repository = PipelineRunRepository()
+        self.logger = logging.getLogger(__name__)
+
+    def create(
+        self,
+        event: StandardizedEvent,
+        delivery_id: Optional[str] = None,
+        subject: Optional[str] = None,
+    ) -> PipelineRun:
+        """Persist a new run for an event
+
+        ``subject`` is the delivery's subject key (e.g. ``org/repo#42``),
+        through which the run can be cancelled.
+        """
+        run = PipelineRun(
+            delivery_id=delivery_id,
+            provider=event.provider,
+            event_type=event.event_type,
+            job_class=classify_event(event).value,
+            organization=organization_of(event),
+            repository=event.payload.get("repository"),
+            subject=subject,
+            event=self.claim_check.check_in(event),
+            status=PipelineStatus.PENDING,
+            checkpoints={},
+            attempts=0,
+        )
+        return self.repository.add(self.db, run)
+
+    def get(self, run_id: str) -> PipelineRun:
+        run = self.repository.get(self.db, id=uuid.UUID(str(run_id)))
+        if run is None:
+            raise PipelineNotFoundError(str(run_id))
+        return run
+
+    def _transition(self, run: PipelineRun, status: PipelineStatus) -> None:
+        if status not in PIPELINE_TRANSITIONS[run.status]:
+            raise PipelineStateError(
+                f"Pipeline {run.id} cannot go from {run.status.value} to {status.value}"
+            )
+        run.status = status
+        if not PIPELINE_TRANSITIONS[status]:
+            run.finished_at = datetime.utcnow()
+            if run.started_at is not None:
+                run.duration_seconds = (
+                    run.finished_at - run.started_at
+                ).total_seconds()
+        self.db.commit()
+
+    def start(self, run_id: str) -> PipelineRun:
+        """Atomically claim a run for this worker
+
+        Raises:
+            PipelineNotFoundError: If there is no such run
+            PipelineStateError: If the run is finished or another worker has it
+        """
+        run = self.get(run_id)
+        stale_before = datetime.utcnow() - self.stale_after
+        claimed = (
+            self.db.query(PipelineRun)
+            .filter(
+                PipelineRun.id == run.id,
+                (
+                    PipelineRun.status.in_(
+                        [PipelineStatus.PENDING, PipelineStatus.RETRYING]
+                    )
+                )
+                | (
+                    (PipelineRun.status == PipelineStatus.RUNNING)
+                    & (PipelineRun.updated_at < stale_before)
+                ),
+            )
+            .update(
+                {
+                    PipelineRun.status: PipelineStatus.RUNNING,
+                    PipelineRun.attempts: PipelineRun.attempts + 1,
+                    PipelineRun.started_at: func.coalesce(
+                        PipelineRun.started_at, datetime.utcnow()
+                    ),
+                    PipelineRun.updated_at: datetime.utcnow(),
+                },
+                synchronize_session=False,
+            )
+        )
+        self.db.commit()
+        self.db.refresh(run)
+        if not claimed:
+            raise PipelineStateError(
+                f"Pipeline {run.id} is {run.status.value} and cannot be started"
+            )
+        return run
+
+    def stages_for(self, run: PipelineRun) -> Tuple[Stage, ...]:
+        """The stages a run goes through
+
+        Interactive jobs with no repository skip everything that needs one.
+        """
+        if run.job_class == JobClass.INTERACTIVE.value and not run.repository:
+            return self.interactive_stages
+        return self.stages
+
+    def _plan(self, run: PipelineRun, ctx: PipelineContext) -> Set[str]:
+        """Work out which stages this attempt has to run
+
+        Stages without a checkpoint run. Their checkpointed requirements are
+        loaded, and worker-local ones restored; a requirement that cannot be
+        restored runs again too.
+        """
+        stages = self.stages_for(run)
+        by_name = {stage.name: stage for stage in stages}
+        checkpoints = run.checkpoints or {}
+        to_run = {stage.name for stage in stages if stage.name not in checkpoints}
+        available: Set[str] = set()
+
+        changed = True
+        while changed:
+            changed = False
+            for stage in stages:
+                if stage.name not in to_run:
+                    continue
+                for name in stage.requires:
+                    if name in to_run or name in available:
+                        continue
+                    output = self.claim_check.check_out(checkpoints[name])
+                    ctx.outputs[name] = output
+                    restore = by_name[name].restore
+                    if restore is None or restore(ctx, output):
+                        available.add(name)
+                    else:
+                        self.logger.info(f"Pipeline {run.id}: re-running {name}")
+                        to_run.add(name)
+                        changed = True
+        return to_run
+
+    def _checkpoint(self, run: PipelineRun, stage: str, output: Any) -> None:
+        envelope = self.claim_check.check_in(output)
+        # Reassign so SQLAlchemy notices the JSON column changed
+        run.checkpoints = {**(run.checkpoints or {}), stage: envelope}
+        self.db.commit()
+
+    async def _run_stages(
+        self,
+        run: PipelineRun,
+        ctx: PipelineContext,
+        to_run: Set[str],
+        timings: Dict[str, Dict[str, float]],
+    ) -> None:
+        """Run stages as their requirements finish, checkpointing each one
+
+        After a failure no new stage starts, but the ones already running
+        are allowed to finish and are checkpointed, so the retry does not
+        repeat them. The first failure is then raised.
+
+        Once ``ctx.cancelled`` is set nothing else is waited for: stages still
+        running are abandoned and PipelineCancelledError is raised.
+        """
+        stages = self.stages_for(run)
+        waiting = [stage for stage in stages if stage.name in to_run]
+        running: Dict[asyncio.Task, Stage] = {}
+        records: Dict[str, PipelineStageRun] = {}
+        done: Set[str] = {stage.name for stage in stages} - to_run
+        failure: Optional[Tuple[Stage, Exception]] = None
+        origin = time.perf_counter()
+        cancelled = asyncio.ensure_future(ctx.cancelled.wait())
+
+        while (waiting or running) and not ctx.cancelled.is_set():
+            ready = [s for s in waiting if done.issuperset(s.requires)]
+            if failure is None and ready:
+                for stage in ready:
+                    waiting.remove(stage)
+                    timings[stage.name] = {"start": time.perf_counter() - origin}
+                    records[stage.name] = PipelineStageRun(
+                        stage=stage.name,
+                        attempt=run.attempts,
+                        status=StageStatus.RUNNING,
+                        started_at=datetime.utcnow(),
+                    )
+                    run.stages.append(records[stage.name])
+                    running[asyncio.ensure_future(stage(ctx))] = stage
+                    run.current_stage = stage.name
+                self.db.commit()
+            if not running:
+                break
+
+            finished, _ = await asyncio.wait(
+                [*running, cancelled], return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in finished:
+                if task is cancelled:
+                    continue
+                stage = running.pop(task)
+                timing = timings[stage.name]
+                timing["end"] = time.perf_counter() - origin
+                record = records[stage.name]
+                record.finished_at = datetime.utcnow()
+                record.duration_seconds = timing["end"] - timing["start"]
+                metrics.observe(
+                    "pipeline_stage_seconds", record.duration_seconds, stage=stage.name
+                )
+                if ctx.cancelled.is_set():
+                    # Its result may be an artifact of the killed container
+                    record.status = StageStatus.CANCELLED
+                    continue
+                if task.exception() is not None:
+                    error = task.exception()
+                    record.status = StageStatus.FAILED
+                    record.error = str(error)
+                    if isinstance(error, StageTimeoutError):
+                        record.status = StageStatus.TIMED_OUT
+                        metrics.increment("pipeline_stage_timeouts_total", stage=stage.name)
+                        # Its thread may still be blocked on the container
+                        await asyncio.to_thread(ctx.kill_container)
+                    failure = failure or (stage, error)
+                    continue
+                record.status = StageStatus.SUCCEEDED
+                if stage.annotate is not None:
+                    stage.annotate(run, task.result())
+                ctx.outputs[stage.name] = task.result()
+                self._checkpoint(run, stage.name, task.result())
+                done.add(stage.name)
+
+        cancelled.cancel()
+        if ctx.cancelled.is_set():
+            # Stages still running are abandoned: the container is already
+            # killed, and threads left behind only touch the workspace
+            for task, stage in running.items():
+                task.cancel()
+                records[stage.name].status = StageStatus.CANCELLED
+                records[stage.name].finished_at = datetime.utcnow()
+            await asyncio.gather(*running, return_exceptions=True)
+            self.db.commit()
+            raise PipelineCancelledError(
+                f"Pipeline {run.id} cancelled at {run.current_stage}"
+            )
+        if failure is not None:
+            stage, error = failure
+            run.current_stage = stage.name
+            self.db.commit()
+            raise error
+
+    def _record_timings(
+        self, run: PipelineRun, timings: Dict[str, Dict[str, float]]
+    ) -> None:
+        run.stage_timings = {
+            name: {key: round(value, 3) for key, value in timing.items()}
+            for name, timing in timings.items()
+            if "end" in timing
+        }
+        run.critical_path = critical_path(self.stages_for(run), run.stage_timings)
+        if run.critical_path:
+            elapsed = run.stage_timings[run.critical_path[-1]]["end"]
+            metrics.observe("pipeline_attempt_seconds", elapsed)
+            self.logger.info(
+                f"Pipeline {run.id} attempt {run.attempts} took {elapsed:.1f}s; "
+                f"critical path: {' -> '.join(run.critical_path)}"
+            )
+
+    async def _keep_lease(self, lease: Lease) -> None:
+        while True:
+            await asyncio.sleep(self.leases.ttl_seconds / 3)
+            if not self.leases.renew(lease):
+                self.logger.warning(f"Lost the lease on {lease.repository}")
+
+    def _is_cancelled(self, run: PipelineRun) -> bool:
+        return self.cancellations is not None and self.cancellations.is_cancelled(
+            run.provider, run.subject, run.created_at
+        )
+
+    async def _watch_cancellation(self, run: PipelineRun, ctx: PipelineContext) -> None:
+        provider, subject, created_at = run.provider, run.subject, run.created_at
+        while not ctx.cancelled.is_set():
+            await asyncio.sleep(settings.PIPELINE_CANCEL_POLL_SECONDS)
+            if await asyncio.to_thread(
+                self.cancellations.is_cancelled, provider, subject, created_at
+            ):
+                ctx.cancelled.set()
+                # Free the container's capacity now, not at the stage boundary
+                await asyncio.to_thread(ctx.kill_container)
+
+    async def _report(self, run: PipelineRun, ctx: PipelineContext, stage: str) -> None:
+        """Tell the requester a run ended without a result
+
+        The message replaces the acknowledgement if there was one, like the
+        final summary would have. Failing to send it does not change the run.
+        """
+        acknowledgement = ctx.outputs.get("acknowledge")
+        if acknowledgement is None and "acknowledge" in (run.checkpoints or {}):
+            acknowledgement = self.claim_check.check_out(run.checkpoints["acknowledge"])
+        try:
+            await ctx.status.send(
+                stage,
+                {"user_request": ctx.event.user_request, "error": run.error},
+                ResponseType.FINAL,
+                thread_id=acknowledgement["thread_id"] if acknowledgement else None,
+                enrich=False,
+            )
+        except Exception as e:
+            self.logger.warning(f"Could not report pipeline {run.id} {stage}: {e}")
+
+    async def run(self, run_id: str) -> PipelineRun:
+        """Run (or resume) a pipeline until it completes or a stage fails
+
+        Returns the run, which is COMPLETED, FAILED, RETRYING if the failure
+        was transient and attempts remain, or CANCELLED.
+
+        Raises:
+            PipelineNotFoundError: If there is no such run
+            PipelineStateError: If the run cannot be started
+            RepositoryBusyError: If another run holds the repository's lease
+        """
+        run = self.get(run_id)
+        if not PIPELINE_TRANSITIONS[run.status]:
+            raise PipelineStateError(f"Pipeline {run.id} is {run.status.value}")
+        if run.status != PipelineStatus.RUNNING and self._is_cancelled(run):
+            # Cancelled while queued or waiting to retry
+            run.error = "Cancelled before it started"
+            self._transition(run, PipelineStatus.CANCELLED)
+            ctx = PipelineContext(
+                str(run.id), self.claim_check.check_out(run.event), self.services
+            )
+            await self._report(run, ctx, "cancelled")
+            ctx.close()
+            return run
+        if self.leases is None or not run.repository:
+            return await self._run(run_id)
+
+        lease = self.leases.acquire(
+            run.repository, str(run.id), order=run.created_at.timestamp()
+        )
+        if lease is None:
+            raise RepositoryBusyError(run.repository)
+        heartbeat = asyncio.ensure_future(self._keep_lease(lease))
+        try:
+            return await self._run(run_id)
+        finally:
+            heartbeat.cancel()
+            self.leases.release(lease)
+
+    async def _run(self, run_id: str) -> PipelineRun:
+        run = self.start(run_id)
+        event = self.claim_check.check_out(run.event)
+        ctx = PipelineContext(str(run.id), event, self.services)
+
+        timings: Dict[str, Dict[str, float]] = {}
+        watcher = None
+        if self.cancellations is not None and run.subject:
+            watcher = asyncio.ensure_future(self._watch_cancellation(run, ctx))
+        try:
+            to_run = self._plan(run, ctx)
+            skipped = len(self.stages_for(run)) - len(to_run)
+            if skipped:
+                metrics.increment("pipeline_stages_skipped_total", skipped)
+            await self._run_stages(run, ctx, to_run, timings)
+        except PipelineCancelledError as e:
+            self.logger.info(str(e))
+            self.db.rollback()
+            self._record_timings(run, timings)
+            run.error = str(e)
+            self._transition(run, PipelineStatus.CANCELLED)
+            metrics.increment("pipeline_cancelled_total", stage=run.current_stage)
+            await self._report(run, ctx, "cancelled")
+            ctx.close()
+            return run
+        except Exception as e:
+            retry = is_transient_error(e) and run.attempts < self.max_attempts
+            self.logger.exception(
+                f"Pipeline {run.id} failed at {run.current_stage} "
+                f"(attempt {run.attempts}, {'will retry' if retry else 'giving up'})"
+            )
+            self.db.rollback()
+            self._record_timings(run, timings)
+            run.error = f"{run.current_stage}: {e}"
+            self._transition(
+                run, PipelineStatus.RETRYING if retry else PipelineStatus.FAILED
+            )
+            metrics.increment(
+                "pipeline_stage_failures_total",
+                stage=run.current_stage,
+                retry=str(retry).lower(),
+            )
+            if not retry:
+                await self._report(run, ctx, "failed")
+            ctx.close(keep_workspace=retry)
+            return run
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+        run.current_stage = None
+        run.error = None
+        self._record_timings(run, timings)
+        self._transition(run, PipelineStatus.COMPLETED)
+        ctx.close()
+        return run
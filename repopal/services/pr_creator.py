@@ -0,0 +1,45 @@
+import logging
+from typing import Optional
+
+from github import Github
+from github.PullRequest import PullRequest
+
+
+class PullRequestCreator:
+    """Opens pull requests for branches pushed by RepoPal"""
+
+    def __init__(self, github: Github):
+        self.github = github
+        self.logger = logging.getLogger(__name__)
+
+    def find_open(self, repo_full_name: str, branch_name: str) -> Optional[PullRequest]:
+        """Return the open pull request for a branch, if there is one"""
+        repo = self.github.get_repo(repo_full_name)
+        owner = repo_full_name.split("/")[0]
+        pulls = repo.get_pulls(state="open", head=f"{owner}:{branch_name}")
+        return next(iter(pulls), None)
+
+    def create_or_get(
+        self,
+        repo_full_name: str,
+        branch_name: str,
+        title: str,
+        body: str,
+        base: Optional[str] = None,
+    ) -> PullRequest:
+        """Create a pull request for a branch, or return the one already open
+
+        Safe to call again after a failure, e.g. when the pull request was
+        created but the response was lost.
+        """
+        existing = self.find_open(repo_full_name, branch_name)
+        if existing:
+            self.logger.info(f"Pull request already open for {branch_name}")
+            return existing
+
+        repo = self.github.get_repo(repo_full_name)
+        pull = repo.create_pull(
+            base=base or repo.default_branch, head=branch_name, title=title, body=body
+        )
+        self.logger.info(f"Created pull request {pull.html_url}")
+        return pull
@@ -0,0 +1,236 @@
+"""Per-tenant admission control for webhook ingest"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+import redis
+
+from repopal.core.config import settings
+from repopal.core.metrics import metrics
+from repopal.core.redis import get_redis
+from repopal.schemas.service_handler import ServiceProvider
+
+# Token bucket that may go into debt by up to ARGV[3] tokens. Within the
+# burst an event is admitted; borrowing from the future defers it until its
+# token would have been refilled; beyond the debt limit it is shed.
+# Returns {0 admit | 1 defer | 2 shed, seconds to wait as a string}
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_debt = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+
+local action = 0
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+elseif tokens - 1 >= -max_debt then
+    tokens = tokens - 1
+    action = 1
+    wait = -tokens / rate
+else
+    action = 2
+    wait = (1 - max_debt - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((burst + max_debt) / rate) + 60)
+return {action, tostring(wait)}
+"""
+
+
+class AdmissionAction(str, Enum):
+    """What to do with an event from a tenant"""
+
+    ADMIT = "admit"
+    DEFER = "defer"  # Queue at low priority, once the tenant's bucket refills
+    SHED = "shed"  # Reject; the tenant is over its limit and its backlog is full
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Intake limit for one tenant (a GitHub installation or Slack workspace)
+
+    ``per_minute`` of 0 disables limiting. ``max_deferred`` is how many
+    events over the limit may be deferred before further events are shed;
+    0 sheds everything over the limit straight away.
+    """
+
+    per_minute: float
+    burst: int
+    max_deferred: int = 0
+
+    @classmethod
+    def from_settings(
+        cls, connection_settings: Mapping[str, Any], default: "RateLimit"
+    ) -> "RateLimit":
+        """Read a ``rate_limit`` override from ``ServiceConnection.settings``
+
+        e.g. ``{"rate_limit": {"per_minute": 30, "burst": 10, "max_deferred": 50}}``;
+        missing fields fall back to the default limit.
+        """
+        overrides = connection_settings.get("rate_limit") or {}
+        return cls(
+            per_minute=float(overrides.get("per_minute", default.per_minute)),
+            burst=int(overrides.get("burst", default.burst)),
+            max_deferred=int(overrides.get("max_deferred", default.max_deferred)),
+        )
+
+
+@dataclass(frozen=True)
+class Admission:
+    """Outcome of an admission check"""
+
+    action: AdmissionAction
+    retry_after: float = 0.0  # Seconds to defer by, or until the tenant may retry
+
+
+# Indexed by the action code TOKEN_BUCKET_SCRIPT returns
+SCRIPT_ACTIONS = (AdmissionAction.ADMIT, AdmissionAction.DEFER, AdmissionAction.SHED)
+
+TenantKey = Tuple[ServiceProvider, str]
+
+
+def load_connection_limits(default: RateLimit) -> Dict[TenantKey, RateLimit]:
+    """Read per-tenant limits from the active service connections"""
+    # Imported here so ingest does not depend on the connection models
+    from repopal.core.database import SessionLocal
+    from repopal.models.service_connection import ServiceType
+    from repopal.repositories.service_connections import ServiceConnectionRepository
+
+    tenant_settings = {
+        ServiceType.GITHUB_APP: (ServiceProvider.GITHUB, "installation_id"),
+        ServiceType.SLACK: (ServiceProvider.SLACK, "team_id"),
+    }
+    db = SessionLocal()
+    try:
+        limits = {}
+        for connection in ServiceConnectionRepository().get_active_connections(db):
+            provider, id_setting = tenant_settings.get(
+                connection.service_type, (None, None)
+            )
+            connection_settings = connection.settings or {}
+            tenant_id = connection_settings.get(id_setting)
+            if provider is None or tenant_id is None:
+                continue
+            limits[(provider, str(tenant_id))] = RateLimit.from_settings(
+                connection_settings, default
+            )
+        return limits
+    finally:
+        db.close()
+
+
+class RateLimitResolver:
+    """Looks up each tenant's limit, caching connection settings in-process
+
+    The table of overrides is reloaded at most every ``ttl_seconds``, so
+    ingest does not query the database for every delivery. If it cannot be
+    loaded, every tenant gets the default limit.
+    """
+
+    def __init__(
+        self,
+        default: RateLimit,
+        loader: Callable[
+            [RateLimit], Dict[TenantKey, RateLimit]
+        ] = load_connection_limits,
+        ttl_seconds: float = 60,
+    ):
+        self.default = default
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self.logger = logging.getLogger(__name__)
+        self._limits: Dict[TenantKey, RateLimit] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def limit_for(self, provider: ServiceProvider, tenant_id: str) -> RateLimit:
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded_at is None or now - self._loaded_at >= self.ttl_seconds:
+                try:
+                    self._limits = self.loader(self.default)
+                except Exception as e:
+                    self.logger.warning(f"Rate limit overrides unavailable: {e}")
+                self._loaded_at = now
+            return self._limits.get((provider, tenant_id), self.default)
+
+
+class TenantRateLimiter:
+    """Redis token buckets keyed by GitHub installation or Slack workspace
+
+    Keeps one noisy repository or workspace from flooding the worker pool
+    and starving everyone else of Docker and LLM capacity.
+    """
+
+    KEY_PREFIX = "repopal:ratelimit"
+
+    def __init__(self, redis_client: redis.Redis, resolver: RateLimitResolver):
+        self.redis = redis_client
+        self.resolver = resolver
+        self.logger = logging.getLogger(__name__)
+        self._take = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def _key(self, provider: ServiceProvider, tenant_id: str) -> str:
+        return f"{self.KEY_PREFIX}:{provider.value}:{tenant_id}"
+
+    def admit(self, provider: ServiceProvider, tenant_id: Optional[str]) -> Admission:
+        """Take a token for one event from the tenant's bucket"""
+        if not tenant_id:
+            return Admission(AdmissionAction.ADMIT)
+        limit = self.resolver.limit_for(provider, tenant_id)
+        if limit.per_minute <= 0:
+            return Admission(AdmissionAction.ADMIT)
+
+        try:
+            action, wait = self._take(
+                keys=[self._key(provider, tenant_id)],
+                args=[
+                    limit.per_minute / 60,
+                    max(limit.burst, 1),
+                    limit.max_deferred,
+                    time.time(),
+                ],
+            )
+        except redis.RedisError as e:
+            # Fail open: an unlimited tenant beats dropping everyone's events
+            self.logger.warning(f"Rate limiting unavailable: {e}")
+            return Admission(AdmissionAction.ADMIT)
+
+        admission = Admission(action=SCRIPT_ACTIONS[int(action)], retry_after=float(wait))
+        metrics.increment(
+            "webhook_admissions_total",
+            provider=provider.value,
+            action=admission.action.value,
+        )
+        return admission
+
+
+@lru_cache
+def get_rate_limit_resolver() -> RateLimitResolver:
+    return RateLimitResolver(
+        RateLimit(
+            per_minute=settings.WEBHOOK_RATE_LIMIT_PER_MINUTE,
+            burst=settings.WEBHOOK_RATE_LIMIT_BURST,
+            max_deferred=settings.WEBHOOK_RATE_LIMIT_MAX_DEFERRED,
+        ),
+        ttl_seconds=settings.WEBHOOK_RATE_LIMIT_SETTINGS_TTL_SECONDS,
+    )
+
+
+def get_rate_limiter() -> Optional[TenantRateLimiter]:
+    """The per-tenant rate limiter, or None if admission control is disabled"""
+    if not settings.WEBHOOK_RATE_LIMIT_ENABLED:
+        return None
+    return TenantRateLimiter(get_redis(), get_rate_limit_resolver())
@@ -0,0 +1,172 @@
+"""Per-repository leases, so pipelines for one repository run one at a time"""
+
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+import redis
+
+from repopal.core.config import settings
+from repopal.core.metrics import metrics
+from repopal.core.redis import get_redis
+
+# Join the repository's waitlist (ordered by ARGV[2]) and take the lease if
+# it is free and we are first in line. Waiters that have not polled within
+# ARGV[5] seconds are dropped so a vanished job cannot block the line.
+# Returns 1 if the lease was taken, 0 otherwise.
+ACQUIRE_SCRIPT = """
+local member = ARGV[1]
+local now = tonumber(ARGV[4])
+local wait_ttl = tonumber(ARGV[5])
+
+redis.call('ZADD', KEYS[2], 'NX', ARGV[2], member)
+redis.call('ZADD', KEYS[3], now, member)
+for _, stale in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now - wait_ttl)) do
+    redis.call('ZREM', KEYS[2], stale)
+    redis.call('ZREM', KEYS[3], stale)
+end
+redis.call('EXPIRE', KEYS[2], math.ceil(wait_ttl) * 2)
+redis.call('EXPIRE', KEYS[3], math.ceil(wait_ttl) * 2)
+
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+if redis.call('ZRANGE', KEYS[2], 0, 0)[1] ~= member then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[3], 'PX', ARGV[6])
+redis.call('ZREM', KEYS[2], member)
+redis.call('ZREM', KEYS[3], member)
+return 1
+"""
+
+# Only the holder's token may extend or release a lease
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass(frozen=True)
+class Lease:
+    """A held repository lease; ``token`` identifies this holder"""
+
+    repository: str
+    token: str
+
+
+class RepositoryLeases:
+    """Distributed per-repository mutex with a FIFO waitlist in Redis
+
+    Jobs for the same repository take turns in the order they were created,
+    so they cannot race on the branch and push. A job that finds the lease
+    taken does not wait for it: the caller re-enqueues it and its worker
+    slot goes to another repository's job. The lease expires after
+    ``ttl_seconds`` unless renewed, so a crashed worker cannot hold it.
+    """
+
+    KEY_PREFIX = "repopal:repo-lease"
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        ttl_seconds: float = 600,
+        wait_ttl_seconds: float = 120,
+    ):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.wait_ttl_seconds = wait_ttl_seconds
+        self.logger = logging.getLogger(__name__)
+        self._acquire = self.redis.register_script(ACQUIRE_SCRIPT)
+        self._renew = self.redis.register_script(RENEW_SCRIPT)
+        self._release = self.redis.register_script(RELEASE_SCRIPT)
+
+    def _key(self, repository: str, part: str) -> str:
+        return f"{self.KEY_PREFIX}:{part}:{repository}"
+
+    def acquire(
+        self, repository: str, waiter: str, order: float
+    ) -> Optional[Lease]:
+        """Take the lease for ``waiter`` if it is free and ``waiter`` is next
+
+        Args:
+            repository: e.g. ``org/repo``
+            waiter: Stable ID of the job, the same on every attempt
+            order: Position in line; lower goes first (e.g. creation time)
+
+        Returns:
+            The lease, or None if another job holds it or is ahead in line.
+            If Redis is unavailable a lease is granted anyway (fail open);
+            pushes are still guarded by ``--force-with-lease``.
+        """
+        token = f"{waiter}:{uuid.uuid4().hex}"
+        try:
+            acquired = self._acquire(
+                keys=[
+                    self._key(repository, "holder"),
+                    self._key(repository, "queue"),
+                    self._key(repository, "seen"),
+                ],
+                args=[
+                    waiter,
+                    order,
+                    token,
+                    time.time(),
+                    self.wait_ttl_seconds,
+                    int(self.ttl_seconds * 1000),
+                ],
+            )
+        except redis.RedisError as e:
+            self.logger.warning(f"Repository leases unavailable: {e}")
+            return Lease(repository, token)
+
+        metrics.increment(
+            "repository_lease_attempts_total",
+            outcome="acquired" if acquired else "busy",
+        )
+        return Lease(repository, token) if acquired else None
+
+    def renew(self, lease: Lease) -> bool:
+        """Extend a held lease; False if it expired and may have a new holder"""
+        try:
+            return bool(
+                self._renew(
+                    keys=[self._key(lease.repository, "holder")],
+                    args=[lease.token, int(self.ttl_seconds * 1000)],
+                )
+            )
+        except redis.RedisError as e:
+            self.logger.warning(f"Could not renew lease on {lease.repository}: {e}")
+            return False
+
+    def release(self, lease: Lease) -> None:
+        try:
+            self._release(
+                keys=[self._key(lease.repository, "holder")], args=[lease.token]
+            )
+        except redis.RedisError as e:
+            # It expires on its own after ttl_seconds
+            self.logger.warning(f"Could not release lease on {lease.repository}: {e}")
+
+
+def get_repository_leases() -> Optional[RepositoryLeases]:
+    """Per-repository leases, or None if pipelines are not serialized"""
+    if not settings.REPO_LEASE_ENABLED:
+        return None
+    return RepositoryLeases(
+        get_redis(),
+        ttl_seconds=settings.REPO_LEASE_TTL_SECONDS,
+        # A waiter re-polls every REPO_LEASE_RETRY_SECONDS; allow for queueing
+        wait_ttl_seconds=settings.REPO_LEASE_RETRY_SECONDS * 8,
+    )
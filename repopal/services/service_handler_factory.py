@@ -24,6 +24,8 @@ class ServiceHandlerFactory:
 
     @classmethod
     def get_handler(cls, provider: ServiceProvider) -> ServiceHandler:
+        if not cls._handlers:
+            cls.initialize()
         if provider not in cls._handlers:
             raise KeyError(f"No handler registered for provider: {provider}")
         return cls._handlers[provider]
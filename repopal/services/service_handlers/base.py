@@ -1,8 +1,10 @@
+import hmac
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Mapping, Optional
 
-from repopal.schemas.service_handler import StandardizedEvent
+from repopal.schemas.service_handler import RouteKey, StandardizedEvent
+from repopal.utils.payloads import decode_body
 
 
 class ResponseType(Enum):
@@ -12,16 +14,103 @@ class ResponseType(Enum):
 
 
 class ServiceHandler(ABC):
+    # Status code used to acknowledge a delivery once it is safely queued
+    ack_status_code: int = 202
+
+    @abstractmethod
+    def start_signature(self, headers: Mapping[str, str]) -> Optional[hmac.HMAC]:
+        """
+        Begin verifying a webhook from its headers alone
+
+        Returns an HMAC primed with any provider-specific prefix, ready to be
+        fed the raw body as it arrives, or None if the request can be rejected
+        without reading the body (missing signature, stale timestamp, no
+        secret configured).
+        """
+        pass
+
+    @abstractmethod
+    def verify_signature(self, headers: Mapping[str, str], mac: hmac.HMAC) -> bool:
+        """Compare the HMAC of the full body against the request signature"""
+        pass
+
+    def validate_webhook(self, headers: Mapping[str, str], body: bytes) -> bool:
+        """Validate the webhook signature/authenticity against the raw body"""
+        mac = self.start_signature(headers)
+        if mac is None:
+            return False
+        mac.update(body)
+        return self.verify_signature(headers, mac)
+
+    def decode_payload(self, body: bytes, content_type: Optional[str]) -> Dict[str, Any]:
+        """Decode a verified raw body into the provider payload (JSON or form)"""
+        return decode_body(body, content_type)
+
+    def delivery_id(
+        self, headers: Mapping[str, str], payload: Dict[str, Any]
+    ) -> Optional[str]:
+        """Return the provider's unique ID for this delivery, if it sends one"""
+        return None
+
+    def subject_key(self, payload: Dict[str, Any]) -> Optional[str]:
+        """
+        Return a key for the thing this event is about (an issue, PR or
+        thread), used to coalesce bursts of related events
+        """
+        return None
+
+    def cancellation_subject(self, payload: Dict[str, Any]) -> Optional[str]:
+        """
+        Return the subject key whose runs this event cancels (e.g. its issue
+        was closed or its message deleted), or None if it cancels nothing
+        """
+        return None
+
+    def repository_url(self, payload: Dict[str, Any]) -> Optional[str]:
+        """
+        Return the URL of the repository a pipeline for this event would
+        clone, if it is known before processing, so it can be fetched early
+        """
+        return None
+
+    def tenant_id(self, payload: Dict[str, Any]) -> Optional[str]:
+        """
+        Return the ID of the installation or workspace that sent this event,
+        used to rate limit each tenant separately
+        """
+        return None
+
+    def immediate_response(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Return a body the provider expects synchronously (e.g. a handshake),
+        or None if the delivery should be queued for the worker
+        """
+        return None
+
     @abstractmethod
-    def validate_webhook(
-        self, headers: Dict[str, str], payload: Dict[str, Any]
-    ) -> bool:
-        """Validate the webhook signature/authenticity"""
+    def route_key(self, headers: Mapping[str, str], payload: Dict[str, Any]) -> RouteKey:
+        """Extract the routing facts for a delivery without building an event"""
         pass
 
     @abstractmethod
-    def process_webhook(self, payload: Dict[str, Any]) -> StandardizedEvent:
-        """Convert webhook payload to standardized event"""
+    def process_webhook(
+        self,
+        payload: Dict[str, Any],
+        raw_body: Optional[bytes] = None,
+        content_type: Optional[str] = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> StandardizedEvent:
+        """
+        Convert webhook payload to standardized event
+
+        Args:
+            payload: The decoded provider payload
+            raw_body: The original body bytes, kept on the event so it can
+                be serialized without re-encoding the payload
+            content_type: Content-Type of raw_body
+            headers: The delivery's headers, for providers that put the
+                event type there
+        """
         pass
 
     @abstractmethod
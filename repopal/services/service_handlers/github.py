@@ -1,62 +1,141 @@
 import hashlib
 import hmac
-import json
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Mapping, Optional
 
 from github import Github
 from github.GithubException import GithubException
 
 from repopal.core.config import settings
-from repopal.schemas.service_handler import ServiceProvider, StandardizedEvent
+from repopal.schemas.service_handler import (
+    RouteKey,
+    SenderType,
+    ServiceProvider,
+    StandardizedEvent,
+)
 
 from .base import ResponseType, ServiceHandler
 
 # TODO: need to handle app installation events (create service connection)
 
+# X-GitHub-Event names mapped onto our standardized event types
+GITHUB_EVENT_TYPES = {
+    "issues": "issue",
+    "issue_comment": "comment",
+    "pull_request_review_comment": "comment",
+    "pull_request": "pull_request",
+    "push": "push",
+}
+
 class GitHubHandler(ServiceHandler):
     def __init__(self, webhook_secret: str, github_token: Optional[str] = None):
         self.webhook_secret = webhook_secret
         self.github = Github(github_token or settings.GITHUB_TOKEN)
 
-    def validate_webhook(
-        self, headers: Dict[str, str], payload: Dict[str, Any]
-    ) -> bool:
-        if "X-Hub-Signature-256" not in headers:
-            return False
-
-        signature = headers["X-Hub-Signature-256"]
-        payload_bytes = json.dumps(payload).encode()
-        expected_signature = (
-            "sha256="
-            + hmac.new(
-                self.webhook_secret.encode(), payload_bytes, hashlib.sha256
-            ).hexdigest()
-        )
+    def start_signature(self, headers: Mapping[str, str]) -> Optional[hmac.HMAC]:
+        if not self.webhook_secret or "X-Hub-Signature-256" not in headers:
+            return None
+        return hmac.new(self.webhook_secret.encode(), digestmod=hashlib.sha256)
 
+    def verify_signature(self, headers: Mapping[str, str], mac: hmac.HMAC) -> bool:
+        signature = headers.get("X-Hub-Signature-256", "")
+        expected_signature = "sha256=" + mac.hexdigest()
         return hmac.compare_digest(signature, expected_signature)
 
-    def process_webhook(self, payload: Dict[str, Any]) -> StandardizedEvent:
-        # Determine base event type first
-        if "pull_request" in payload:
-            event_type = "pull_request"
-        elif "comment" in payload:
-            event_type = "comment"
+    def delivery_id(
+        self, headers: Mapping[str, str], payload: Dict[str, Any]
+    ) -> Optional[str]:
+        return headers.get("X-GitHub-Delivery")
+
+    def subject_key(self, payload: Dict[str, Any]) -> Optional[str]:
+        repository = payload.get("repository", {}).get("full_name")
+        subject = payload.get("issue") or payload.get("pull_request") or {}
+        if not repository or subject.get("number") is None:
+            return None
+        return f"{repository}#{subject['number']}"
+
+    def cancellation_subject(self, payload: Dict[str, Any]) -> Optional[str]:
+        """Closing, deleting or editing an issue or PR withdraws the request"""
+        if payload.get("action") not in ("closed", "deleted", "edited"):
+            return None
+        if "comment" in payload:
+            return None  # A comment was edited or deleted, not its issue
+        return self.subject_key(payload)
+
+    def repository_url(self, payload: Dict[str, Any]) -> Optional[str]:
+        """The URL process_webhook puts in the event, which the pipeline clones"""
+        return (payload.get("repository") or {}).get("html_url")
+
+    def tenant_id(self, payload: Dict[str, Any]) -> Optional[str]:
+        """App deliveries carry the installation; plain repo webhooks only the repo"""
+        installation_id = payload.get("installation", {}).get("id")
+        if installation_id is not None:
+            return str(installation_id)
+        return payload.get("repository", {}).get("full_name")
+
+    @staticmethod
+    def _event_type(
+        payload: Dict[str, Any], headers: Optional[Mapping[str, str]] = None
+    ) -> str:
+        """The standardized event type, from X-GitHub-Event when it was sent
+
+        Payload sniffing is only a fallback: it can't tell e.g. an
+        installation event from a push. Header names are matched without
+        case, since the inbox persists them lowercased.
+        """
+        for name, value in (headers or {}).items():
+            if name.lower() == "x-github-event" and value:
+                return GITHUB_EVENT_TYPES.get(value, value)
+        # A comment on a PR carries the PR too
+        if "comment" in payload:
+            return "comment"
+        elif "pull_request" in payload:
+            return "pull_request"
         elif "issues" in payload or "issue" in payload:
-            event_type = "issue"
+            return "issue"
+        return "push"
+
+    def route_key(self, headers: Mapping[str, str], payload: Dict[str, Any]) -> RouteKey:
+        event_type = self._event_type(payload, headers)
+
+        sender = payload.get("sender") or {}
+        bot_login = f"{settings.GITHUB_APP_SLUG}[bot]".lower()
+        if (sender.get("login") or "").lower() == bot_login:
+            sender_type = SenderType.SELF
+        elif sender.get("type") == "Bot":
+            sender_type = SenderType.BOT
+        else:
+            sender_type = SenderType.USER
+
+        # A comment mentions us in its own body; issues and PRs in title or body
+        if "comment" in payload:
+            text = payload["comment"].get("body") or ""
         else:
-            event_type = "push"
+            subject = payload.get("issue") or payload.get("pull_request") or {}
+            text = f"{subject.get('title') or ''} {subject.get('body') or ''}"
+        mentions_bot = f"@{settings.GITHUB_APP_SLUG}".lower() in text.lower()
+
+        return RouteKey(
+            provider=ServiceProvider.GITHUB,
+            event_type=event_type,
+            action=payload.get("action"),
+            sender_type=sender_type,
+            mentions_bot=mentions_bot,
+        )
+
+    def process_webhook(
+        self,
+        payload: Dict[str, Any],
+        raw_body: Optional[bytes] = None,
+        content_type: Optional[str] = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> StandardizedEvent:
+        # Determine base event type first, the same way route_key does
+        event_type = self._event_type(payload, headers)
 
         # Generate detailed user request string based on event type
         user_request = ""
-        if "pull_request" in payload:
-            pr = payload["pull_request"]
-            user_request = (
-                f"Review pull request: {pr.get('title', 'Untitled PR')}\n"
-                f"Description: {pr.get('body', 'No description provided')}\n"
-                f"Author: {pr.get('user', {}).get('login', 'unknown')}"
-            )
-        elif "comment" in payload:
+        if event_type == "comment" and "comment" in payload:
             comment = payload["comment"]
             context = "issue" if "issue" in payload else "pull request"
             parent = payload.get("issue") or payload.get("pull_request", {})
@@ -65,6 +144,13 @@ class GitHubHandler(ServiceHandler):
                 f"Comment: {comment.get('body', 'No comment body')}\n"
                 f"Author: {comment.get('user', {}).get('login', 'unknown')}"
             )
+        elif "pull_request" in payload:
+            pr = payload["pull_request"]
+            user_request = (
+                f"Review pull request: {pr.get('title', 'Untitled PR')}\n"
+                f"Description: {pr.get('body', 'No description provided')}\n"
+                f"Author: {pr.get('user', {}).get('login', 'unknown')}"
+            )
         elif "issue" in payload:
             issue = payload["issue"]
             user_request = (
@@ -116,6 +202,8 @@ class GitHubHandler(ServiceHandler):
             user_request=user_request,
             payload=standardized_payload,
             raw_payload=payload,
+            raw_body=raw_body,
+            content_type=content_type,
         )
 
     def send_response(
@@ -132,15 +220,7 @@ class GitHubHandler(ServiceHandler):
         For push events, this creates a commit status
         """
         # Determine event type from payload
-        event_type = None
-        if "pull_request" in payload:
-            event_type = "pull_request"
-        elif "comment" in payload:
-            event_type = "comment"
-        elif "issues" in payload or "issue" in payload:
-            event_type = "issue"
-        else:
-            event_type = "push"
+        event_type = self._event_type(payload)
 
         if event_type in ("issue", "pull_request", "comment"):
             try:
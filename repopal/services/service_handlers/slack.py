@@ -1,62 +1,163 @@
 import hashlib
 import hmac
-import json
 import logging
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Mapping, Optional
 
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
 from repopal.core.config import settings
-from repopal.schemas.service_handler import ServiceProvider, StandardizedEvent
+from repopal.schemas.service_handler import (
+    RouteKey,
+    SenderType,
+    ServiceProvider,
+    StandardizedEvent,
+)
 
 from .base import ResponseType, ServiceHandler
 
 # TODO: need to handle app installation events (create service connection)
 
 class SlackHandler(ServiceHandler):
+    # Slash commands must be answered with a plain 200
+    ack_status_code = 200
+
     def __init__(self, signing_secret: str, bot_token: Optional[str] = None):
         self.signing_secret = signing_secret
         self.client = WebClient(token=bot_token or settings.SLACK_BOT_TOKEN)
 
-    def validate_webhook(
-        self, headers: Dict[str, str], payload: Dict[str, Any]
-    ) -> bool:
+    def start_signature(self, headers: Mapping[str, str]) -> Optional[hmac.HMAC]:
         """
         Validate Slack webhook using signing secret
         https://api.slack.com/authentication/verifying-requests-from-slack
         """
         # Check for required headers
+        if not self.signing_secret:
+            return None
         if not all(key in headers for key in ['X-Slack-Request-Timestamp', 'X-Slack-Signature']):
-            return False
-
-        # URL verification is always valid
-        if payload.get('type') == 'url_verification':
-            return True
+            return None
 
-        # Reconstruct the signature base string
         timestamp = headers['X-Slack-Request-Timestamp']
-        signature = headers['X-Slack-Signature']
-
-        # Check timestamp is not too old (5 minutes max)
-        if abs(int(time.time()) - int(timestamp)) > 60 * 5:
-            return False
-
-        # Prepare the base string for HMAC
-        base_string = f"v0:{timestamp}:{json.dumps(payload)}"
+        try:
+            # Check timestamp is not too old (5 minutes max)
+            if abs(int(time.time()) - int(timestamp)) > 60 * 5:
+                return None
+        except ValueError:
+            return None
 
-        # Compute the expected signature
-        expected_signature = 'v0=' + hmac.new(
+        # The signature base string is "v0:<timestamp>:<raw body>"
+        return hmac.new(
             key=self.signing_secret.encode(),
-            msg=base_string.encode(),
+            msg=f"v0:{timestamp}:".encode(),
             digestmod=hashlib.sha256
-        ).hexdigest()
+        )
 
-        # Compare signatures
+    def verify_signature(self, headers: Mapping[str, str], mac: hmac.HMAC) -> bool:
+        signature = headers.get('X-Slack-Signature', '')
+        expected_signature = 'v0=' + mac.hexdigest()
         return hmac.compare_digest(signature, expected_signature)
 
-    def process_webhook(self, payload: Dict[str, Any]) -> StandardizedEvent:
+    def delivery_id(
+        self, headers: Mapping[str, str], payload: Dict[str, Any]
+    ) -> Optional[str]:
+        """Events API deliveries carry an event_id; slash commands a trigger_id"""
+        return payload.get('event_id') or payload.get('trigger_id')
+
+    def immediate_response(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Answer the Events API URL verification handshake inline"""
+        if payload.get('type') == 'url_verification':
+            return {'challenge': payload.get('challenge')}
+        return None
+
+    def subject_key(self, payload: Dict[str, Any]) -> Optional[str]:
+        """Replies in the same thread are about the same subject
+
+        A top-level message starts the thread we reply in, so its own ``ts``
+        is the subject.
+        """
+        event = payload.get('event', {})
+        thread_ts = event.get('thread_ts') or event.get('ts')
+        if not event.get('channel') or not thread_ts:
+            return None
+        return f"{event['channel']}:{thread_ts}"
+
+    def cancellation_subject(self, payload: Dict[str, Any]) -> Optional[str]:
+        """Deleting a request message withdraws it"""
+        event = payload.get('event', {})
+        if event.get('subtype') != 'message_deleted' or not event.get('channel'):
+            return None
+        previous = event.get('previous_message') or {}
+        thread_ts = previous.get('thread_ts') or event.get('deleted_ts')
+        if not thread_ts:
+            return None
+        return f"{event['channel']}:{thread_ts}"
+
+    def tenant_id(self, payload: Dict[str, Any]) -> Optional[str]:
+        """Events and slash commands carry team_id; interactive payloads a team"""
+        return payload.get('team_id') or payload.get('team', {}).get('id')
+
+    @staticmethod
+    def _event_type(payload: Dict[str, Any]) -> str:
+        """Infer the event type from the payload shape"""
+        if payload.get('type') == 'url_verification':
+            return 'url_verification'
+        if 'command' in payload:
+            return 'slash_command'
+        if payload.get('type') == 'event_callback' and payload.get('event', {}).get('type') in ('message', 'app_mention'):
+            return 'message'
+        return 'unknown'
+
+    def route_key(self, headers: Mapping[str, str], payload: Dict[str, Any]) -> RouteKey:
+        event_type = self._event_type(payload)
+        event = payload.get('event', {})
+
+        if event_type == 'slash_command':
+            # Slash commands are always typed by a person, directly at us
+            return RouteKey(
+                provider=ServiceProvider.SLACK,
+                event_type=event_type,
+                action=None,
+                sender_type=SenderType.USER,
+                mentions_bot=True,
+            )
+
+        if (
+            (settings.SLACK_BOT_ID and event.get('bot_id') == settings.SLACK_BOT_ID)
+            or (settings.SLACK_BOT_USER_ID and event.get('user') == settings.SLACK_BOT_USER_ID)
+        ):
+            sender_type = SenderType.SELF
+        elif event.get('bot_id') or event.get('subtype') == 'bot_message':
+            sender_type = SenderType.BOT
+        else:
+            sender_type = SenderType.USER
+
+        # Direct messages are addressed to us without an explicit mention
+        mentions_bot = (
+            event.get('type') == 'app_mention'
+            or event.get('channel_type') == 'im'
+            or (
+                bool(settings.SLACK_BOT_USER_ID)
+                and f"<@{settings.SLACK_BOT_USER_ID}>" in (event.get('text') or '')
+            )
+        )
+
+        return RouteKey(
+            provider=ServiceProvider.SLACK,
+            event_type=event_type,
+            # Edits and deletions arrive as message events with a subtype
+            action=event.get('subtype') or event.get('type'),
+            sender_type=sender_type,
+            mentions_bot=mentions_bot,
+        )
+
+    def process_webhook(
+        self,
+        payload: Dict[str, Any],
+        raw_body: Optional[bytes] = None,
+        content_type: Optional[str] = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> StandardizedEvent:
         """
         Process Slack events and slash commands into StandardizedEvent
         """
@@ -68,7 +169,9 @@ class SlackHandler(ServiceHandler):
                 action=None,
                 user_request='Slack Events API verification',
                 payload={},
-                raw_payload=payload
+                raw_payload=payload,
+                raw_body=raw_body,
+                content_type=content_type
             )
 
         # Determine event type
@@ -93,7 +196,7 @@ class SlackHandler(ServiceHandler):
             })
 
         # Handle message events
-        elif payload.get('type') == 'event_callback' and payload.get('event', {}).get('type') == 'message':
+        elif self._event_type(payload) == 'message':
             event_type = 'message'
             event = payload.get('event', {})
             user_request = event.get('text', '')
@@ -108,7 +211,9 @@ class SlackHandler(ServiceHandler):
             action=payload.get('event', {}).get('type'),
             user_request=user_request,
             payload=standardized_payload,
-            raw_payload=payload
+            raw_payload=payload,
+            raw_body=raw_body,
+            content_type=content_type
         )
 
     def send_response(
@@ -120,23 +225,35 @@ class SlackHandler(ServiceHandler):
     ) -> str:
         """
         Send response back to Slack channel/thread
+
+        A new response is posted in the thread of the requester's message.
+        Updates and the final response replace the text of the message
+        ``thread_id`` names, so the conversation keeps one status message.
         """
         try:
             # Determine channel for response
             channel = None
+            event = payload.get('event', {})
             if 'channel' in payload:
                 channel = payload['channel']
-            elif 'event' in payload and 'channel' in payload['event']:
-                channel = payload['event']['channel']
+            elif 'channel' in event:
+                channel = event['channel']
+            elif 'channel_id' in payload:
+                channel = payload['channel_id']  # Slash commands
 
             if not channel:
                 raise ValueError("No channel found in payload")
 
-            # Send message with optional threading
+            if response_type != ResponseType.INITIAL and thread_id:
+                # Replace the text of the message posted earlier
+                self.client.chat_update(channel=channel, ts=thread_id, text=message)
+                return thread_id
+
+            # Reply in the requester's thread; slash commands have none
             response = self.client.chat_postMessage(
                 channel=channel,
                 text=message,
-                thread_ts=thread_id
+                thread_ts=thread_id or event.get('thread_ts') or event.get('ts')
             )
 
             # Return the timestamp which can be used as a thread ID
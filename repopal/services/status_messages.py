@@ -0,0 +1,111 @@
+"""Status messages: a template right away, optionally rewritten by the LLM
+
+Telling the requester their request was received should not wait on a
+model round trip. Each stage has a fixed template that is sent at once;
+with enrichment on, the LLM writes a friendlier version in the background,
+which replaces the template through the ID ``send_response`` returned.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set
+
+from repopal.core.metrics import metrics
+from repopal.services.llm import LLMService
+from repopal.services.service_handlers.base import ResponseType, ServiceHandler
+
+TEMPLATES = {
+    "received": "Thanks! I'm working on your request.",
+    "selected": "I'm handling your request with {command_name}.",
+    "completed": "{changes_summary}",
+    "failed": "Sorry, I couldn't finish your request: {error}",
+    "cancelled": "Your request was cancelled.",
+}
+
+
+class _Blank(dict):
+    def __missing__(self, key: str) -> str:
+        return ""
+
+
+def render_status_message(stage: str, context: Dict[str, Any]) -> str:
+    """The template message for a stage; missing context renders empty"""
+    return TEMPLATES[stage].format_map(_Blank(context))
+
+
+class StatusMessages:
+    """The status messages of one pipeline attempt
+
+    A rewrite only replaces the message it was written for if nothing has
+    been sent since, so a slow model never undoes a later update such as
+    the final summary. Rewrites still in flight when the attempt ends are
+    cancelled by ``close``.
+    """
+
+    def __init__(
+        self,
+        handler: ServiceHandler,
+        payload: Dict[str, Any],
+        llm: Optional[LLMService] = None,
+    ):
+        self.handler = handler
+        self.payload = payload
+        self.llm = llm  # None sends templates only
+        self._lock = asyncio.Lock()
+        self._sent = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self.logger = logging.getLogger(__name__)
+
+    async def send(
+        self,
+        stage: str,
+        context: Dict[str, Any],
+        response_type: ResponseType,
+        thread_id: Optional[str] = None,
+        message: Optional[str] = None,
+        enrich: bool = True,
+    ) -> str:
+        """Send the stage's template, or ``message``; returns its thread ID"""
+        async with self._lock:
+            self._sent += 1
+            sent = self._sent
+            thread_id = await asyncio.to_thread(
+                self.handler.send_response,
+                payload=self.payload,
+                message=message or render_status_message(stage, context),
+                response_type=response_type,
+                thread_id=thread_id,
+            )
+        if enrich and self.llm is not None:
+            task = asyncio.ensure_future(self._enrich(stage, context, thread_id, sent))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return thread_id
+
+    async def _enrich(
+        self, stage: str, context: Dict[str, Any], thread_id: str, sent: int
+    ) -> None:
+        try:
+            message = await self.llm.generate_status_message(stage, context)
+            async with self._lock:
+                if sent != self._sent:
+                    outcome = "superseded"
+                else:
+                    await asyncio.to_thread(
+                        self.handler.send_response,
+                        payload=self.payload,
+                        message=message,
+                        response_type=ResponseType.UPDATE,
+                        thread_id=thread_id,
+                    )
+                    outcome = "sent"
+        except Exception as e:
+            # The template already said it; the rewrite is only polish
+            self.logger.warning(f"Status message for {stage} not rewritten: {e}")
+            outcome = "error"
+        metrics.increment("status_message_rewrites_total", stage=stage, outcome=outcome)
+
+    def close(self) -> None:
+        """Abandon rewrites still in flight"""
+        for task in list(self._tasks):
+            task.cancel()
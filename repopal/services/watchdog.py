@@ -0,0 +1,54 @@
+"""Wall-clock enforcement for blocking work that has no timeout of its own"""
+
+import logging
+import threading
+from typing import Callable, Optional
+
+
+class Watchdog:
+    """Calls ``on_expire`` from a timer thread unless disarmed in time
+
+    Docker's ``exec_run`` blocks until the process exits and takes no
+    timeout, so the only way to bound it is from outside: when the budget
+    runs out the watchdog kills what the call is waiting on (the container),
+    which makes the call return. Use it as a context manager around the
+    blocking call, then check ``expired`` to tell a kill from a normal exit.
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[float],
+        on_expire: Callable[[], None],
+        name: str = "watchdog",
+    ):
+        self.timeout = timeout
+        self.on_expire = on_expire
+        self.name = name
+        self._expired = threading.Event()
+        self._timer: Optional[threading.Timer] = None
+
+    @property
+    def expired(self) -> bool:
+        return self._expired.is_set()
+
+    def _fire(self) -> None:
+        self._expired.set()
+        logging.getLogger(__name__).warning(
+            f"{self.name} exceeded its {self.timeout:g}s budget; terminating"
+        )
+        try:
+            self.on_expire()
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"{self.name} termination failed: {e}")
+
+    def __enter__(self) -> "Watchdog":
+        if self.timeout is not None:
+            self._timer = threading.Timer(self.timeout, self._fire)
+            self._timer.name = self.name
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
@@ -0,0 +1,228 @@
+"""Durable inbox between webhook ingest and the Celery worker"""
+
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from sqlalchemy.orm import Session
+
+from repopal.core.config import settings
+from repopal.models.webhook_delivery import DeliveryStatus, WebhookDelivery
+from repopal.repositories.webhook_delivery import WebhookDeliveryRepository
+from repopal.schemas.service_handler import ServiceProvider
+from repopal.services.event_coalescer import EventCoalescer
+
+# Headers worth keeping alongside the body; everything else is transport noise
+PERSISTED_HEADER_PREFIXES = ("x-github-", "x-slack-", "x-hub-")
+
+
+def enqueue_delivery(delivery_id: str, **options: Any) -> None:
+    """Hand a persisted delivery to the worker
+
+    Args:
+        delivery_id: The inbox ID of the delivery
+        options: Extra ``apply_async`` options, e.g. ``countdown``
+    """
+    from repopal.worker import process_webhook_delivery
+
+    # Don't let a broker outage stall ingest; the sweeper requeues later
+    process_webhook_delivery.apply_async(args=[delivery_id], retry=False, **options)
+
+
+class WebhookInbox:
+    """Persists verified deliveries and feeds them to the worker
+
+    A delivery is committed to the database before it is enqueued, so a
+    broker outage or worker crash never loses it: ``requeue_stale`` picks up
+    anything that was not acknowledged in time. A claim counts as lost once
+    it is older than ``processing_timeout``; the delivery can then be
+    claimed again, and the sweeper requeues it.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        enqueue: Optional[Callable[..., None]] = None,
+        coalescer: Optional[EventCoalescer] = None,
+        processing_timeout: Optional[timedelta] = None,
+    ):
+        self.db = db
+        self.enqueue = enqueue if enqueue is not None else enqueue_delivery
+        self.coalescer = coalescer
+        self.processing_timeout = processing_timeout or timedelta(
+            seconds=settings.WEBHOOK_INBOX_PROCESSING_TIMEOUT_SECONDS
+        )
+        self.repository = WebhookDeliveryRepository()
+        self.logger = logging.getLogger(__name__)
+
+    def accept(
+        self,
+        provider: ServiceProvider,
+        headers: Mapping[str, str],
+        body: bytes,
+        delivery_id: Optional[str] = None,
+        subject: Optional[str] = None,
+        defer_seconds: float = 0.0,
+    ) -> WebhookDelivery:
+        """Persist a verified delivery and enqueue it for processing
+
+        Deliveries with a subject are held for the provider's coalescing
+        window, so that only the latest of a burst is processed. Deliveries
+        from a tenant over its rate limit are deferred by ``defer_seconds``
+        and enqueued at low priority. Both are recorded on the delivery, so
+        ``requeue_stale`` keeps to them.
+        """
+        delivery = WebhookDelivery(
+            id=uuid.uuid4(),
+            provider=provider,
+            delivery_id=delivery_id,
+            subject=subject,
+            content_type=headers.get("content-type"),
+            headers={
+                key.lower(): value
+                for key, value in headers.items()
+                if key.lower().startswith(PERSISTED_HEADER_PREFIXES)
+            },
+            body=body,
+            status=DeliveryStatus.RECEIVED,
+            attempts=0,
+        )
+        if defer_seconds > 0:
+            delivery.priority = settings.WEBHOOK_DEFERRED_PRIORITY
+        self.repository.add(self.db, delivery)
+
+        countdown = 0.0
+        if self.coalescer and subject:
+            countdown = self.coalescer.register(provider, subject, str(delivery.id))
+        countdown = max(countdown, defer_seconds)
+        if countdown > 0:
+            delivery.not_before = datetime.utcnow() + timedelta(seconds=countdown)
+        options: Dict[str, Any] = {"countdown": countdown}
+        if delivery.priority is not None:
+            options["priority"] = delivery.priority
+        self._enqueue(delivery, **options)
+        return delivery
+
+    def _enqueue(self, delivery: WebhookDelivery, **options: Any) -> None:
+        try:
+            self.enqueue(str(delivery.id), **options)
+        except Exception as e:
+            # The delivery is already durable; leave it RECEIVED for the sweeper
+            self.logger.warning(f"Failed to enqueue delivery {delivery.id}: {e}")
+        else:
+            delivery.status = DeliveryStatus.QUEUED
+        self.db.commit()
+
+    def get(self, delivery_id: str) -> Optional[WebhookDelivery]:
+        """Get a delivery by its inbox ID"""
+        return self.repository.get(self.db, id=uuid.UUID(str(delivery_id)))
+
+    def claim(self, delivery_id: str) -> Optional[WebhookDelivery]:
+        """Atomically mark a pending delivery as picked up by a worker
+
+        Returns None if the delivery does not exist or another worker already
+        claimed it (e.g. a sweeper requeue raced the original message). A
+        claim older than the processing timeout is taken over: its worker
+        died, and this is the broker redelivering its message.
+        """
+        delivery_uuid = uuid.UUID(str(delivery_id))
+        claimed = (
+            self.db.query(WebhookDelivery)
+            .filter(
+                WebhookDelivery.id == delivery_uuid,
+                WebhookDelivery.status.in_(
+                    [DeliveryStatus.RECEIVED, DeliveryStatus.QUEUED]
+                )
+                | (
+                    (WebhookDelivery.status == DeliveryStatus.PROCESSING)
+                    & (
+                        WebhookDelivery.updated_at
+                        < datetime.utcnow() - self.processing_timeout
+                    )
+                ),
+            )
+            .update(
+                {
+                    WebhookDelivery.status: DeliveryStatus.PROCESSING,
+                    WebhookDelivery.attempts: WebhookDelivery.attempts + 1,
+                    WebhookDelivery.updated_at: datetime.utcnow(),
+                },
+                synchronize_session=False,
+            )
+        )
+        self.db.commit()
+        if not claimed:
+            return None
+        return self.get(delivery_uuid)
+
+    def is_superseded(self, delivery: WebhookDelivery) -> bool:
+        """Check whether a later delivery about the same subject replaced this one"""
+        if not self.coalescer or not delivery.subject:
+            return False
+        return not self.coalescer.claim(
+            delivery.provider, delivery.subject, str(delivery.id)
+        )
+
+    def supersede(self, delivery: WebhookDelivery) -> None:
+        """Mark a delivery as dropped in favour of a later one"""
+        delivery.status = DeliveryStatus.SUPERSEDED
+        self.db.commit()
+
+    def complete(self, delivery: WebhookDelivery) -> None:
+        """Mark a delivery as fully processed"""
+        delivery.status = DeliveryStatus.COMPLETED
+        delivery.error = None
+        self.db.commit()
+
+    def fail(self, delivery: WebhookDelivery, error: str) -> None:
+        """Record a processing failure"""
+        delivery.status = DeliveryStatus.FAILED
+        delivery.error = error
+        self.db.commit()
+
+    def release(self, delivery: WebhookDelivery, error: str) -> None:
+        """Give up a claim after a failure worth retrying
+
+        The delivery goes back to RECEIVED, so the sweeper requeues it.
+        """
+        delivery.status = DeliveryStatus.RECEIVED
+        delivery.error = error
+        delivery.updated_at = datetime.utcnow()
+        self.db.commit()
+
+    def requeue_stale(self, older_than: timedelta, limit: int = 100) -> int:
+        """Re-enqueue deliveries that were never enqueued or never picked up,
+        or whose worker died while processing them
+
+        Deferred deliveries are left alone until their not-before time has
+        passed, and keep their priority when they are requeued.
+
+        Returns:
+            The number of deliveries handed back to the worker
+        """
+        now = datetime.utcnow()
+        stale = self.repository.get_stale(
+            self.db,
+            [DeliveryStatus.RECEIVED, DeliveryStatus.QUEUED],
+            now - older_than,
+            now,
+            limit=limit,
+        )
+        stale += self.repository.get_stale(
+            self.db,
+            [DeliveryStatus.PROCESSING],
+            now - self.processing_timeout,
+            now,
+            limit=limit - len(stale),
+        )
+        for delivery in stale:
+            # Touch the row so the next sweep waits a full interval again
+            delivery.updated_at = now
+            # Claimable again; QUEUED once the broker has it
+            delivery.status = DeliveryStatus.RECEIVED
+            options: Dict[str, Any] = {}
+            if delivery.priority is not None:
+                options["priority"] = delivery.priority
+            self._enqueue(delivery, **options)
+        return len(stale)
@@ -0,0 +1,210 @@
+"""Speculative workspace preparation, started when a delivery is accepted
+
+A pipeline spends its first seconds cloning the repository and building
+the command's image. Both depend on the event alone (and on a guess of the
+command), so ingest starts them as soon as it accepts a GitHub event: a
+worker fetches the repository into a local mirror and builds the image for
+the command the repository most often ends up using. The pipeline's clone
+then copies objects from the mirror and only fetches what it lacks, and a
+correctly predicted image is already tagged on the Docker host.
+
+Nothing here is needed for correctness. A wrong guess leaves an unused
+image in Docker's cache, a missing mirror means a normal clone, and a
+prepare task that is not started promptly expires unrun.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import docker
+import git
+import redis
+
+from repopal.core.config import settings
+from repopal.core.metrics import metrics
+from repopal.core.redis import get_redis
+from repopal.services.commands import CommandFactory
+from repopal.services.environment_manager import EnvironmentManager
+from repopal.services.git_repo_manager import authenticated_url
+
+
+class RepositoryMirrors:
+    """Bare mirrors of repositories on this host, one per clone URL
+
+    A new mirror is cloned next to its final path and renamed into place
+    once the clone is complete, so ``get`` never returns one that is still
+    being fetched. Fetches into an existing mirror only add objects and
+    move refs, which leaves it usable as a reference throughout.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.logger = logging.getLogger(__name__)
+
+    def path_for(self, repo_url: str) -> Path:
+        digest = hashlib.sha256(repo_url.encode()).hexdigest()[:16]
+        return self.root / f"{digest}.git"
+
+    def get(self, repo_url: str) -> Optional[Path]:
+        """The repository's mirror, if one has been fetched on this host"""
+        path = self.path_for(repo_url)
+        return path if path.is_dir() else None
+
+    def refresh(self, repo_url: str, github_token: Optional[str] = None) -> Path:
+        """Create the mirror, or fetch into it if it exists"""
+        path = self.path_for(repo_url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        remote = authenticated_url(repo_url, github_token)
+        # Concurrent deliveries for one repository share a single fetch
+        with open(f"{path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if path.is_dir():
+                git.Repo(path).git.fetch(
+                    "--prune", remote, "+refs/heads/*:refs/heads/*"
+                )
+            else:
+                partial = Path(f"{path}.partial")
+                # Left behind by a refresh that died mid-clone
+                shutil.rmtree(partial, ignore_errors=True)
+                mirror = git.Repo.clone_from(remote, partial, mirror=True)
+                # Keep the token out of the mirror's config
+                mirror.git.remote("set-url", "origin", repo_url)
+                os.rename(partial, path)
+        return path
+
+
+class CommandPredictor:
+    """Guesses a repository's command from the commands its runs selected"""
+
+    KEY_PREFIX = "repopal:commands"
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        default: str = "aider",
+        ttl_seconds: int = 30 * 24 * 3600,
+    ):
+        self.redis = redis_client
+        self.default = default
+        self.ttl_seconds = ttl_seconds
+        self.logger = logging.getLogger(__name__)
+
+    def _key(self, repo_url: str) -> str:
+        return f"{self.KEY_PREFIX}:{repo_url}"
+
+    def record(self, repo_url: str, command: str) -> None:
+        """Count a command selected for a run on the repository"""
+        try:
+            with self.redis.pipeline() as pipe:
+                pipe.hincrby(self._key(repo_url), command, 1)
+                pipe.expire(self._key(repo_url), self.ttl_seconds)
+                pipe.execute()
+        except redis.RedisError as e:
+            self.logger.warning(f"Could not record command for {repo_url}: {e}")
+
+    def predict(self, repo_url: str) -> str:
+        """The repository's most often selected command, or the default"""
+        try:
+            counts = self.redis.hgetall(self._key(repo_url))
+        except redis.RedisError as e:
+            self.logger.warning(f"Command history unavailable: {e}")
+            return self.default
+        if not counts:
+            return self.default
+        command = max(counts, key=lambda name: int(counts[name]))
+        return command.decode() if isinstance(command, bytes) else command
+
+
+class WorkspacePreparer:
+    """Fetches a repository's mirror and builds its likely command's image"""
+
+    def __init__(
+        self,
+        mirrors: RepositoryMirrors,
+        predictor: CommandPredictor,
+        environment_factory: Callable[[], EnvironmentManager] = EnvironmentManager,
+        github_token: Optional[str] = None,
+    ):
+        self.mirrors = mirrors
+        self.predictor = predictor
+        self.environment_factory = environment_factory
+        self.github_token = github_token
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def default(cls) -> "WorkspacePreparer":
+        return cls(
+            get_repository_mirrors(),
+            get_command_predictor(),
+            github_token=settings.GITHUB_TOKEN,
+        )
+
+    def prepare(self, repo_url: str) -> Dict[str, Any]:
+        """Do what can be done ahead of the pipeline; failures only cost a hit"""
+        prepared: Dict[str, Any] = {"mirror": None, "command": None, "image": None}
+        try:
+            prepared["mirror"] = str(self.mirrors.refresh(repo_url, self.github_token))
+        except git.GitCommandError as e:
+            self.logger.warning(f"Could not mirror {repo_url}: {e}")
+        metrics.increment(
+            "workspace_prepared_total",
+            resource="mirror",
+            outcome="ok" if prepared["mirror"] else "error",
+        )
+
+        prepared["command"] = self.predictor.predict(repo_url)
+        try:
+            command = CommandFactory.get_command(prepared["command"])
+            environment = self.environment_factory()
+            prepared["image"] = environment.cached_image(
+                command
+            ) or environment.build_image(command)
+        except (ValueError, docker.errors.DockerException) as e:
+            self.logger.warning(f"Could not build {prepared['command']} image: {e}")
+        metrics.increment(
+            "workspace_prepared_total",
+            resource="image",
+            outcome="ok" if prepared["image"] else "error",
+        )
+        return prepared
+
+
+def enqueue_prepare_workspace(repo_url: str) -> None:
+    """Ask a worker to prepare the repository's workspace ahead of its pipeline"""
+    from repopal.worker import prepare_workspace
+
+    try:
+        # Stale speculation is worthless; let the broker drop it
+        prepare_workspace.apply_async(
+            args=[repo_url],
+            retry=False,
+            expires=settings.SPECULATIVE_PREPARE_EXPIRES_SECONDS,
+        )
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Could not enqueue preparation: {e}")
+
+
+def get_workspace_preparation() -> Optional[Callable[[str], None]]:
+    """How ingest starts preparing a workspace, or None if it should not"""
+    if not settings.SPECULATIVE_PREPARE_ENABLED:
+        return None
+    return enqueue_prepare_workspace
+
+
+def get_repository_mirrors() -> Optional[RepositoryMirrors]:
+    """This host's repository mirrors, or None if clones should not use them"""
+    if not settings.SPECULATIVE_PREPARE_ENABLED:
+        return None
+    return RepositoryMirrors(Path(settings.WORKSPACE_MIRROR_DIR))
+
+
+def get_command_predictor() -> Optional[CommandPredictor]:
+    """The command predictor, or None if workspaces are not prepared"""
+    if not settings.SPECULATIVE_PREPARE_ENABLED:
+        return None
+    return CommandPredictor(get_redis(), default=settings.SPECULATIVE_DEFAULT_COMMAND)
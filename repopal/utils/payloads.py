@@ -0,0 +1,37 @@
+"""Helpers for decoding raw webhook bodies"""
+
+import json
+from typing import Any, Dict
+from urllib.parse import parse_qsl
+
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+
+def media_type(content_type: str | None) -> str:
+    """Return the bare media type of a Content-Type header value"""
+    return (content_type or "").split(";", 1)[0].strip().lower()
+
+
+def decode_body(body: bytes, content_type: str | None) -> Dict[str, Any]:
+    """Decode a webhook body into a payload dict
+
+    JSON is the default. Form-encoded bodies (Slack slash commands, GitHub
+    webhooks configured for form delivery) are decoded into a flat dict; a
+    single ``payload`` field is treated as a JSON document, which is how both
+    Slack interactivity and GitHub form deliveries wrap their content.
+
+    Raises:
+        ValueError: If the body cannot be decoded into a dict
+    """
+    if media_type(content_type) == FORM_CONTENT_TYPE:
+        form = dict(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+        if set(form) == {"payload"}:
+            payload = json.loads(form["payload"])
+        else:
+            return form
+    else:
+        payload = json.loads(body)
+
+    if not isinstance(payload, dict):
+        raise ValueError("Webhook payload must be a JSON object")
+    return payload
@@ -1,10 +1,279 @@
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
 from celery import Celery
+from celery.signals import worker_process_shutdown, worker_shutdown
 
+from repopal.core.async_runtime import get_async_runtime, shutdown_async_runtime
 from repopal.core.config import settings
+from repopal.core.database import SessionLocal
+from repopal.core.exceptions import (
+    PipelineNotFoundError,
+    PipelineStateError,
+    RepositoryBusyError,
+)
+from repopal.core.metrics import metrics
+from repopal.models.pipeline import PipelineStatus
+from repopal.repositories.pipeline_run import PipelineRunRepository
+from repopal.services.cancellation import get_cancellation_registry
+from repopal.services.claim_check import get_blob_store
+from repopal.services.event_coalescer import get_event_coalescer
+from repopal.services.job_classes import JobClass, queue_for
+from repopal.services.pipeline import PipelineRunner, PipelineServices
+from repopal.services.repo_lease import get_repository_leases
+from repopal.services.service_handler_factory import ServiceHandlerFactory
+from repopal.services.webhook_inbox import WebhookInbox
+from repopal.services.workspace_speculation import WorkspacePreparer
 
 celery = Celery("worker", broker=settings.REDIS_URL, backend=settings.REDIS_URL)
+# Honour message priorities on the Redis broker so deferred (over-limit)
+# deliveries wait behind everyone else's
+celery.conf.broker_transport_options = {
+    "priority_steps": list(range(10)),
+    "queue_order_strategy": "priority",
+}
+# Pipelines run on one queue per cost class (see job_classes), each served by
+# its own workers so a quick Slack question never waits behind aider, e.g.
+#   celery -A repopal.worker worker -Q pipeline.interactive -c 8
+#   celery -A repopal.worker worker -Q pipeline.change -c 2
+# Speculative workspace preparation runs next to the change workers, since
+# the mirrors and images it prepares are local to the host:
+#   celery -A repopal.worker worker -Q pipeline.prepare -c 2
+# Ingest and maintenance tasks stay on the default queue.
+celery.conf.task_routes = {
+    "repopal.worker.run_pipeline": {"queue": settings.PIPELINE_CHANGE_QUEUE},
+    "repopal.worker.prepare_workspace": {
+        "queue": settings.SPECULATIVE_PREPARE_QUEUE
+    },
+}
+# Long acks_late tasks: don't let a busy worker sit on prefetched jobs that
+# an idle one could start
+celery.conf.worker_prefetch_multiplier = 1
+celery.conf.beat_schedule = {
+    "requeue-stale-webhook-deliveries": {
+        "task": "repopal.worker.requeue_stale_deliveries",
+        "schedule": settings.WEBHOOK_INBOX_SWEEP_SECONDS,
+    },
+    "prune-claim-checks": {
+        "task": "repopal.worker.prune_claim_checks",
+        "schedule": 3600,
+    },
+    "report-stuck-pipelines": {
+        "task": "repopal.worker.report_stuck_pipelines",
+        "schedule": 300,
+    },
+}
+
+logger = logging.getLogger(__name__)
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def stop_async_runtime(**kwargs):
+    """Close the process's event loop and pooled clients with the worker"""
+    shutdown_async_runtime()
 
 
 @celery.task
 def example_task():
     return "Task completed"
+
+
+@celery.task(name="repopal.worker.process_webhook_delivery", acks_late=True)
+def process_webhook_delivery(delivery_id: str):
+    """Turn a persisted webhook delivery into a standardized event and process it"""
+    db = SessionLocal()
+    try:
+        inbox = WebhookInbox(db, coalescer=get_event_coalescer())
+        delivery = inbox.claim(delivery_id)
+        if delivery is None:
+            logger.info(f"Webhook delivery {delivery_id} missing or already claimed")
+            return None
+
+        if inbox.is_superseded(delivery):
+            logger.info(f"Webhook delivery {delivery_id} superseded by a later event")
+            inbox.supersede(delivery)
+            return None
+
+        try:
+            handler = ServiceHandlerFactory.get_handler(delivery.provider)
+            payload = handler.decode_payload(delivery.body, delivery.content_type)
+            event = handler.process_webhook(
+                payload,
+                raw_body=delivery.body,
+                content_type=delivery.content_type,
+                headers=delivery.headers,
+            )
+            logger.info(
+                f"Processing {event.provider.value} {event.event_type} event "
+                f"from delivery {delivery_id}"
+            )
+            runner = PipelineRunner(db)
+            # A requeued delivery must not start a second pipeline
+            run = runner.repository.get_by_delivery(db, delivery.id) or runner.create(
+                event, delivery_id=delivery.id, subject=delivery.subject
+            )
+        except Exception as e:
+            inbox.fail(delivery, str(e))
+            raise
+
+        try:
+            # A deferred tenant's run stays behind other tenants' at every hop
+            enqueue_pipeline(
+                str(run.id), JobClass(run.job_class), priority=delivery.priority
+            )
+        except Exception as e:
+            # The run is saved; once requeued, the delivery enqueues it again
+            inbox.release(delivery, str(e))
+            raise
+
+        inbox.complete(delivery)
+        return {
+            "delivery_id": delivery_id,
+            "event_type": event.event_type,
+            "pipeline_run_id": str(run.id),
+        }
+    finally:
+        db.close()
+
+
+def enqueue_pipeline(
+    run_id: str,
+    job_class: JobClass,
+    countdown: float = 0,
+    priority: int | None = None,
+) -> None:
+    """Queue a pipeline run on its cost class's queue, at the given priority"""
+    options = {"queue": queue_for(job_class), "countdown": countdown}
+    if priority is not None:
+        options["priority"] = priority
+    run_pipeline.apply_async(
+        args=[run_id],
+        kwargs={
+            "job_class": job_class.value,
+            "enqueued_at": time.time() + countdown,
+            "priority": priority,
+        },
+        **options,
+    )
+
+
+@celery.task(name="repopal.worker.run_pipeline", bind=True, acks_late=True)
+def run_pipeline(
+    self,
+    run_id: str,
+    job_class: str = JobClass.CHANGE.value,
+    enqueued_at: float | None = None,
+    priority: int | None = None,
+):
+    """Run a pipeline, resuming from its last checkpoint if it ran before"""
+    if enqueued_at is not None:
+        # Time spent queued after the job became due, per cost class
+        metrics.observe(
+            "pipeline_queue_wait_seconds",
+            max(0.0, time.time() - enqueued_at),
+            job_class=job_class,
+        )
+
+    db = SessionLocal()
+    try:
+        # One loop per worker process, so LLM and GitHub clients keep their
+        # connection pools from one pipeline to the next
+        runtime = get_async_runtime()
+        runner = PipelineRunner(
+            db,
+            runtime.shared("pipeline_services", PipelineServices.default),
+            leases=get_repository_leases(),
+            cancellations=get_cancellation_registry(),
+        )
+        retry_options = {"max_retries": None, "queue": queue_for(JobClass(job_class))}
+        if priority is not None:
+            retry_options["priority"] = priority
+        try:
+            run = runtime.run(runner.run(run_id))
+        except (PipelineNotFoundError, PipelineStateError) as e:
+            # Finished, or already being run by another worker
+            logger.info(f"Not running pipeline {run_id}: {e}")
+            return None
+        except RepositoryBusyError as e:
+            # Give the worker slot to another repository's job and check back
+            countdown = settings.REPO_LEASE_RETRY_SECONDS * random.uniform(1, 1.5)
+            logger.info(f"Pipeline {run_id} waiting: {e}")
+            raise self.retry(
+                countdown=countdown,
+                kwargs={
+                    "job_class": job_class,
+                    "enqueued_at": time.time() + countdown,
+                    "priority": priority,
+                },
+                **retry_options,
+            )
+
+        if run.status == PipelineStatus.RETRYING:
+            countdown = settings.PIPELINE_RETRY_BACKOFF_SECONDS * 2 ** (
+                run.attempts - 1
+            )
+            logger.info(
+                f"Retrying pipeline {run_id} at {run.current_stage} in {countdown}s"
+            )
+            # The runner enforces PIPELINE_MAX_ATTEMPTS, not Celery
+            raise self.retry(
+                countdown=countdown,
+                kwargs={
+                    "job_class": job_class,
+                    "enqueued_at": time.time() + countdown,
+                    "priority": priority,
+                },
+                **retry_options,
+            )
+        return {"pipeline_run_id": run_id, "status": run.status.value}
+    finally:
+        db.close()
+
+
+@celery.task(name="repopal.worker.prepare_workspace", ignore_result=True)
+def prepare_workspace(repo_url: str):
+    """Mirror a repository and build its likely image ahead of its pipeline"""
+    if not settings.SPECULATIVE_PREPARE_ENABLED:
+        return None
+    return WorkspacePreparer.default().prepare(repo_url)
+
+
+@celery.task(name="repopal.worker.requeue_stale_deliveries")
+def requeue_stale_deliveries():
+    """Re-enqueue inbox deliveries that were never picked up by a worker"""
+    db = SessionLocal()
+    try:
+        inbox = WebhookInbox(db)
+        return inbox.requeue_stale(
+            timedelta(seconds=settings.WEBHOOK_INBOX_STALE_SECONDS)
+        )
+    finally:
+        db.close()
+
+
+@celery.task(name="repopal.worker.prune_claim_checks")
+def prune_claim_checks():
+    """Delete claim-checked payloads no task has stored within the TTL"""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.CLAIM_CHECK_TTL_SECONDS)
+    return get_blob_store().prune(cutoff)
+
+
+@celery.task(name="repopal.worker.report_stuck_pipelines")
+def report_stuck_pipelines():
+    """Log unfinished pipeline runs that have stopped making progress"""
+    idle_since = datetime.utcnow() - timedelta(seconds=settings.PIPELINE_STALE_SECONDS)
+    db = SessionLocal()
+    try:
+        stuck = PipelineRunRepository().get_stuck(db, idle_since)
+        metrics.set_gauge("pipeline_stuck_runs", len(stuck))
+        for run in stuck:
+            logger.warning(
+                f"Pipeline {run.id} on {run.repository} is {run.status.value} "
+                f"at {run.current_stage} since {run.updated_at}"
+            )
+        return [str(run.id) for run in stuck]
+    finally:
+        db.close()
@@ -1,13 +1,18 @@
 import hashlib
 import hmac
 import json
+import os
 from typing import Any, Dict, Tuple
 
+import fakeredis
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+# Keep litellm from fetching its model price list over the network on import
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
 from repopal.core.database import Base, get_db
 from repopal.main import app
 
@@ -89,3 +94,9 @@ def webhook_signature():
         return headers, payload_bytes
 
     return _generate_signature
+
+
+@pytest.fixture
+def redis_client():
+    """In-memory Redis for components that rely on Redis commands and Lua scripts"""
+    return fakeredis.FakeRedis()
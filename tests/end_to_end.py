@@ -54,7 +54,7 @@ async def test_end_to_end_workflow(test_repo, webhook_signature):
         headers, payload_bytes = webhook_signature(webhook_secret, issue_payload)
 
         # Validate webhook
-        assert service_handler.validate_webhook(headers, issue_payload) is True
+        assert service_handler.validate_webhook(headers, payload_bytes) is True
 
         # Process webhook to get standardized event
         event = service_handler.process_webhook(issue_payload)
@@ -1,3 +1,4 @@
+import json
 from unittest.mock import Mock, patch
 
 import pytest
@@ -89,11 +90,11 @@ def test_webhook_validation(github_handler):
         "X-Hub-Signature-256": "sha256=e963f47c6ffc36ae3362892b6c61d9211ff39452d0d28410bd046c3b011e4d8d"
     }
 
-    assert github_handler.validate_webhook(headers, payload) == True
+    assert github_handler.validate_webhook(headers, json.dumps(payload).encode()) == True
 
     # Test invalid signature
     headers["X-Hub-Signature-256"] = "sha256=invalid"
-    assert github_handler.validate_webhook(headers, payload) == False
+    assert github_handler.validate_webhook(headers, json.dumps(payload).encode()) == False
 
 def test_process_issue_webhook(github_handler, sample_issue_payload):
     event = github_handler.process_webhook(sample_issue_payload)
@@ -219,7 +220,7 @@ def test_send_response_unsupported_event(github_handler, sample_push_payload):
 def test_webhook_validation_missing_signature(github_handler):
     headers = {}  # No signature header
     payload = {"test": "data"}
-    assert github_handler.validate_webhook(headers, payload) == False
+    assert github_handler.validate_webhook(headers, json.dumps(payload).encode()) == False
 
 @pytest.fixture
 def sample_pr_comment_payload():
@@ -64,7 +64,7 @@ def test_webhook_validation(slack_handler):
         'X-Slack-Signature': signature
     }
 
-    assert slack_handler.validate_webhook(headers, payload) == True
+    assert slack_handler.validate_webhook(headers, json.dumps(payload).encode()) == True
 
 def test_process_message_webhook(slack_handler, sample_message_payload):
     event = slack_handler.process_webhook(sample_message_payload)
@@ -85,39 +85,38 @@ def test_process_slash_command_webhook(slack_handler, sample_slash_command_paylo
 @pytest.mark.asyncio
 async def test_send_response(slack_handler, sample_message_payload):
     with patch('slack_sdk.WebClient.chat_postMessage') as mock_post:
-        mock_post.return_value = {"ts": "1234567890.123456"}
+        mock_post.return_value = {"ts": "1234567890.123457"}
 
         thread_id = slack_handler.send_response(
             payload=sample_message_payload,
             message="Test response",
-            response_type=ResponseType.COMMENT
+            response_type=ResponseType.INITIAL
         )
 
-        assert thread_id == "1234567890.123456"
+        # Posted in the thread of the requester's message
+        assert thread_id == "1234567890.123457"
         mock_post.assert_called_once_with(
             channel="C123456",
             text="Test response",
-            thread_ts=None
+            thread_ts="1234567890.123456"
         )
 
 @pytest.mark.asyncio
-async def test_send_threaded_response(slack_handler, sample_message_payload):
-    with patch('slack_sdk.WebClient.chat_postMessage') as mock_post:
-        mock_post.return_value = {"ts": "1234567890.123457"}
-
+async def test_final_response_updates_message(slack_handler, sample_message_payload):
+    with patch('slack_sdk.WebClient.chat_update') as mock_update, \
+            patch('slack_sdk.WebClient.chat_postMessage') as mock_post:
         thread_id = slack_handler.send_response(
             payload=sample_message_payload,
             message="Test response",
-            response_type=ResponseType.COMMENT,
-            thread_id="1234567890.123456"
+            response_type=ResponseType.FINAL,
+            thread_id="1234567890.123457"
         )
 
         assert thread_id == "1234567890.123457"
-        mock_post.assert_called_once_with(
-            channel="C123456",
-            text="Test response",
-            thread_ts="1234567890.123456"
+        mock_update.assert_called_once_with(
+            channel="C123456", ts="1234567890.123457", text="Test response"
         )
+        mock_post.assert_not_called()
 
 def test_send_response_error(slack_handler, sample_message_payload):
     with patch('slack_sdk.WebClient.chat_postMessage') as mock_post:
@@ -127,7 +126,7 @@ def test_send_response_error(slack_handler, sample_message_payload):
             slack_handler.send_response(
                 payload=sample_message_payload,
                 message="Test response",
-                response_type=ResponseType.COMMENT
+                response_type=ResponseType.INITIAL
             )
 
 def test_url_verification(slack_handler):
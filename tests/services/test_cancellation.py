@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from repopal.schemas.service_handler import ServiceProvider
+from repopal.services.cancellation import CancellationRegistry
+
+
+def test_cancels_runs_created_before_the_notice(redis_client):
+    registry = CancellationRegistry(redis_client)
+    before = datetime.utcnow() - timedelta(seconds=1)
+
+    registry.cancel(ServiceProvider.GITHUB, "org/repo#1")
+
+    assert registry.is_cancelled(ServiceProvider.GITHUB, "org/repo#1", before)
+    after = datetime.utcnow() + timedelta(seconds=1)
+    assert not registry.is_cancelled(ServiceProvider.GITHUB, "org/repo#1", after)
+
+
+def test_subjects_and_providers_are_independent(redis_client):
+    registry = CancellationRegistry(redis_client)
+    before = datetime.utcnow() - timedelta(seconds=1)
+
+    registry.cancel(ServiceProvider.GITHUB, "org/repo#1")
+
+    assert not registry.is_cancelled(ServiceProvider.GITHUB, "org/repo#2", before)
+    assert not registry.is_cancelled(ServiceProvider.SLACK, "org/repo#1", before)
+    assert not registry.is_cancelled(ServiceProvider.GITHUB, None, before)
+
+
+def test_redis_outage_fails_open():
+    unreachable = redis.Redis(
+        host="127.0.0.1", port=1, socket_connect_timeout=0.1, retry=Retry(NoBackoff(), 0)
+    )
+    registry = CancellationRegistry(unreachable)
+
+    registry.cancel(ServiceProvider.GITHUB, "org/repo#1")
+
+    assert not registry.is_cancelled(
+        ServiceProvider.GITHUB, "org/repo#1", datetime.utcnow()
+    )
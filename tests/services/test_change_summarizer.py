@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from repopal.core.metrics import metrics
+from repopal.schemas.changes import RepositoryChanges, TrackedChange, UntrackedChange
+from repopal.services.change_summarizer import ChangeSummarizer, split_lines
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+class FakeLLM:
+    """Counts a token per character and records each prompt's changes"""
+
+    def __init__(self):
+        self.single = 0
+        self.parts = []
+        self.combined = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def count_tokens(self, text):
+        return len(text)
+
+    async def generate_change_summary(self, user_request, command_name, output, changes):
+        self.single += 1
+        return "One summary"
+
+    async def generate_partial_change_summary(self, user_request, command_name, changes):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        self.parts.append(changes)
+        return f"summary {len(self.parts)}"
+
+    async def combine_change_summaries(
+        self, user_request, command_name, output, summaries, omitted
+    ):
+        self.combined = (summaries, omitted)
+        return "Combined summary"
+
+
+def changes(*files, new=()):
+    return RepositoryChanges(
+        tracked_changes=[TrackedChange(path=path, diff=diff) for path, diff in files],
+        untracked_changes=[UntrackedChange(path=path, content=c) for path, c in new],
+    )
+
+
+def summarizer(llm, **overrides):
+    options = dict(
+        prompt_max_tokens=1000, chunk_tokens=300, concurrency=2, budget_tokens=5000
+    )
+    options.update(overrides)
+    return ChangeSummarizer(llm, **options)
+
+
+@pytest.mark.asyncio
+async def test_small_changes_use_one_prompt():
+    llm = FakeLLM()
+
+    summary = await summarizer(llm).summarize(
+        "Fix typo", "find_replace", "done", changes(("a.py", "-teh\n+the\n"))
+    )
+
+    assert summary == "One summary"
+    assert llm.single == 1 and not llm.parts
+    assert metrics.counter("change_summaries_total", strategy="single") == 1
+
+
+@pytest.mark.asyncio
+async def test_large_changes_are_mapped_then_reduced():
+    llm = FakeLLM()
+    large = "".join(f"+line {i}\n" for i in range(100))  # About 900 tokens
+
+    summary = await summarizer(llm).summarize(
+        "Rename",
+        "find_replace",
+        "done",
+        changes(("big.py", large), ("a.py", "+a\n"), new=[("b.py", "b\n")]),
+    )
+
+    assert summary == "Combined summary"
+    assert llm.single == 0
+    # Small files share a chunk; the large one is split on line boundaries
+    assert "File: a.py" in llm.parts[0] and "File: b.py" in llm.parts[0]
+    assert any("File: big.py (part 1 of" in part for part in llm.parts)
+    assert all(len(part) < 400 for part in llm.parts)
+    assert llm.max_in_flight == 2
+    summaries, omitted = llm.combined
+    assert len(summaries) == len(llm.parts) and omitted == []
+
+
+@pytest.mark.asyncio
+async def test_budget_is_never_exceeded():
+    llm = FakeLLM()
+    files = [(f"f{i}.py", "x" * 250) for i in range(20)]
+
+    await summarizer(llm, budget_tokens=3000).summarize(
+        "Rename", "find_replace", None, changes(*files)
+    )
+
+    spent = metrics.counter("change_summary_prompt_tokens_total", strategy="map_reduce")
+    assert 0 < spent <= 3000
+    _, omitted = llm.combined
+    assert omitted and len(llm.parts) + len(omitted) == 20
+
+
+def test_split_lines_cuts_overlong_lines():
+    assert split_lines("ab\ncd\n", 3) == ["ab\n", "cd\n"]
+    assert split_lines("abcdefg", 3) == ["abc", "def", "g"]
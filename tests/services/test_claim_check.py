@@ -0,0 +1,130 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from repopal.schemas.changes import RepositoryChanges, TrackedChange
+from repopal.schemas.command import CommandResult
+from repopal.schemas.service_handler import StandardizedEvent
+from repopal.services.claim_check import (
+    BlobNotFoundError,
+    ClaimCheck,
+    DatabaseBlobStore,
+    FileBlobStore,
+)
+
+
+@pytest.fixture(params=["database", "file"])
+def blob_store(request, tmp_path):
+    if request.param == "file":
+        return FileBlobStore(tmp_path / "blobs")
+    db = request.getfixturevalue("db")
+    return DatabaseBlobStore(sessionmaker(bind=db.get_bind()))
+
+
+def large_changes(files: int) -> RepositoryChanges:
+    return RepositoryChanges(
+        tracked_changes=[
+            TrackedChange(path=f"src/file_{i}.py", diff="+print('hello')\n" * 200)
+            for i in range(files)
+        ],
+        untracked_changes=[],
+    )
+
+
+def test_large_payload_travels_as_reference(blob_store):
+    claim_check = ClaimCheck(blob_store, inline_max_bytes=1024)
+    changes = large_changes(50)
+
+    envelope = claim_check.check_in(changes)
+
+    assert "inline" not in envelope
+    assert len(json.dumps(envelope)) < 200
+    assert claim_check.check_out(envelope) == changes
+
+
+def test_envelope_size_is_flat_in_payload_size(blob_store):
+    claim_check = ClaimCheck(blob_store, inline_max_bytes=1024)
+
+    small = json.dumps(claim_check.check_in(large_changes(5)))
+    huge = json.dumps(claim_check.check_in(large_changes(500)))
+
+    assert len(huge) - len(small) <= 3  # Only the size field grows
+
+
+def test_identical_payloads_are_stored_once(blob_store):
+    claim_check = ClaimCheck(blob_store, inline_max_bytes=0)
+    result = CommandResult(success=True, message="done", output="x" * 5000)
+
+    first = claim_check.check_in(result)
+    second = claim_check.check_in(result.model_copy())
+
+    assert first["digest"] == second["digest"]
+    assert claim_check.check_out(second) == result
+
+
+def test_small_payload_travels_inline(blob_store):
+    claim_check = ClaimCheck(blob_store, inline_max_bytes=1024)
+    event = StandardizedEvent(
+        provider="github",
+        event_type="issue",
+        user_request="Check issue",
+        payload={"repository": "org/repo"},
+        raw_body=b'{"action": "opened"}',
+        content_type="application/json",
+    )
+
+    envelope = claim_check.check_in(event)
+
+    assert envelope["kind"] == "event"
+    assert "digest" not in envelope
+    assert claim_check.check_out(envelope) == event
+
+
+def test_event_body_travels_by_reference(blob_store):
+    claim_check = ClaimCheck(blob_store, inline_max_bytes=1024)
+    body = json.dumps({"issue": {"body": "x" * 10000}}).encode()
+    event = StandardizedEvent(
+        provider="github",
+        event_type="issue",
+        user_request="Check issue",
+        payload={"repository": "org/repo"},
+        raw_body=body,
+        content_type="application/json",
+    )
+
+    envelope = claim_check.check_in(event)
+
+    # The standardized fields stay inline; only the body is stored
+    assert "inline" in envelope
+    assert len(json.dumps(envelope)) < 1024
+    assert blob_store.get(envelope["body"]) == body
+    restored = claim_check.check_out(envelope)
+    assert restored.raw_body == body
+    assert restored == event
+
+
+def test_binary_payload_is_stored_even_when_small(blob_store):
+    claim_check = ClaimCheck(blob_store, inline_max_bytes=1024)
+
+    envelope = claim_check.check_in(b"\xff\xfe")
+
+    assert claim_check.check_out(envelope) == b"\xff\xfe"
+    assert "digest" in envelope
+
+
+def test_pruned_payload_raises(blob_store):
+    claim_check = ClaimCheck(blob_store, inline_max_bytes=0)
+    envelope = claim_check.check_in({"diff": "+line"})
+
+    assert blob_store.prune(datetime.utcnow() + timedelta(minutes=1)) == 1
+    with pytest.raises(BlobNotFoundError):
+        claim_check.check_out(envelope)
+
+
+def test_unsupported_payload_type():
+    claim_check = ClaimCheck(FileBlobStore("unused"))
+
+    with pytest.raises(TypeError):
+        claim_check.check_in(object())
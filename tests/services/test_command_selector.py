@@ -1,11 +1,12 @@
-import asyncio
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 import pytest
 
 from repopal.schemas.command import CommandMetadata
 from repopal.schemas.service_handler import StandardizedEvent
 from repopal.services.command_selector import CommandSelectorService
+from repopal.services.commands.find_replace import FindReplaceCommand
+from repopal.services.llm import LLMService
 
 
 class MockCommand:
@@ -19,18 +20,9 @@ class MockCommand:
 
 @pytest.fixture
 def service():
-    with patch("repopal.services.llm.LLMService") as mock_class:
-        instance = mock_class.return_value
-        # Mock async methods
-        instance.select_command.return_value = "test_command"
-        instance.select_command.return_value = asyncio.Future()
-        instance.select_command.return_value.set_result("test_command")
-
-        instance.generate_command_args.return_value = asyncio.Future()
-        instance.generate_command_args.return_value.set_result({"arg1": "value1"})
-        service = CommandSelectorService()
-        service.llm = instance  # Explicitly set the mock instance
-        yield service, instance
+    llm = AsyncMock(spec=LLMService)
+    llm.select_command_with_args.return_value = ("test_command", {"arg1": "value1"})
+    yield CommandSelectorService(llm=llm), llm
 
 
 @pytest.fixture
@@ -42,10 +34,9 @@ def mock_command_factory():
         yield mock
 
 
-async def test_select_and_prepare_command_success(service, mock_command_factory):
-    service_instance, mock_llm = service
-    # Arrange
-    event = StandardizedEvent(
+@pytest.fixture
+def event():
+    return StandardizedEvent(
         provider="github",
         event_type="push",
         payload={},
@@ -53,37 +44,71 @@ async def test_select_and_prepare_command_success(service, mock_command_factory)
         raw_payload={"test": "data"},
     )
 
-    # Act
+
+async def test_select_and_prepare_command_success(service, mock_command_factory, event):
+    service_instance, mock_llm = service
+
     command, args = await service_instance.select_and_prepare_command(event)
 
-    # Assert
     mock_command_factory.get_commands_for_event.assert_called_once_with(
         event.event_type
     )
-    mock_llm.select_command.assert_called_once_with(
-        "Test user request",
-        [{"name": "test_command", "description": "Test command description"}],
+    # Selection and arguments come from one LLM call
+    mock_llm.select_command_with_args.assert_awaited_once_with(
+        "Test user request", mock_command_factory.get_commands_for_event.return_value
     )
-    mock_llm.generate_command_args.assert_called_once()
+    mock_llm.generate_command_args.assert_not_called()
     assert isinstance(command, MockCommand)
     assert args == {"arg1": "value1"}
 
 
-async def test_select_and_prepare_command_no_commands(service, mock_command_factory):
+async def test_select_and_prepare_command_no_commands(
+    service, mock_command_factory, event
+):
     service_instance, _ = service
-    # Arrange
-    event = StandardizedEvent(
-        provider="github",
-        event_type="unknown_event",
-        payload={},
-        user_request="Test user request",
-        raw_payload={"test": "data"},
-    )
+    event.event_type = "unknown_event"
     mock_command_factory.get_commands_for_event.return_value = []
 
-    # Act & Assert
     with pytest.raises(ValueError, match="No commands available for this event type"):
         await service_instance.select_and_prepare_command(event)
 
 
+class ToolCallingLLM(LLMService):
+    def __init__(self, name, arguments):
+        super().__init__()
+        self.reply = (name, arguments)
+        self.tools = None
+
+    async def get_tool_call(self, system_prompt, user_prompt, tools):
+        self.tools = tools
+        return self.reply
+
+
+async def test_tool_call_arguments_are_validated():
+    llm = ToolCallingLLM(
+        "find_replace", {"find_pattern": "foo", "replace_text": "bar"}
+    )
+
+    name, args = await llm.select_command_with_args(
+        "Rename foo to bar", [FindReplaceCommand()]
+    )
+
+    assert name == "find_replace"
+    # Defaults from the arguments model are filled in
+    assert args == {"find_pattern": "foo", "replace_text": "bar", "file_pattern": "*"}
+    parameters = llm.tools[0]["function"]["parameters"]
+    assert parameters["required"] == ["find_pattern", "replace_text"]
+
+
+async def test_invalid_tool_call_is_rejected():
+    with pytest.raises(ValueError):
+        await ToolCallingLLM("find_replace", {"find_pattern": "foo"}).select_command_with_args(
+            "Rename foo", [FindReplaceCommand()]
+        )
+    with pytest.raises(ValueError, match="not found"):
+        await ToolCallingLLM("rm_rf", {}).select_command_with_args(
+            "Rename foo", [FindReplaceCommand()]
+        )
+
+
 pytestmark = pytest.mark.asyncio
@@ -0,0 +1,53 @@
+import pytest
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from repopal.core.metrics import metrics
+from repopal.schemas.service_handler import ServiceProvider
+from repopal.services.delivery_dedup import DeliveryDeduplicator
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_repeat_delivery_is_duplicate(redis_client):
+    dedup = DeliveryDeduplicator(redis_client, ttl_seconds=60)
+
+    assert dedup.is_duplicate(ServiceProvider.SLACK, "Ev123") is False
+    assert dedup.is_duplicate(ServiceProvider.SLACK, "Ev123") is True
+    # IDs are namespaced per provider
+    assert dedup.is_duplicate(ServiceProvider.GITHUB, "Ev123") is False
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]['webhook_duplicates_total{provider="slack"}'] == 1
+    assert snapshot["gauges"]['webhook_duplicate_ratio{provider="slack"}'] == 0.5
+
+
+def test_seen_ids_expire(redis_client):
+    dedup = DeliveryDeduplicator(redis_client, ttl_seconds=60)
+    dedup.is_duplicate(ServiceProvider.GITHUB, "abc")
+
+    assert 0 < redis_client.ttl("repopal:delivery:github:abc") <= 60
+
+
+def test_forget_allows_retry(redis_client):
+    dedup = DeliveryDeduplicator(redis_client, ttl_seconds=60)
+    dedup.is_duplicate(ServiceProvider.GITHUB, "abc")
+
+    dedup.forget(ServiceProvider.GITHUB, "abc")
+
+    assert dedup.is_duplicate(ServiceProvider.GITHUB, "abc") is False
+
+
+def test_fails_open_when_redis_is_down():
+    client = redis.Redis(
+        host="127.0.0.1", port=1, socket_connect_timeout=0.1, retry=Retry(NoBackoff(), 0)
+    )
+    dedup = DeliveryDeduplicator(client, ttl_seconds=60)
+
+    assert dedup.is_duplicate(ServiceProvider.GITHUB, "abc") is False
@@ -0,0 +1,87 @@
+import pytest
+
+from repopal.schemas.service_handler import RouteKey, SenderType, ServiceProvider
+from repopal.services.event_router import EventRouter, RoutingRule, get_event_router
+from repopal.services.service_handlers.github import GitHubHandler
+from repopal.services.service_handlers.slack import SlackHandler
+
+
+@pytest.fixture
+def github_handler():
+    return GitHubHandler(webhook_secret="test_secret", github_token="test_token")
+
+
+@pytest.fixture
+def slack_handler():
+    return SlackHandler(signing_secret="test_secret", bot_token="test_token")
+
+
+def comment_payload(body, sender):
+    return {
+        "action": "created",
+        "comment": {"body": body, "user": sender},
+        "issue": {"number": 3, "title": "Flaky test"},
+        "repository": {"full_name": "org/repo"},
+        "sender": sender,
+    }
+
+
+def test_issue_opened_is_routed(github_handler):
+    payload = {
+        "action": "opened",
+        "issue": {"title": "Bug", "body": "Broken"},
+        "sender": {"login": "user1", "type": "User"},
+    }
+    key = github_handler.route_key({"X-GitHub-Event": "issues"}, payload)
+
+    assert get_event_router().match(key).name == "github_issue"
+
+
+def test_label_change_and_push_are_dropped(github_handler):
+    router = get_event_router()
+    labeled = {"action": "labeled", "issue": {"title": "Bug"}, "sender": {"login": "user1"}}
+    push = {"ref": "refs/heads/main", "pusher": {"name": "user1"}, "sender": {"login": "user1"}}
+
+    assert router.match(github_handler.route_key({"X-GitHub-Event": "issues"}, labeled)) is None
+    assert router.match(github_handler.route_key({"X-GitHub-Event": "push"}, push)) is None
+
+
+def test_comment_needs_mention(github_handler):
+    router = get_event_router()
+    user = {"login": "user1", "type": "User"}
+
+    plain = github_handler.route_key({}, comment_payload("Looks good", user))
+    mention = github_handler.route_key({}, comment_payload("@RepoPal fix the test", user))
+
+    assert router.match(plain) is None
+    assert router.match(mention).name == "github_comment"
+
+
+def test_own_comments_are_never_routed(github_handler):
+    app = {"login": "repopal[bot]", "type": "Bot"}
+    key = github_handler.route_key({}, comment_payload("Working on it @repopal", app))
+
+    assert key.sender_type == SenderType.SELF
+    assert get_event_router().match(key) is None
+
+
+def test_slack_mentions_and_slash_commands(slack_handler):
+    router = get_event_router()
+    mention = {"type": "event_callback", "event": {"type": "app_mention", "text": "hi", "user": "U1"}}
+    chatter = {"type": "event_callback", "event": {"type": "message", "text": "lunch?", "user": "U1"}}
+    bot = {"type": "event_callback", "event": {"type": "app_mention", "text": "hi", "bot_id": "B9"}}
+    command = {"command": "/repopal", "text": "explain", "user_name": "dev"}
+
+    assert router.match(slack_handler.route_key({}, mention)).name == "slack_message"
+    assert router.match(slack_handler.route_key({}, chatter)) is None
+    assert router.match(slack_handler.route_key({}, bot)) is None
+    assert router.match(slack_handler.route_key({}, command)).name == "slack_slash_command"
+
+
+def test_wildcard_action_rules():
+    router = EventRouter(
+        [RoutingRule(name="any_pr", provider=ServiceProvider.GITHUB, event_type="pull_request")]
+    )
+    key = RouteKey(ServiceProvider.GITHUB, "pull_request", "synchronize", SenderType.USER, False)
+
+    assert router.match(key).name == "any_pr"
@@ -0,0 +1,65 @@
+from repopal import worker
+from repopal.core.config import settings
+from repopal.schemas.service_handler import ServiceProvider, StandardizedEvent
+from repopal.services.job_classes import JobClass, classify_event, queue_for
+
+
+def make_event(provider: ServiceProvider, event_type: str) -> StandardizedEvent:
+    return StandardizedEvent(
+        provider=provider,
+        event_type=event_type,
+        user_request="How does the webhook router work?",
+        payload={},
+        raw_payload={},
+    )
+
+
+def test_slack_conversations_take_the_fast_lane():
+    assert (
+        classify_event(make_event(ServiceProvider.SLACK, "message"))
+        == JobClass.INTERACTIVE
+    )
+    assert (
+        classify_event(make_event(ServiceProvider.SLACK, "slash_command"))
+        == JobClass.INTERACTIVE
+    )
+
+
+def test_github_and_unknown_events_are_change_jobs():
+    assert classify_event(make_event(ServiceProvider.GITHUB, "issue")) == JobClass.CHANGE
+    assert classify_event(make_event(ServiceProvider.SLACK, "unknown")) == JobClass.CHANGE
+
+
+def test_each_class_has_its_own_queue():
+    assert queue_for(JobClass.INTERACTIVE) == settings.PIPELINE_INTERACTIVE_QUEUE
+    assert queue_for(JobClass.CHANGE) == settings.PIPELINE_CHANGE_QUEUE
+    assert len({queue_for(job_class) for job_class in JobClass}) == len(JobClass)
+
+
+def test_enqueue_routes_by_class(monkeypatch):
+    sent = []
+    monkeypatch.setattr(
+        worker.run_pipeline, "apply_async", lambda **options: sent.append(options)
+    )
+
+    worker.enqueue_pipeline("run-1", JobClass.INTERACTIVE)
+
+    assert sent[0]["queue"] == settings.PIPELINE_INTERACTIVE_QUEUE
+    assert sent[0]["args"] == ["run-1"]
+    assert sent[0]["kwargs"]["job_class"] == "interactive"
+    assert "priority" not in sent[0]
+
+
+def test_enqueue_keeps_a_deferred_priority(monkeypatch):
+    sent = []
+    monkeypatch.setattr(
+        worker.run_pipeline, "apply_async", lambda **options: sent.append(options)
+    )
+
+    worker.enqueue_pipeline(
+        "run-1", JobClass.CHANGE, priority=settings.WEBHOOK_DEFERRED_PRIORITY
+    )
+
+    assert sent[0]["priority"] == settings.WEBHOOK_DEFERRED_PRIORITY
+    # Carried along so retries of the run are queued at the same priority
+    assert sent[0]["kwargs"]["priority"] == settings.WEBHOOK_DEFERRED_PRIORITY
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import pytest
+
+from repopal.services.llm import AnswerParser, LLMService
+from repopal.services.llm_gateway import LLMGateway
+
+
+def test_answer_tags_split_across_chunks():
+    parser = AnswerParser()
+    chunks = ["<reasoning>Short.</reason", "ing><ans", "wer>find_", "replace</an", "swer>"]
+
+    closed = [parser.feed(chunk) for chunk in chunks]
+
+    assert closed == [False, False, False, False, True]
+    assert parser.answer == "find_replace"
+
+
+def test_answer_cut_off_by_stop_sequence():
+    parser = AnswerParser()
+    parser.feed("<reasoning>Because.</reasoning>\n<answer>\naider\n")
+
+    assert not parser.done
+    assert parser.answer == "aider"
+
+
+def test_text_without_tags_is_the_answer():
+    parser = AnswerParser()
+    parser.feed("  find_replace ")
+
+    assert parser.answer == "find_replace"
+
+
+class FakeStream:
+    def __init__(self, pieces):
+        self.pieces = list(pieces)
+        self.received = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.pieces:
+            raise StopAsyncIteration
+        self.received += 1
+        content = self.pieces.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_streaming_returns_once_the_answer_closes():
+    stream = FakeStream(["<answer>aider", "</answer>", "never read"])
+    requests = []
+
+    async def fake_acompletion(**kwargs):
+        requests.append(kwargs)
+        return stream
+
+    llm = LLMService(gateway=LLMGateway(complete=fake_acompletion))
+    llm.streaming = True
+
+    answer = await llm.get_completion("System", "Pick one", skip_reasoning=True)
+
+    assert answer == "aider"
+    assert stream.received == 2 and stream.closed
+    assert requests[0]["stop"] == ["</answer>"]
+    assert requests[0]["stream"] is True
+    assert "Skip the reasoning" in requests[0]["messages"][0]["content"]
@@ -0,0 +1,91 @@
+import pytest
+
+from repopal.core.metrics import metrics
+from repopal.services.commands.factory import CommandFactory
+from repopal.services.commands.hello_world import HelloWorldCommand
+from repopal.services.llm import LLMService
+from repopal.services.llm_cache import LLMResponseCache
+
+COMMANDS = [{"name": "find_replace", "description": "Find and replace text"}]
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+class CountingLLM(LLMService):
+    def __init__(self, cache, answer="find_replace"):
+        super().__init__(cache=cache)
+        self.answer = answer
+        self.calls = 0
+
+    async def get_completion(
+        self, system_prompt: str, user_prompt: str, skip_reasoning: bool = False
+    ) -> str:
+        self.calls += 1
+        return self.answer
+
+
+@pytest.mark.asyncio
+async def test_repeated_selection_is_answered_from_memory(redis_client):
+    llm = CountingLLM(LLMResponseCache(redis_client))
+
+    assert await llm.select_command("Rename foo to bar", COMMANDS) == "find_replace"
+    # Whitespace differences do not defeat the cache
+    assert await llm.select_command("Rename  foo to\nbar", COMMANDS) == "find_replace"
+
+    assert llm.calls == 1
+    assert metrics.counter("llm_cache_requests_total", kind="select_command", tier="memory") == 1
+    assert metrics.snapshot()["gauges"]['llm_cache_hit_ratio{kind="select_command"}'] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_workers_share_answers_through_redis(redis_client):
+    first = CountingLLM(LLMResponseCache(redis_client), answer="{'find': 'a'}")
+    second = CountingLLM(LLMResponseCache(redis_client), answer="{'find': 'b'}")
+
+    assert await first.generate_command_args("Replace a", "docs") == {"find": "a"}
+    assert await second.generate_command_args("Replace a", "docs") == {"find": "a"}
+
+    assert second.calls == 0
+    assert metrics.counter("llm_cache_requests_total", kind="command_args", tier="redis") == 1
+
+
+@pytest.mark.asyncio
+async def test_unusable_answers_are_not_cached(redis_client):
+    llm = CountingLLM(LLMResponseCache(redis_client), answer="no_such_command")
+
+    await llm.select_command("Rename foo", COMMANDS)
+    await llm.select_command("Rename foo", COMMANDS)
+
+    assert llm.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_changing_commands_invalidates(redis_client, monkeypatch):
+    monkeypatch.setattr(CommandFactory, "_commands", dict(CommandFactory._commands))
+    monkeypatch.setattr(CommandFactory, "_fingerprint", None)
+    llm = CountingLLM(LLMResponseCache(redis_client))
+
+    await llm.select_command("Rename foo", COMMANDS)
+    CommandFactory.register(HelloWorldCommand)
+    await llm.select_command("Rename foo", COMMANDS)
+    assert llm.calls == 2
+
+    llm.cache.invalidate()
+    await llm.select_command("Rename foo", COMMANDS)
+    assert llm.calls == 3
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = LLMResponseCache(max_entries=2)
+    cache.set("k", "a", 1)
+    cache.set("k", "b", 2)
+    cache.get("k", "a")
+    cache.set("k", "c", 3)
+
+    assert cache.get("k", "a") == (True, 1)
+    assert cache.get("k", "b") == (False, None)
@@ -0,0 +1,213 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import litellm
+import pytest
+
+from repopal.core.metrics import metrics
+from repopal.services.llm_gateway import LLMGateway, TokenBucket, retry_after
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def rate_limited(seconds: str) -> litellm.RateLimitError:
+    response = httpx.Response(
+        429,
+        headers={"retry-after": seconds},
+        request=httpx.Request("POST", "https://api.example.com"),
+    )
+    return litellm.RateLimitError(
+        "Too many requests", llm_provider="anthropic", model="m", response=response
+    )
+
+
+def answer(text="ok"):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None
+    )
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_request_waits_out_retry_after():
+    attempts = []
+
+    async def complete(**kwargs):
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise rate_limited("0.2")
+        return answer()
+
+    gateway = LLMGateway(complete=complete, backoff_seconds=0.01)
+    response = await gateway.acompletion(model="m", messages=MESSAGES)
+
+    assert response.choices[0].message.content == "ok"
+    assert attempts[1] - attempts[0] >= 0.2
+    assert metrics.counter("llm_gateway_retries_total", model="m", reason="RateLimitError") == 1
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    async def complete(**kwargs):
+        raise litellm.ServiceUnavailableError("down", llm_provider="anthropic", model="m")
+
+    gateway = LLMGateway(complete=complete, max_retries=2, backoff_seconds=0.001)
+
+    with pytest.raises(litellm.ServiceUnavailableError):
+        await gateway.acompletion(model="m", messages=MESSAGES)
+    assert metrics.counter("llm_gateway_retries_total", model="m", reason="ServiceUnavailableError") == 2
+
+
+@pytest.mark.asyncio
+async def test_other_errors_are_not_retried():
+    calls = []
+
+    async def complete(**kwargs):
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        await LLMGateway(complete=complete).acompletion(model="m", messages=MESSAGES)
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded_per_model():
+    in_flight = {"now": 0, "max": 0}
+
+    async def complete(**kwargs):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        return answer()
+
+    gateway = LLMGateway(complete=complete, max_concurrency=2)
+    await asyncio.gather(
+        *(gateway.acompletion(model="m", messages=MESSAGES) for _ in range(6))
+    )
+
+    assert in_flight["max"] == 2
+    assert metrics.snapshot()["gauges"]['llm_gateway_in_flight{model="m"}'] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_holds_its_slot_until_closed():
+    class Stream:
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            return "chunk"
+
+        async def aclose(self):
+            pass
+
+    async def complete(**kwargs):
+        return Stream()
+
+    gateway = LLMGateway(complete=complete, max_concurrency=1)
+    stream = await gateway.acompletion(model="m", messages=MESSAGES, stream=True)
+    assert await stream.__anext__() == "chunk"
+
+    second = asyncio.ensure_future(
+        gateway.acompletion(model="m", messages=MESSAGES, stream=True)
+    )
+    await asyncio.sleep(0.01)
+    assert not second.done()
+
+    await stream.aclose()
+    await asyncio.wait_for(second, 1)
+
+
+@pytest.mark.asyncio
+async def test_retries_reserve_tokens_once_and_settle_usage():
+    attempts = []
+
+    async def complete(**kwargs):
+        attempts.append(1)
+        if len(attempts) <= 2:
+            raise litellm.ServiceUnavailableError("down", llm_provider="anthropic", model="m")
+        response = answer()
+        response.usage = SimpleNamespace(total_tokens=100)
+        return response
+
+    gateway = LLMGateway(
+        complete=complete,
+        tokens_per_minute=10000,
+        backoff_seconds=0.001,
+        clock=lambda: 0.0,  # No refill, so only reservations move the bucket
+    )
+    await gateway.acompletion(model="m", messages=MESSAGES)
+
+    assert len(attempts) == 3
+    assert gateway._limits_for("m").tokens.available() == 10000 - 100
+
+
+@pytest.mark.asyncio
+async def test_failed_call_returns_its_reservation():
+    async def complete(**kwargs):
+        raise ValueError("bad request")
+
+    gateway = LLMGateway(complete=complete, tokens_per_minute=10000, clock=lambda: 0.0)
+    with pytest.raises(ValueError):
+        await gateway.acompletion(model="m", messages=MESSAGES)
+
+    assert gateway._limits_for("m").tokens.available() == 10000
+
+
+@pytest.mark.asyncio
+async def test_stream_settles_usage_when_it_ends():
+    def chunk(text, usage=None):
+        delta = SimpleNamespace(content=text)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=usage)
+
+    class Stream:
+        def __init__(self, chunks):
+            self.chunks = iter(chunks)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self.chunks)
+            except StopIteration:
+                raise StopAsyncIteration from None
+
+    async def complete(**kwargs):
+        return Stream([chunk("Hel"), chunk("lo", SimpleNamespace(total_tokens=42))])
+
+    gateway = LLMGateway(complete=complete, tokens_per_minute=10000, clock=lambda: 0.0)
+    stream = await gateway.acompletion(model="m", messages=MESSAGES, stream=True)
+    assert gateway._limits_for("m").tokens.available() < 10000 - 42
+    async for _ in stream:
+        pass
+
+    assert gateway._limits_for("m").tokens.available() == 10000 - 42
+
+
+def test_token_bucket_reserves_ahead():
+    now = [0.0]
+    bucket = TokenBucket(per_minute=60, clock=lambda: now[0])  # One a second
+
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(1) == pytest.approx(1)
+    assert bucket.reserve(1) == pytest.approx(2)
+    now[0] = 2.0
+    assert bucket.reserve(1) == pytest.approx(1)
+
+
+def test_retry_after_accepts_seconds_and_dates():
+    assert retry_after(rate_limited("3")) == 3
+    assert retry_after(ValueError("no headers")) is None
+    # A date in the past means no wait
+    assert retry_after(rate_limited("Wed, 21 Oct 2015 07:28:00 GMT")) == 0
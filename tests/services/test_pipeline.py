@@ -0,0 +1,676 @@
+import asyncio
+import logging
+import shutil
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+import docker
+import pytest
+import requests
+from git import Repo
+from github.GithubException import GithubException
+
+from repopal.core.config import settings
+from repopal.core.exceptions import (
+    CommandTimeoutError,
+    PipelineNotFoundError,
+    PipelineStateError,
+    RepositoryBusyError,
+    StageTimeoutError,
+)
+from repopal.core.metrics import metrics
+from repopal.models.pipeline import PipelineStatus, StageStatus
+from repopal.schemas.service_handler import ServiceProvider, StandardizedEvent
+from repopal.services.cancellation import CancellationRegistry
+from repopal.services.claim_check import ClaimCheck, FileBlobStore
+from repopal.services.commands.find_replace import FindReplaceCommand
+from repopal.services.environment_manager import EnvironmentManager
+from repopal.services.git_repo_manager import GitRepoManager
+from repopal.services.pipeline import (
+    PipelineRunner,
+    PipelineServices,
+    Stage,
+    critical_path,
+)
+from repopal.services.repo_lease import RepositoryLeases
+from repopal.services.service_handlers.base import ResponseType
+from repopal.services.service_handlers.slack import SlackHandler
+from repopal.services.status_messages import TEMPLATES, StatusMessages
+from repopal.services.workspace_speculation import CommandPredictor, RepositoryMirrors
+
+
+class FakeContainer:
+    def __init__(self, container_id: str):
+        self.id = container_id
+        self.status = "running"
+
+    def stop(self):
+        self.status = "exited"
+
+    def kill(self):
+        self.status = "killed"
+
+    def remove(self):
+        pass
+
+
+class FakeEnvironment(EnvironmentManager):
+    """Runs find/replace commands in-process instead of in Docker"""
+
+    def __init__(self, calls: Counter):
+        self.docker_client = None
+        self.work_dir = None
+        self.container = None
+        self.logger = logging.getLogger(__name__)
+        self.calls = calls
+
+    def build_image(self, command):
+        self.calls["build_image"] += 1
+        return f"image-{command.metadata.name}"
+
+    def has_image(self, image_id):
+        return True
+
+    def cached_image(self, command):
+        return None
+
+    def setup_container(self, command, environment=None, name=None, image=None):
+        self.calls["setup_container"] += 1
+        self.container = FakeContainer(name)
+
+    def attach_container(self, container_id):
+        return False
+
+    def run_in_container(self, command, budget=None):
+        self.calls["run_in_container"] += 1
+        path = self.work_dir / "test.txt"
+        path.write_text(path.read_text().replace("world", "everyone"))
+        return 0, "Replacement complete"
+
+
+class FakeSelector:
+    def __init__(self, calls: Counter, delay: float = 0):
+        self.calls = calls
+        self.delay = delay
+
+    async def select_and_prepare_command(self, event):
+        self.calls["select_command"] += 1
+        await asyncio.sleep(self.delay)
+        return FindReplaceCommand(), {"find_pattern": "world", "replace_text": "everyone"}
+
+
+class FakeLLM:
+    def __init__(self, calls: Counter):
+        self.calls = calls
+
+    async def generate_status_message(self, stage, context):
+        return f"Working on: {context['user_request']}"
+
+    async def generate_change_summary(self, user_request, command_name, output, changes):
+        self.calls["summarize"] += 1
+        return "Replaced 'world' with 'everyone'"
+
+    async def generate_commit_message(self, user_request, command_name, summary):
+        return "Replace world with everyone"
+
+    async def generate_pr_description(self, user_request, command_name, summary):
+        return {"title": "Replace world with everyone", "body": summary}
+
+    async def answer_question(self, user_request):
+        self.calls["answer"] += 1
+        return "Hello everyone!"
+
+
+class FakePullRequests:
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.created = []
+
+    def create_or_get(self, repo_full_name, branch_name, title, body, base=None):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.created.append((repo_full_name, branch_name, title, base))
+        return SimpleNamespace(number=1, html_url="https://github.com/org/repo/pull/1")
+
+
+class FakeHandler:
+    def __init__(self):
+        self.messages = []
+
+    def send_response(self, payload, message, response_type, thread_id=None):
+        self.messages.append((response_type.value, message, thread_id))
+        return "comment-1"
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """A bare 'remote' repository with a main branch"""
+    seed = Repo.init(tmp_path / "seed", initial_branch="main")
+    (tmp_path / "seed" / "test.txt").write_text("Hello world!\n")
+    seed.index.add(["test.txt"])
+    seed.index.commit("Initial commit")
+    Repo.clone_from(tmp_path / "seed", tmp_path / "origin.git", bare=True)
+    return tmp_path / "origin.git"
+
+
+@pytest.fixture
+def event(origin):
+    return StandardizedEvent(
+        provider=ServiceProvider.GITHUB,
+        event_type="issue",
+        action="opened",
+        user_request="Replace world with everyone",
+        payload={"repository": "org/repo", "url": str(origin)},
+        raw_payload={"repository": {"full_name": "org/repo", "default_branch": "main"}},
+    )
+
+
+@pytest.fixture
+def calls():
+    return Counter()
+
+
+@pytest.fixture
+def pipeline(db, tmp_path, calls):
+    """Build a runner around fakes; extra keyword arguments override services"""
+
+    def make(leases=None, cancellations=None, **overrides):
+        services = dict(
+            llm=FakeLLM(calls),
+            command_selector=FakeSelector(calls),
+            pull_requests=FakePullRequests(),
+            handler_for=lambda provider: handler,
+            environment_factory=lambda: FakeEnvironment(calls),
+        )
+        services.update(overrides)
+        return PipelineRunner(
+            db,
+            PipelineServices(**services),
+            claim_check=ClaimCheck(FileBlobStore(tmp_path / "blobs"), inline_max_bytes=0),
+            max_attempts=3,
+            leases=leases,
+            cancellations=cancellations,
+        )
+
+    handler = FakeHandler()
+    make.handler = handler
+    return make
+
+
+def remote_file(origin: Path, branch: str) -> str:
+    return Repo(origin).git.show(f"{branch}:test.txt")
+
+
+@pytest.mark.asyncio
+async def test_pipeline_runs_every_stage(pipeline, event, origin):
+    pull_requests = FakePullRequests()
+    runner = pipeline(pull_requests=pull_requests)
+    run = runner.create(event)
+
+    run = await runner.run(str(run.id))
+
+    assert run.status == PipelineStatus.COMPLETED
+    assert set(run.checkpoints) == {
+        "acknowledge",
+        "select_command",
+        "announce",
+        "clone",
+        "build_image",
+        "build_container",
+        "execute",
+        "diff",
+        "summarize",
+        "commit_push",
+        "create_pr",
+        "notify",
+    }
+    branch = f"repopal/{str(run.id)[:8]}"
+    assert remote_file(origin, branch) == "Hello everyone!"
+    assert pull_requests.created == [
+        ("org/repo", branch, "Replace world with everyone", "main")
+    ]
+    assert pipeline.handler.messages == [
+        ("initial", TEMPLATES["received"], None),
+        ("update", "I'm handling your request with find_replace.", "comment-1"),
+        (
+            "final",
+            "Replaced 'world' with 'everyone'\n\n"
+            "Pull request: https://github.com/org/repo/pull/1",
+            "comment-1",
+        ),
+    ]
+    assert run.critical_path[-1] == "notify"
+    assert set(run.stage_timings) == set(run.checkpoints)
+    assert run.job_class == "change"
+    assert run.organization == "org"
+    assert run.command == "find_replace"
+    assert run.pull_request_url == "https://github.com/org/repo/pull/1"
+    assert run.finished_at is not None and run.duration_seconds >= 0
+    assert {stage.stage for stage in run.stages} == set(run.checkpoints)
+    assert all(stage.status.value == "succeeded" for stage in run.stages)
+
+
+@pytest.mark.asyncio
+async def test_slack_question_is_answered_without_a_container(pipeline, calls):
+    payload = {
+        "type": "event_callback",
+        "event": {
+            "type": "message",
+            "text": "Say hello to everyone",
+            "user": "U123456",
+            "channel": "C123456",
+            "ts": "1234567890.123456",
+        },
+        "team_id": "T123456",
+    }
+    event = SlackHandler(signing_secret="secret", bot_token="token").process_webhook(
+        payload
+    )
+    runner = pipeline()
+
+    run = await runner.run(str(runner.create(event).id))
+
+    assert run.status == PipelineStatus.COMPLETED, run.error
+    assert run.job_class == "interactive"
+    assert set(run.checkpoints) == {"acknowledge", "answer", "notify"}
+    assert calls["answer"] == 1
+    assert calls["select_command"] == calls["build_image"] == 0
+    assert calls["setup_container"] == calls["run_in_container"] == 0
+    assert pipeline.handler.messages[-1] == ("final", "Hello everyone!", "comment-1")
+    assert run.pull_request_url is None
+
+
+@pytest.mark.asyncio
+async def test_prepared_workspace_is_used(pipeline, event, origin, calls, tmp_path, redis_client):
+    mirrors = RepositoryMirrors(tmp_path / "mirrors")
+    mirrors.refresh(str(origin))
+    predictor = CommandPredictor(redis_client)
+    metrics.reset()
+
+    runner = pipeline(mirrors=mirrors, predictor=predictor)
+    run = await runner.run(str(runner.create(event).id))
+
+    assert run.status == PipelineStatus.COMPLETED
+    assert remote_file(origin, f"repopal/{str(run.id)[:8]}") == "Hello everyone!"
+    assert metrics.counter(
+        "workspace_speculation_total", resource="clone", outcome="hit"
+    ) == 1
+    assert predictor.predict(str(origin)) == "find_replace"
+
+
+@pytest.mark.asyncio
+async def test_independent_stages_overlap(pipeline, event, calls):
+    runner = pipeline(command_selector=FakeSelector(calls, delay=0.5))
+    run = await runner.run(str(runner.create(event).id))
+
+    timings = run.stage_timings
+    assert run.status == PipelineStatus.COMPLETED
+    # The clone and acknowledgement ran while the command was being selected
+    assert timings["clone"]["end"] < timings["select_command"]["end"]
+    assert timings["acknowledge"]["end"] < timings["select_command"]["end"]
+    assert run.critical_path[0] == "select_command"
+    assert "clone" not in run.critical_path
+
+
+@pytest.mark.asyncio
+async def test_acknowledgement_is_rewritten_in_place(pipeline, event, calls):
+    runner = pipeline(enrich_status_messages=True)
+    run = await runner.run(str(runner.create(event).id))
+
+    assert run.status == PipelineStatus.COMPLETED
+    messages = pipeline.handler.messages
+    assert messages[0] == ("initial", TEMPLATES["received"], None)
+    assert ("update", "Working on: Replace world with everyone", "comment-1") in messages
+    assert messages[-1][0] == "final"
+
+
+@pytest.mark.asyncio
+async def test_late_rewrite_does_not_replace_a_newer_message(calls):
+    release = asyncio.Event()
+
+    class SlowStatusLLM(FakeLLM):
+        async def generate_status_message(self, stage, context):
+            await release.wait()
+            return "Polished"
+
+    handler = FakeHandler()
+    status = StatusMessages(handler, {}, llm=SlowStatusLLM(calls))
+    await status.send("received", {}, ResponseType.INITIAL)
+    await status.send("completed", {"changes_summary": "Done"}, ResponseType.FINAL, enrich=False)
+    release.set()
+    await asyncio.gather(*status._tasks)
+
+    assert handler.messages == [
+        ("initial", TEMPLATES["received"], None),
+        ("final", "Done", None),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_acknowledgement_survives_llm_failure(pipeline, event, calls):
+    class BrokenStatusLLM(FakeLLM):
+        async def generate_status_message(self, stage, context):
+            raise RuntimeError("LLM unavailable")
+
+    runner = pipeline(llm=BrokenStatusLLM(calls), enrich_status_messages=True)
+    run = await runner.run(str(runner.create(event).id))
+
+    assert run.status == PipelineStatus.COMPLETED
+    assert pipeline.handler.messages[0] == ("initial", TEMPLATES["received"], None)
+    assert [m[0] for m in pipeline.handler.messages] == ["initial", "update", "final"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_run_kills_container_and_stops(
+    pipeline, event, calls, redis_client, monkeypatch
+):
+    monkeypatch.setattr(settings, "PIPELINE_CANCEL_POLL_SECONDS", 0.01)
+    killed = threading.Event()
+
+    class HangingEnvironment(FakeEnvironment):
+        def setup_container(self, *args, **kwargs):
+            super().setup_container(*args, **kwargs)
+            self.container.kill = killed.set
+
+        def run_in_container(self, command, budget=None):
+            # Blocks like a long command until the container is killed
+            self.calls["run_in_container"] += 1
+            killed.wait(timeout=5)
+            return 137, "Killed"
+
+    environments = []
+
+    def environment_factory():
+        environments.append(HangingEnvironment(calls))
+        return environments[-1]
+
+    registry = CancellationRegistry(redis_client)
+    runner = pipeline(
+        cancellations=registry, environment_factory=environment_factory
+    )
+    run = runner.create(event, subject="org/repo#7")
+    task = asyncio.ensure_future(runner.run(str(run.id)))
+    while calls["run_in_container"] == 0:
+        await asyncio.sleep(0.01)
+    registry.cancel(ServiceProvider.GITHUB, "org/repo#7")
+
+    run = await asyncio.wait_for(task, timeout=5)
+
+    assert run.status == PipelineStatus.CANCELLED
+    assert killed.is_set()
+    assert "summarize" not in run.checkpoints
+    assert calls["summarize"] == 0
+    assert {s.stage: s.status for s in run.stages}["execute"] == StageStatus.CANCELLED
+    assert not environments[0].work_dir.exists()
+    assert run.finished_at is not None
+    assert pipeline.handler.messages[-1] == (
+        "final", "Your request was cancelled.", "comment-1"
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_cancelled_while_queued_never_starts(
+    pipeline, event, calls, redis_client
+):
+    registry = CancellationRegistry(redis_client)
+    runner = pipeline(cancellations=registry)
+    run = runner.create(event, subject="org/repo#7")
+    registry.cancel(ServiceProvider.GITHUB, "org/repo#7")
+
+    run = await runner.run(str(run.id))
+
+    assert run.status == PipelineStatus.CANCELLED
+    assert run.attempts == 0
+    assert calls["select_command"] == 0
+    assert pipeline.handler.messages == [
+        ("final", "Your request was cancelled.", None)
+    ]
+
+
+def test_critical_path_follows_latest_requirement():
+    async def noop(ctx):
+        pass
+
+    stages = (
+        Stage("a", noop),
+        Stage("b", noop),
+        Stage("c", noop, requires=("a", "b")),
+        Stage("d", noop, requires=("a",)),
+    )
+    timings = {
+        "a": {"start": 0, "end": 1},
+        "b": {"start": 0, "end": 3},
+        "c": {"start": 3, "end": 4},
+        "d": {"start": 1, "end": 2},
+    }
+
+    assert critical_path(stages, timings) == ["b", "c"]
+    assert critical_path(stages, {}) == []
+
+
+def test_stages_must_follow_their_requirements(db):
+    async def noop(ctx):
+        pass
+
+    with pytest.raises(ValueError):
+        PipelineRunner(db, stages=(Stage("b", noop, requires=("a",)), Stage("a", noop)))
+
+
+@pytest.mark.asyncio
+async def test_transient_failure_resumes_at_failed_stage(pipeline, event, calls):
+    pull_requests = FakePullRequests(failures=[GithubException(502, "Bad Gateway")])
+    runner = pipeline(pull_requests=pull_requests)
+    run = runner.create(event)
+
+    run = await runner.run(str(run.id))
+    assert run.status == PipelineStatus.RETRYING
+    assert run.current_stage == "create_pr"
+    assert "create_pr" not in run.checkpoints
+
+    run = await runner.run(str(run.id))
+
+    assert run.status == PipelineStatus.COMPLETED
+    assert run.attempts == 2
+    failed = [stage for stage in run.stages if stage.status.value == "failed"]
+    assert [(stage.stage, stage.attempt) for stage in failed] == [("create_pr", 1)]
+    # Neither the LLM selection nor the container run happened twice
+    assert calls["select_command"] == 1
+    assert calls["run_in_container"] == 1
+    assert calls["summarize"] == 1
+    assert len(pull_requests.created) == 1
+
+
+@pytest.mark.asyncio
+async def test_docker_server_error_in_execute_is_retried(pipeline, event, calls):
+    response = requests.Response()
+    response.status_code, response.url = 500, "http+docker://localhost/exec"
+    failures = [docker.errors.APIError("Internal Server Error", response)]
+
+    class FlakyEnvironment(FakeEnvironment):
+        def run_in_container(self, command, budget=None):
+            if failures:
+                raise failures.pop()
+            return super().run_in_container(command, budget)
+
+    runner = pipeline(environment_factory=lambda: FlakyEnvironment(calls))
+    run = await runner.run(str(runner.create(event).id))
+
+    assert run.status == PipelineStatus.RETRYING
+    assert run.current_stage == "execute"
+    assert "execute" not in run.checkpoints
+
+    run = await runner.run(str(run.id))
+
+    assert run.status == PipelineStatus.COMPLETED
+
+
+@pytest.mark.asyncio
+async def test_failed_command_fails_run(pipeline, event, calls):
+    class FailingEnvironment(FakeEnvironment):
+        def run_in_container(self, command, budget=None):
+            return 1, "No such pattern"
+
+    pull_requests = FakePullRequests()
+    runner = pipeline(
+        pull_requests=pull_requests,
+        environment_factory=lambda: FailingEnvironment(calls),
+    )
+    run = await runner.run(str(runner.create(event).id))
+
+    assert run.status == PipelineStatus.FAILED
+    assert run.error == "execute: Command find_replace failed: No such pattern"
+    assert calls["summarize"] == 0
+    assert pull_requests.created == []
+
+
+@pytest.mark.asyncio
+async def test_lost_workspace_is_recloned_without_rerunning_command(
+    pipeline, event, origin, calls, monkeypatch
+):
+    runner = pipeline()
+    run = runner.create(event)
+
+    # Fail the first push after the command has run
+    original_push = GitRepoManager.push_changes
+    attempts = []
+
+    def flaky_push(self, branch_name, **options):
+        attempts.append(branch_name)
+        if len(attempts) == 1:
+            shutil.rmtree(self.work_dir)  # e.g. retried on another worker
+            raise ConnectionError("connection reset")
+        return original_push(self, branch_name, **options)
+
+    monkeypatch.setattr(GitRepoManager, "push_changes", flaky_push)
+
+    run = await runner.run(str(run.id))
+    assert run.status == PipelineStatus.RETRYING
+    run = await runner.run(str(run.id))
+
+    assert run.status == PipelineStatus.COMPLETED
+    assert calls["run_in_container"] == 1
+    assert remote_file(origin, f"repopal/{str(run.id)[:8]}") == "Hello everyone!"
+
+
+@pytest.mark.asyncio
+async def test_permanent_failure_fails_run(pipeline, event):
+    runner = pipeline(pull_requests=FakePullRequests(failures=[ValueError("bad")]))
+    run = runner.create(event)
+
+    run = await runner.run(str(run.id))
+
+    assert run.status == PipelineStatus.FAILED
+    assert run.error == "create_pr: bad"
+    # The requester hears why, in place of the acknowledgement
+    assert pipeline.handler.messages[-1] == (
+        "final",
+        "Sorry, I couldn't finish your request: create_pr: bad",
+        "comment-1",
+    )
+    with pytest.raises(PipelineStateError):
+        await runner.run(str(run.id))
+
+
+@pytest.mark.asyncio
+async def test_timed_out_command_fails_run_and_kills_container(pipeline, event, calls):
+    class OverBudgetEnvironment(FakeEnvironment):
+        def run_in_container(self, command, budget=None):
+            raise CommandTimeoutError(command, budget.wall_clock_seconds)
+
+    environments = []
+
+    def environment_factory():
+        environments.append(OverBudgetEnvironment(calls))
+        return environments[-1]
+
+    runner = pipeline(environment_factory=environment_factory)
+    run = await runner.run(str(runner.create(event).id))
+
+    assert run.status == PipelineStatus.FAILED
+    assert run.error == "execute: Stage execute timed out after 120s"
+    assert {s.stage: s.status for s in run.stages}["execute"] == StageStatus.TIMED_OUT
+    assert "execute" not in run.checkpoints
+    assert calls["summarize"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stage_over_budget_raises_timeout():
+    async def hang(ctx):
+        await asyncio.sleep(10)
+
+    def block(ctx):
+        time.sleep(0.2)
+
+    with pytest.raises(StageTimeoutError) as raised:
+        await Stage("hang", hang, timeout=0.01)(None)
+    assert raised.value.stage == "hang"
+    with pytest.raises(StageTimeoutError):
+        await Stage("block", block, timeout=lambda ctx: 0.01)(None)
+
+
+@pytest.mark.asyncio
+async def test_run_without_repository_fails(pipeline, event):
+    event.payload["url"] = None
+    runner = pipeline()
+
+    run = await runner.run(str(runner.create(event).id))
+
+    assert run.status == PipelineStatus.FAILED
+    assert run.current_stage == "clone"
+
+
+@pytest.mark.asyncio
+async def test_unknown_run(pipeline):
+    with pytest.raises(PipelineNotFoundError):
+        await pipeline().run("00000000-0000-0000-0000-000000000000")
+
+
+
+@pytest.mark.asyncio
+async def test_busy_repository_is_not_started(pipeline, event, redis_client):
+    leases = RepositoryLeases(redis_client)
+    runner = pipeline(leases=leases)
+    run = runner.create(event)
+    other = leases.acquire("org/repo", "another-run", order=0)
+
+    with pytest.raises(RepositoryBusyError):
+        await runner.run(str(run.id))
+    assert run.status == PipelineStatus.PENDING
+    assert run.attempts == 0
+
+    leases.release(other)
+    run = await runner.run(str(run.id))
+    assert run.status == PipelineStatus.COMPLETED
+    # The lease was released when the run finished
+    assert leases.acquire("org/repo", "another-run", order=0) is not None
+
+
+@pytest.mark.asyncio
+async def test_push_does_not_overwrite_concurrent_changes(
+    pipeline, event, origin, tmp_path, monkeypatch
+):
+    runner = pipeline()
+    run = runner.create(event)
+    branch = f"repopal/{str(run.id)[:8]}"
+    original_push = GitRepoManager.push_changes
+
+    def racing_push(self, branch_name, **options):
+        # Someone else pushes to the branch between our check and our push
+        other = Repo.clone_from(origin, tmp_path / "other")
+        other.git.checkout("-b", branch_name)
+        (tmp_path / "other" / "other.txt").write_text("theirs")
+        other.index.add(["other.txt"])
+        other.index.commit("Their change")
+        other.git.push("origin", branch_name)
+        return original_push(self, branch_name, **options)
+
+    monkeypatch.setattr(GitRepoManager, "push_changes", racing_push)
+
+    run = await runner.run(str(run.id))
+
+    assert run.status == PipelineStatus.RETRYING
+    assert run.current_stage == "commit_push"
+    assert Repo(origin).git.show(f"{branch}:other.txt") == "theirs"
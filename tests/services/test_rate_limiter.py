@@ -0,0 +1,123 @@
+import pytest
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from repopal.core.metrics import metrics
+from repopal.schemas.service_handler import ServiceProvider
+from repopal.services import rate_limiter as rate_limiter_module
+from repopal.services.rate_limiter import (
+    AdmissionAction,
+    RateLimit,
+    RateLimitResolver,
+    TenantRateLimiter,
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freeze the limiter's wall clock; advance it by assigning clock.now"""
+
+    class Clock:
+        now = 1_700_000_000.0
+
+        def time(self):
+            return self.now
+
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter_module.time, "time", clock.time)
+    return clock
+
+
+def make_limiter(redis_client, default, overrides=None):
+    resolver = RateLimitResolver(default, loader=lambda default: overrides or {})
+    return TenantRateLimiter(redis_client, resolver)
+
+
+def test_burst_then_defer_then_shed(redis_client, clock):
+    limiter = make_limiter(
+        redis_client, RateLimit(per_minute=60, burst=2, max_deferred=2)
+    )
+
+    actions = [limiter.admit(ServiceProvider.GITHUB, "42") for _ in range(5)]
+
+    assert [a.action for a in actions] == [
+        AdmissionAction.ADMIT,
+        AdmissionAction.ADMIT,
+        AdmissionAction.DEFER,
+        AdmissionAction.DEFER,
+        AdmissionAction.SHED,
+    ]
+    # Deferred events are spread out at the tenant's rate (one per second)
+    assert [a.retry_after for a in actions[2:4]] == [1.0, 2.0]
+    assert actions[4].retry_after == pytest.approx(1.0)
+    assert metrics.counter(
+        "webhook_admissions_total", provider="github", action="shed"
+    ) == 1
+
+
+def test_bucket_refills_over_time(redis_client, clock):
+    limiter = make_limiter(redis_client, RateLimit(per_minute=60, burst=1))
+
+    assert limiter.admit(ServiceProvider.SLACK, "T1").action == AdmissionAction.ADMIT
+    assert limiter.admit(ServiceProvider.SLACK, "T1").action == AdmissionAction.SHED
+
+    clock.now += 1
+    assert limiter.admit(ServiceProvider.SLACK, "T1").action == AdmissionAction.ADMIT
+
+
+def test_tenants_are_limited_independently(redis_client, clock):
+    limiter = make_limiter(redis_client, RateLimit(per_minute=60, burst=1))
+
+    assert limiter.admit(ServiceProvider.SLACK, "T1").action == AdmissionAction.ADMIT
+    assert limiter.admit(ServiceProvider.SLACK, "T2").action == AdmissionAction.ADMIT
+    assert limiter.admit(ServiceProvider.GITHUB, "T1").action == AdmissionAction.ADMIT
+
+
+def test_connection_settings_override_default(redis_client, clock):
+    default = RateLimit(per_minute=60, burst=1)
+    noisy = RateLimit.from_settings(
+        {"installation_id": 7, "rate_limit": {"burst": 3}}, default
+    )
+    limiter = make_limiter(redis_client, default, {(ServiceProvider.GITHUB, "7"): noisy})
+
+    assert noisy == RateLimit(per_minute=60, burst=3)
+    admitted = [limiter.admit(ServiceProvider.GITHUB, "7").action for _ in range(4)]
+    assert admitted.count(AdmissionAction.ADMIT) == 3
+
+
+def test_unlimited_and_unknown_tenants_are_admitted(redis_client):
+    limiter = make_limiter(redis_client, RateLimit(per_minute=0, burst=0))
+
+    for _ in range(3):
+        assert limiter.admit(ServiceProvider.GITHUB, "1").action == AdmissionAction.ADMIT
+    assert limiter.admit(ServiceProvider.GITHUB, None).action == AdmissionAction.ADMIT
+
+
+def test_resolver_falls_back_to_default_when_settings_unavailable():
+    def broken_loader(default):
+        raise ImportError("connection models unavailable")
+
+    default = RateLimit(per_minute=10, burst=5)
+    resolver = RateLimitResolver(default, loader=broken_loader)
+
+    assert resolver.limit_for(ServiceProvider.GITHUB, "1") == default
+
+
+def test_rate_limiter_fails_open_when_redis_is_down():
+    unreachable = redis.Redis(
+        host="localhost",
+        port=1,
+        socket_connect_timeout=0.1,
+        retry=Retry(NoBackoff(), 0),
+    )
+    limiter = make_limiter(unreachable, RateLimit(per_minute=1, burst=1))
+
+    assert limiter.admit(ServiceProvider.GITHUB, "1").action == AdmissionAction.ADMIT
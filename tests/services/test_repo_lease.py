@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from repopal.services import repo_lease as repo_lease_module
+from repopal.services.repo_lease import RepositoryLeases
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freeze the leases' wall clock; advance it by assigning clock.now"""
+    clock = SimpleNamespace(now=1_700_000_000.0)
+    monkeypatch.setattr(
+        repo_lease_module, "time", SimpleNamespace(time=lambda: clock.now)
+    )
+    return clock
+
+
+@pytest.fixture
+def leases(redis_client, clock):
+    return RepositoryLeases(redis_client, ttl_seconds=60, wait_ttl_seconds=30)
+
+
+def test_one_holder_per_repository(leases):
+    lease = leases.acquire("org/repo", "run-1", order=1)
+
+    assert lease is not None
+    assert leases.acquire("org/repo", "run-2", order=2) is None
+    # Other repositories are unaffected
+    assert leases.acquire("org/other", "run-3", order=3) is not None
+
+    leases.release(lease)
+    assert leases.acquire("org/repo", "run-2", order=2) is not None
+
+
+def test_waiters_take_turns_in_order(leases):
+    holder = leases.acquire("org/repo", "run-1", order=1)
+    assert leases.acquire("org/repo", "run-2", order=2) is None
+    assert leases.acquire("org/repo", "run-3", order=3) is None
+
+    leases.release(holder)
+
+    # run-3 polls first but run-2 is ahead of it
+    assert leases.acquire("org/repo", "run-3", order=3) is None
+    assert leases.acquire("org/repo", "run-2", order=2) is not None
+
+
+def test_waiter_that_stops_polling_loses_its_place(leases, clock):
+    holder = leases.acquire("org/repo", "run-1", order=1)
+    assert leases.acquire("org/repo", "run-2", order=2) is None
+    assert leases.acquire("org/repo", "run-3", order=3) is None
+    leases.release(holder)
+
+    clock.now += 10
+    assert leases.acquire("org/repo", "run-3", order=3) is None
+    clock.now += 25  # run-2 last polled 35s ago
+    assert leases.acquire("org/repo", "run-3", order=3) is not None
+
+
+def test_only_the_holder_can_renew_or_release(leases, redis_client):
+    lease = leases.acquire("org/repo", "run-1", order=1)
+    other = repo_lease_module.Lease("org/repo", "run-2:stale")
+
+    leases.release(other)
+    assert leases.renew(other) is False
+    assert leases.renew(lease) is True
+    assert leases.acquire("org/repo", "run-2", order=2) is None
+
+    # An expired lease frees the repository
+    redis_client.delete(leases._key("org/repo", "holder"))
+    assert leases.renew(lease) is False
+    assert leases.acquire("org/repo", "run-2", order=2) is not None
+
+
+def test_leases_fail_open_when_redis_is_down():
+    unreachable = redis.Redis(
+        host="localhost",
+        port=1,
+        socket_connect_timeout=0.1,
+        retry=Retry(NoBackoff(), 0),
+    )
+    leases = RepositoryLeases(unreachable)
+
+    assert leases.acquire("org/repo", "run-1", order=1) is not None
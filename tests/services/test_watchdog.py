@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from repopal.core.exceptions import CommandTimeoutError
+from repopal.schemas.command import ResourceBudget
+from repopal.services.environment_manager import EnvironmentManager
+from repopal.services.watchdog import Watchdog
+
+
+class HangingContainer:
+    """exec_run blocks like a hung command until the container is killed"""
+
+    name = "repopal-test"
+    status = "running"
+
+    def __init__(self):
+        self.killed = threading.Event()
+        self.commands = []
+
+    def reload(self):
+        pass
+
+    def kill(self):
+        self.killed.set()
+
+    def exec_run(self, command):
+        self.commands.append(command)
+        if "hang" in command[-1]:
+            self.killed.wait(timeout=5)
+            return 137, b""
+        return 0, b"done\n"
+
+
+class ContainerOnlyEnvironment(EnvironmentManager):
+    def __init__(self, container):
+        self.docker_client = None
+        self.work_dir = None
+        self.container = container
+        self.logger = logging.getLogger(__name__)
+
+
+def test_watchdog_fires_only_when_over_budget():
+    fired = []
+
+    with Watchdog(0.01, lambda: fired.append(True)) as late:
+        time.sleep(0.1)
+    with Watchdog(1, lambda: fired.append(False)) as early:
+        pass
+    time.sleep(0.05)
+
+    assert late.expired and not early.expired
+    assert fired == [True]
+
+
+def test_hung_exec_is_killed_at_its_budget():
+    container = HangingContainer()
+    environment = ContainerOnlyEnvironment(container)
+    started = time.monotonic()
+
+    with pytest.raises(CommandTimeoutError):
+        environment.run_in_container(
+            "hang", ResourceBudget(wall_clock_seconds=0.05, cpu_seconds=30)
+        )
+
+    assert container.killed.is_set()
+    assert time.monotonic() - started < 1
+    assert container.commands[0][-1] == "ulimit -t 30 && hang"
+
+
+def test_exec_within_budget_returns_output():
+    container = HangingContainer()
+    environment = ContainerOnlyEnvironment(container)
+
+    assert environment.run_in_container("true", ResourceBudget()) == (0, "done\n")
+    assert not container.killed.is_set()
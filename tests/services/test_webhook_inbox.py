@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+
+from repopal.core.config import settings
+from repopal.models.webhook_delivery import DeliveryStatus
+from repopal.schemas.service_handler import ServiceProvider
+from repopal.services.event_coalescer import EventCoalescer
+from repopal.services.webhook_inbox import WebhookInbox
+
+
+def failing_enqueue(delivery_id: str, **options) -> None:
+    raise ConnectionError("broker unavailable")
+
+
+class RecordingQueue(list):
+    def __call__(self, delivery_id: str, **options) -> None:
+        self.append((delivery_id, options))
+
+
+def test_delivery_survives_broker_outage(db):
+    inbox = WebhookInbox(db, enqueue=failing_enqueue)
+
+    delivery = inbox.accept(
+        ServiceProvider.GITHUB, {"content-type": "application/json"}, b"{}"
+    )
+
+    assert delivery.status == DeliveryStatus.RECEIVED
+
+    # Once the broker is back the sweeper hands it to the worker
+    queued = RecordingQueue()
+    delivery.updated_at = datetime.utcnow() - timedelta(minutes=10)
+    db.commit()
+    assert WebhookInbox(db, enqueue=queued).requeue_stale(timedelta(minutes=5)) == 1
+    assert [delivery_id for delivery_id, _ in queued] == [str(delivery.id)]
+    assert delivery.status == DeliveryStatus.QUEUED
+
+
+def test_claim_is_exclusive(db):
+    inbox = WebhookInbox(db, enqueue=RecordingQueue())
+    delivery = inbox.accept(ServiceProvider.SLACK, {}, b"{}")
+
+    claimed = inbox.claim(str(delivery.id))
+
+    assert claimed.status == DeliveryStatus.PROCESSING
+    assert claimed.attempts == 1
+    assert inbox.claim(str(delivery.id)) is None
+
+
+def test_burst_on_same_subject_runs_only_latest(db, redis_client):
+    queued = RecordingQueue()
+    coalescer = EventCoalescer(redis_client, {"github": 10.0})
+    inbox = WebhookInbox(db, enqueue=queued, coalescer=coalescer)
+
+    first = inbox.accept(ServiceProvider.GITHUB, {}, b"{}", subject="org/repo#1")
+    second = inbox.accept(ServiceProvider.GITHUB, {}, b"{}", subject="org/repo#1")
+    other = inbox.accept(ServiceProvider.GITHUB, {}, b"{}", subject="org/repo#2")
+
+    assert all(options == {"countdown": 10.0} for _, options in queued)
+    assert inbox.is_superseded(first) is True
+    assert inbox.is_superseded(second) is False
+    assert inbox.is_superseded(other) is False
+
+
+def test_providers_without_window_are_not_delayed(db, redis_client):
+    queued = RecordingQueue()
+    coalescer = EventCoalescer(redis_client, {"github": 10.0, "slack": 0.0})
+    inbox = WebhookInbox(db, enqueue=queued, coalescer=coalescer)
+
+    delivery = inbox.accept(ServiceProvider.SLACK, {}, b"{}", subject="C1:123.4")
+
+    assert queued == [(str(delivery.id), {"countdown": 0.0})]
+    assert inbox.is_superseded(delivery) is False
+
+
+def test_deferred_delivery_is_enqueued_late_at_low_priority(db):
+    queued = RecordingQueue()
+    inbox = WebhookInbox(db, enqueue=queued)
+
+    inbox.accept(ServiceProvider.GITHUB, {}, b"{}", defer_seconds=30)
+    inbox.accept(ServiceProvider.GITHUB, {}, b"{}")
+
+    (_, deferred), (_, admitted) = queued
+    assert deferred["countdown"] == 30
+    assert deferred["priority"] > admitted.get("priority", 0)
+
+
+def test_sweeper_keeps_deferral_and_priority(db):
+    inbox = WebhookInbox(db, enqueue=failing_enqueue)
+    delivery = inbox.accept(ServiceProvider.GITHUB, {}, b"{}", defer_seconds=600)
+    delivery.updated_at = datetime.utcnow() - timedelta(minutes=10)
+    db.commit()
+
+    # Not due yet, however long ago it arrived
+    queued = RecordingQueue()
+    sweeper = WebhookInbox(db, enqueue=queued)
+    assert sweeper.requeue_stale(timedelta(minutes=5)) == 0
+
+    delivery.not_before = datetime.utcnow() - timedelta(seconds=1)
+    delivery.updated_at = datetime.utcnow() - timedelta(minutes=10)
+    db.commit()
+    assert sweeper.requeue_stale(timedelta(minutes=5)) == 1
+    assert queued == [
+        (str(delivery.id), {"priority": settings.WEBHOOK_DEFERRED_PRIORITY})
+    ]
+
+
+def test_crashed_claim_is_taken_over(db):
+    queued = RecordingQueue()
+    inbox = WebhookInbox(db, enqueue=queued, processing_timeout=timedelta(minutes=15))
+    delivery = inbox.accept(ServiceProvider.GITHUB, {}, b"{}")
+    assert inbox.claim(str(delivery.id)) is not None
+
+    # Still within the worker's lease
+    assert inbox.claim(str(delivery.id)) is None
+    assert inbox.requeue_stale(timedelta(minutes=5)) == 0
+
+    # The worker died: the sweeper requeues it and the redelivery claims it
+    delivery.updated_at = datetime.utcnow() - timedelta(minutes=20)
+    db.commit()
+    assert inbox.requeue_stale(timedelta(minutes=5)) == 1
+    assert delivery.status == DeliveryStatus.QUEUED
+    assert inbox.claim(str(delivery.id)).attempts == 2
+
+    # The broker's acks_late redelivery takes over a stale claim directly
+    delivery.updated_at = datetime.utcnow() - timedelta(minutes=20)
+    db.commit()
+    assert inbox.claim(str(delivery.id)).attempts == 3
+
+
+def test_released_delivery_is_requeued(db):
+    inbox = WebhookInbox(db, enqueue=RecordingQueue())
+    delivery = inbox.accept(ServiceProvider.GITHUB, {}, b"{}")
+    inbox.claim(str(delivery.id))
+
+    inbox.release(delivery, "broker unavailable")
+
+    assert delivery.status == DeliveryStatus.RECEIVED
+    delivery.updated_at = datetime.utcnow() - timedelta(minutes=10)
+    db.commit()
+    assert inbox.requeue_stale(timedelta(minutes=5)) == 1
+    assert inbox.claim(str(delivery.id)) is not None
@@ -0,0 +1,147 @@
+from collections import Counter
+
+import pytest
+import redis
+from git import Repo
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from repopal.services.git_repo_manager import GitRepoManager
+from repopal.services.workspace_speculation import (
+    CommandPredictor,
+    RepositoryMirrors,
+    WorkspacePreparer,
+)
+
+
+@pytest.fixture
+def origin(tmp_path):
+    seed = Repo.init(tmp_path / "seed", initial_branch="main")
+    (tmp_path / "seed" / "test.txt").write_text("Hello world!\n")
+    seed.index.add(["test.txt"])
+    seed.index.commit("Initial commit")
+    Repo.clone_from(tmp_path / "seed", tmp_path / "origin.git", bare=True)
+    return tmp_path / "origin.git"
+
+
+def push_commit(tmp_path, origin, content: str) -> str:
+    work = Repo.clone_from(origin, tmp_path / "pusher")
+    (tmp_path / "pusher" / "test.txt").write_text(content)
+    work.index.add(["test.txt"])
+    sha = work.index.commit("Update").hexsha
+    work.remotes.origin.push("main").raise_if_error()
+    return sha
+
+
+class FakeEnvironment:
+    def __init__(self, calls: Counter, cached=None):
+        self.calls = calls
+        self.cached = cached
+
+    def cached_image(self, command):
+        return self.cached
+
+    def build_image(self, command):
+        self.calls[f"build:{command.metadata.name}"] += 1
+        return f"image-{command.metadata.name}"
+
+
+def test_clone_from_mirror_fetches_what_it_lacks(tmp_path, origin):
+    mirrors = RepositoryMirrors(tmp_path / "mirrors")
+    assert mirrors.get(str(origin)) is None
+    mirror = mirrors.refresh(str(origin))
+    # Pushed after the mirror was made, so the clone must fetch it
+    sha = push_commit(tmp_path, origin, "Hello again!\n")
+
+    git = GitRepoManager()
+    work_dir = git.clone_repo(str(origin), reference=mirrors.get(str(origin)))
+
+    assert mirror == mirrors.get(str(origin))
+    assert git.repo.head.commit.hexsha == sha
+    assert (work_dir / "test.txt").read_text() == "Hello again!\n"
+    # Dissociated: the clone keeps working without the mirror
+    assert not (work_dir / ".git" / "objects" / "info" / "alternates").exists()
+
+
+def test_refresh_fetches_into_existing_mirror(tmp_path, origin):
+    mirrors = RepositoryMirrors(tmp_path / "mirrors")
+    mirrors.refresh(str(origin))
+    sha = push_commit(tmp_path, origin, "Hello again!\n")
+
+    mirror = mirrors.refresh(str(origin))
+
+    assert Repo(mirror).commit("main").hexsha == sha
+
+
+def test_mirror_being_cloned_is_not_used(tmp_path, origin, monkeypatch):
+    mirrors = RepositoryMirrors(tmp_path / "mirrors")
+    seen_during_clone = []
+    clone_from = Repo.clone_from
+
+    def observed_clone_from(*args, **kwargs):
+        repo = clone_from(*args, **kwargs)
+        # Fully fetched, but not yet moved into place
+        seen_during_clone.append(mirrors.get(str(origin)))
+        return repo
+
+    monkeypatch.setattr(Repo, "clone_from", observed_clone_from)
+    mirror = mirrors.refresh(str(origin))
+
+    assert seen_during_clone == [None]
+    assert mirrors.get(str(origin)) == mirror
+
+
+def test_predictor_prefers_most_selected_command(redis_client):
+    predictor = CommandPredictor(redis_client, default="aider")
+    assert predictor.predict("https://github.com/org/repo") == "aider"
+
+    predictor.record("https://github.com/org/repo", "find_replace")
+    predictor.record("https://github.com/org/repo", "find_replace")
+    predictor.record("https://github.com/org/repo", "aider")
+
+    assert predictor.predict("https://github.com/org/repo") == "find_replace"
+    assert predictor.predict("https://github.com/org/other") == "aider"
+
+
+def test_predictor_falls_back_to_default_without_redis():
+    unreachable = redis.Redis(
+        host="127.0.0.1", port=1, socket_connect_timeout=0.1, retry=Retry(NoBackoff(), 0)
+    )
+    predictor = CommandPredictor(unreachable, default="aider")
+
+    predictor.record("https://github.com/org/repo", "find_replace")
+
+    assert predictor.predict("https://github.com/org/repo") == "aider"
+
+
+def test_preparer_mirrors_and_builds_predicted_image(tmp_path, origin, redis_client):
+    calls = Counter()
+    predictor = CommandPredictor(redis_client, default="aider")
+    predictor.record(str(origin), "find_replace")
+    preparer = WorkspacePreparer(
+        RepositoryMirrors(tmp_path / "mirrors"),
+        predictor,
+        environment_factory=lambda: FakeEnvironment(calls),
+    )
+
+    prepared = preparer.prepare(str(origin))
+
+    assert prepared["command"] == "find_replace"
+    assert prepared["image"] == "image-find_replace"
+    assert calls == Counter({"build:find_replace": 1})
+    assert prepared["mirror"] == str(preparer.mirrors.get(str(origin)))
+
+
+def test_preparer_skips_cached_image_and_survives_bad_remote(tmp_path, redis_client):
+    calls = Counter()
+    preparer = WorkspacePreparer(
+        RepositoryMirrors(tmp_path / "mirrors"),
+        CommandPredictor(redis_client, default="find_replace"),
+        environment_factory=lambda: FakeEnvironment(calls, cached="image-cached"),
+    )
+
+    prepared = preparer.prepare(str(tmp_path / "missing.git"))
+
+    assert prepared["mirror"] is None
+    assert prepared["image"] == "image-cached"
+    assert not calls
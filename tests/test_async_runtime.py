@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from repopal.core.async_runtime import (
+    AsyncRuntime,
+    get_async_runtime,
+    shutdown_async_runtime,
+)
+
+
+@pytest.fixture
+def runtime():
+    runtime = AsyncRuntime()
+    yield runtime
+    runtime.close()
+
+
+def test_tasks_share_one_loop(runtime):
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    assert runtime.run(current_loop()) is runtime.run(current_loop()) is runtime.loop
+
+
+def test_shared_clients_are_created_once(runtime):
+    created = []
+
+    def factory():
+        created.append(object())
+        return created[-1]
+
+    assert runtime.shared("client", factory) is runtime.shared("client", factory)
+    assert len(created) == 1
+
+
+def test_errors_propagate_to_the_caller(runtime):
+    async def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        runtime.run(fail())
+    # The loop keeps serving later tasks
+    assert runtime.run(asyncio.sleep(0, result="ok")) == "ok"
+
+
+def test_timeout_cancels_the_coroutine(runtime):
+    cancelled = asyncio.Event()
+
+    async def hang():
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(TimeoutError):
+        runtime.run(hang(), timeout=0.05)
+    assert runtime.run(asyncio.wait_for(cancelled.wait(), 1)) is True
+
+
+def test_close_closes_shared_clients_and_stops_loop(runtime):
+    class Client:
+        closed = False
+
+        async def aclose(self):
+            self.closed = True
+
+    client = runtime.shared("client", Client)
+    runtime.close()
+
+    assert client.closed
+    assert not runtime.running
+
+
+def test_process_runtime_is_reused_until_shutdown():
+    runtime = get_async_runtime()
+    assert get_async_runtime() is runtime
+
+    shutdown_async_runtime()
+    assert not runtime.running
+    replacement = get_async_runtime()
+    assert replacement is not runtime
+    shutdown_async_runtime()
@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from repopal.models.pipeline import (
+    PipelineRun,
+    PipelineStageRun,
+    PipelineStatus,
+    StageStatus,
+)
+from repopal.repositories.pipeline_run import PipelineRunRepository
+from repopal.schemas.service_handler import ServiceProvider
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+@pytest.fixture
+def repository():
+    return PipelineRunRepository()
+
+
+def add_run(db, repository="org/repo", status=PipelineStatus.RUNNING, age=0, **fields):
+    run = PipelineRun(
+        provider=ServiceProvider.GITHUB,
+        organization=repository.split("/")[0],
+        repository=repository,
+        event={"kind": "inline", "inline": {}},
+        status=status,
+        checkpoints={},
+        created_at=NOW - timedelta(minutes=age),
+        updated_at=NOW - timedelta(minutes=age),
+        **fields,
+    )
+    db.add(run)
+    db.commit()
+    return run
+
+
+def query_plan(db, call) -> str:
+    """SQLite's plan for the query a repository method runs"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        call()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    statement, parameters = statements[-1]
+    rows = db.connection().exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {statement}", parameters
+    )
+    return " | ".join(row[-1] for row in rows)
+
+
+def test_active_runs_by_repository(db, repository):
+    older = add_run(db, age=10)
+    newer = add_run(db, status=PipelineStatus.RETRYING, age=5)
+    add_run(db, status=PipelineStatus.COMPLETED, age=1)
+    add_run(db, repository="org/other")
+
+    assert repository.get_active_by_repository(db, "org/repo") == [older, newer]
+
+
+def test_runs_by_organization_in_time_range(db, repository):
+    runs = [add_run(db, age=age) for age in (5, 15, 25, 35)]
+    add_run(db, repository="someone-else/repo", age=15)
+
+    page = repository.get_by_organization(
+        db, "org", since=NOW - timedelta(minutes=30), until=NOW, limit=2
+    )
+    assert page == [runs[0], runs[1]]
+    rest = repository.get_by_organization(
+        db, "org", since=NOW - timedelta(minutes=30), until=page[-1].created_at
+    )
+    assert rest == [runs[2]]
+
+
+def test_stuck_runs(db, repository):
+    stuck = add_run(db, age=120)
+    add_run(db, age=120, status=PipelineStatus.FAILED)
+    add_run(db, age=5)
+
+    assert repository.get_stuck(db, idle_since=NOW - timedelta(hours=1)) == [stuck]
+
+
+def test_running_stages_and_durations(db, repository):
+    run = add_run(db)
+    run.stages = [
+        PipelineStageRun(
+            stage="execute",
+            attempt=1,
+            status=StageStatus.SUCCEEDED,
+            started_at=NOW - timedelta(minutes=30),
+            duration_seconds=120.0,
+        ),
+        PipelineStageRun(
+            stage="execute",
+            attempt=2,
+            status=StageStatus.RUNNING,
+            started_at=NOW - timedelta(minutes=20),
+        ),
+    ]
+    db.commit()
+
+    assert repository.get_running_stages(db, started_before=NOW) == [run.stages[1]]
+    assert repository.get_stage_durations(
+        db, "execute", since=NOW - timedelta(hours=1)
+    ) == {"stage": "execute", "count": 1, "mean": 120.0, "max": 120.0}
+
+
+@pytest.mark.parametrize(
+    "query, index",
+    [
+        (
+            lambda repository, db: repository.get_active_by_repository(db, "org/repo"),
+            "ix_pipeline_runs_active_repository",
+        ),
+        (
+            lambda repository, db: repository.get_by_organization(
+                db, "org", since=NOW - timedelta(days=1), until=NOW
+            ),
+            "ix_pipeline_runs_organization_created",
+        ),
+        (
+            lambda repository, db: repository.get_stuck(db, idle_since=NOW),
+            "ix_pipeline_runs_active_updated",
+        ),
+        (
+            lambda repository, db: repository.get_running_stages(
+                db, started_before=NOW
+            ),
+            "ix_pipeline_stage_runs_running_started",
+        ),
+        (
+            lambda repository, db: repository.get_stage_durations(
+                db, "execute", since=NOW
+            ),
+            "ix_pipeline_stage_runs_stage_started",
+        ),
+    ],
+)
+def test_queries_use_their_index(db, repository, query, index):
+    """Every operator query is an index range scan, never a table scan"""
+    plan = query_plan(db, lambda: query(repository, db))
+
+    assert index in plan
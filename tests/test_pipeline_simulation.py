@@ -0,0 +1,32 @@
+import asyncio
+import random
+
+import pytest
+
+from benchmarks.pipeline_simulation import Latencies, Latency, simulate
+
+
+def test_simulation_runs_real_pipeline_offline():
+    instant = Latency("fixed", 0)
+    latencies = Latencies(
+        llm=instant, build=instant, container=instant, execute=instant, github=instant
+    )
+
+    report = asyncio.run(simulate(jobs=6, concurrency=3, latencies=latencies, seed=1))
+
+    summary = report.summary()
+    assert summary["statuses"] == {"completed": 6}
+    assert summary["throughput_jobs_per_s"] > 0
+    assert set(summary["stage_latency_ms"]) >= {"select_command", "execute", "notify"}
+    assert summary["job_latency_ms"]["p50"] <= summary["job_latency_ms"]["max"]
+
+
+def test_latency_specs():
+    rng = random.Random(1)
+
+    assert Latency.parse("fixed:250").sample(rng) == 0.25
+    assert 0.1 <= Latency.parse("uniform:100:200").sample(rng) <= 0.2
+    assert Latency.parse("lognormal:800:0.4").sample(rng) > 0
+    assert str(Latency.parse("lognormal:800:0.4")) == "lognormal:800:0.4"
+    with pytest.raises(ValueError):
+        Latency.parse("normal:800")
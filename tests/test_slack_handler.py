@@ -56,7 +56,7 @@ def test_webhook_validation(slack_handler):
         'X-Slack-Signature': signature
     }
     
-    assert slack_handler.validate_webhook(headers, payload) == True
+    assert slack_handler.validate_webhook(headers, json.dumps(payload).encode()) == True
 
 def test_process_message_webhook(slack_handler, sample_message_payload):
     event = slack_handler.process_webhook(sample_message_payload)
@@ -43,13 +43,14 @@ def test_github_webhook_validation_success(github_handler, github_push_payload):
 
     headers = {"X-Hub-Signature-256": f"sha256={signature}"}
 
-    assert github_handler.validate_webhook(headers, github_push_payload) is True
+    assert github_handler.validate_webhook(headers, payload_bytes) is True
 
 
 def test_github_webhook_validation_failure(github_handler, github_push_payload):
     headers = {"X-Hub-Signature-256": "sha256=invalid_signature"}
+    payload_bytes = json.dumps(github_push_payload).encode()
 
-    assert github_handler.validate_webhook(headers, github_push_payload) is False
+    assert github_handler.validate_webhook(headers, payload_bytes) is False
 
 
 def test_github_webhook_process_push_event(github_handler, github_push_payload):
@@ -143,3 +144,66 @@ def test_github_webhook_comment_user_request(github_handler, issue_comment_paylo
         "Author: reviewer1"
     )
     assert result.user_request == expected_request
+
+
+def test_github_review_comment_type_comes_from_the_event_header(
+    github_handler, pull_request_payload
+):
+    pull_request_payload["action"] = "created"
+    pull_request_payload["comment"] = {
+        "body": "Please rename this",
+        "user": {"login": "reviewer1"},
+    }
+    # As persisted by the webhook inbox
+    headers = {"x-github-event": "pull_request_review_comment"}
+
+    route_key = github_handler.route_key(headers, pull_request_payload)
+    result = github_handler.process_webhook(pull_request_payload, headers=headers)
+
+    assert route_key.event_type == result.event_type == "comment"
+    assert result.user_request.startswith("Review pull request comment on:")
+
+
+def test_standardized_event_decodes_raw_body_lazily(
+    github_handler, github_push_payload
+):
+    body = json.dumps(github_push_payload).encode()
+    result = github_handler.process_webhook(
+        github_push_payload, raw_body=body, content_type="application/json"
+    )
+
+    assert result.raw_body == body
+    assert result.raw_payload == github_push_payload
+
+
+def test_standardized_event_round_trips_without_decoding(github_push_payload):
+    body = json.dumps(github_push_payload).encode()
+    event = StandardizedEvent(
+        provider="github",
+        event_type="push",
+        user_request="Push to main",
+        payload={"repository": "octocat/Hello-World"},
+        raw_body=body,
+        content_type="application/json",
+    )
+
+    data = event.to_dict()
+    assert "raw_body" not in data  # The body travels by reference
+    loads = []
+    restored = StandardizedEvent.from_dict(
+        json.loads(json.dumps(data)),
+        raw_body_loader=lambda: loads.append(1) or body,
+    )
+
+    assert loads == []  # Not fetched until needed
+    assert restored.raw_body == body
+    assert restored._raw_payload is None  # Not decoded until accessed
+    assert restored == event
+    assert restored.raw_payload == github_push_payload
+
+
+def test_standardized_event_requires_raw_body_or_payload():
+    with pytest.raises(ValueError):
+        StandardizedEvent(
+            provider="github", event_type="push", user_request="", payload={}
+        )
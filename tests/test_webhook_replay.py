@@ -0,0 +1,19 @@
+import asyncio
+
+from benchmarks.webhook_replay import load_corpus, offline_app, replay
+
+
+def test_replay_corpus_offline():
+    entries = load_corpus()
+
+    with offline_app() as (asgi_app, signer, enqueued):
+        report = asyncio.run(
+            replay(asgi_app, signer, entries, requests=60, concurrency=4, seed=1)
+        )
+
+    summary = report.summary()
+    assert summary["requests"] == 60
+    assert summary["error_rate"] == 0
+    assert summary["outcomes"]["accepted"] == len(enqueued) > 0
+    assert summary["outcomes"]["ignored"] > 0  # Pushes and chatter are filtered
+    assert summary["latency_ms"]["p50"] <= summary["latency_ms"]["p99"]
@@ -0,0 +1,296 @@
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import pytest
+from fastapi import Depends
+
+from repopal.api.deps import get_deduplicator, get_webhook_inbox
+from repopal.services.event_coalescer import get_event_coalescer
+from repopal.services.rate_limiter import (
+    RateLimit,
+    RateLimitResolver,
+    TenantRateLimiter,
+    get_rate_limiter,
+)
+from repopal.core.config import settings
+from repopal.core.database import get_db
+from repopal.main import app
+from repopal.models.webhook_delivery import DeliveryStatus
+from repopal.schemas.service_handler import ServiceProvider
+from repopal.services.cancellation import (
+    CancellationRegistry,
+    get_cancellation_registry,
+)
+from repopal.services.delivery_dedup import DeliveryDeduplicator
+from repopal.services.service_handler_factory import ServiceHandlerFactory
+from repopal.services.service_handlers.github import GitHubHandler
+from repopal.services.service_handlers.slack import SlackHandler
+from repopal.services.webhook_inbox import WebhookInbox
+from repopal.services.workspace_speculation import get_workspace_preparation
+
+
+@pytest.fixture(autouse=True)
+def handlers():
+    previous = ServiceHandlerFactory._handlers
+    ServiceHandlerFactory._handlers = {
+        ServiceProvider.GITHUB: GitHubHandler("test_secret", github_token="test_token"),
+        ServiceProvider.SLACK: SlackHandler("test_secret", bot_token="test_token"),
+    }
+    yield
+    ServiceHandlerFactory._handlers = previous
+
+
+@pytest.fixture(autouse=True)
+def ingest_guards():
+    """Disable Redis-backed ingest guards unless a test installs its own"""
+    overrides = {
+        get_deduplicator: lambda: None,
+        get_event_coalescer: lambda: None,
+        get_rate_limiter: lambda: None,
+        get_cancellation_registry: lambda: None,
+        get_workspace_preparation: lambda: None,
+    }
+    app.dependency_overrides.update(overrides)
+    yield
+    for dependency in overrides:
+        app.dependency_overrides.pop(dependency, None)
+
+
+@pytest.fixture
+def queued():
+    """Record enqueued delivery IDs instead of publishing to the broker"""
+    queued = []
+
+    def override_inbox(db=Depends(get_db)):
+        return WebhookInbox(
+            db, enqueue=lambda delivery_id, **options: queued.append(delivery_id)
+        )
+
+    app.dependency_overrides[get_webhook_inbox] = override_inbox
+    yield queued
+    del app.dependency_overrides[get_webhook_inbox]
+
+
+@pytest.fixture
+def issue_payload():
+    return {
+        "action": "opened",
+        "issue": {
+            "number": 7,
+            "title": "Bug report",
+            "body": "Something is broken",
+            "user": {"login": "user1"},
+        },
+        "repository": {"full_name": "org/repo"},
+        "sender": {"login": "user1"},
+    }
+
+
+def slack_headers(body: bytes, content_type: str) -> dict:
+    timestamp = str(int(time.time()))
+    signature = "v0=" + hmac.new(
+        b"test_secret", f"v0:{timestamp}:".encode() + body, hashlib.sha256
+    ).hexdigest()
+    return {
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": signature,
+        "Content-Type": content_type,
+    }
+
+
+def test_github_webhook_verified_on_raw_body(client, queued, issue_payload):
+    # Whitespace differs from json.dumps, so re-serializing would not match
+    body = json.dumps(issue_payload, indent=2).encode()
+    headers = {
+        "X-Hub-Signature-256": "sha256="
+        + hmac.new(b"test_secret", body, hashlib.sha256).hexdigest(),
+        "Content-Type": "application/json",
+        "X-GitHub-Delivery": "delivery-1",
+    }
+
+    response = client.post("/webhooks/github", content=body, headers=headers)
+
+    assert response.status_code == 202
+    assert response.json()["status"] == "accepted"
+    assert queued == [response.json()["delivery_id"]]
+
+
+def test_accepted_delivery_is_persisted(client, db, queued, webhook_signature, issue_payload):
+    headers, body = webhook_signature("test_secret", issue_payload)
+    headers["X-GitHub-Delivery"] = "delivery-2"
+
+    response = client.post("/webhooks/github", content=body, headers=headers)
+
+    delivery = WebhookInbox(db).get(response.json()["delivery_id"])
+    assert delivery.body == body
+    assert delivery.delivery_id == "delivery-2"
+    assert delivery.subject == "org/repo#7"
+    assert delivery.status == DeliveryStatus.QUEUED
+
+
+def test_github_webhook_rejects_bad_signature(client, queued, issue_payload):
+    response = client.post(
+        "/webhooks/github",
+        content=json.dumps(issue_payload).encode(),
+        headers={"X-Hub-Signature-256": "sha256=invalid"},
+    )
+    assert response.status_code == 401
+    assert queued == []
+
+
+def test_webhook_rejects_unsigned_request(client, issue_payload):
+    response = client.post("/webhooks/github", json=issue_payload)
+    assert response.status_code == 401
+
+
+def test_webhook_rejects_oversized_request(client, webhook_signature, monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_MAX_BODY_BYTES", 64)
+    headers, body = webhook_signature("test_secret", {"padding": "x" * 128})
+
+    response = client.post("/webhooks/github", content=body, headers=headers)
+
+    assert response.status_code == 413
+
+
+def test_slack_form_encoded_slash_command(client, db, queued):
+    body = urlencode(
+        {"command": "/repopal", "text": "explain the worker", "user_name": "dev"}
+    ).encode()
+    headers = slack_headers(body, "application/x-www-form-urlencoded")
+
+    response = client.post("/webhooks/slack", content=body, headers=headers)
+
+    assert response.status_code == 200
+    delivery = WebhookInbox(db).get(response.json()["delivery_id"])
+    payload = ServiceHandlerFactory.get_handler(ServiceProvider.SLACK).decode_payload(
+        delivery.body, delivery.content_type
+    )
+    assert payload["text"] == "explain the worker"
+
+
+def test_slack_url_verification_answered_inline(client, queued):
+    body = json.dumps({"type": "url_verification", "challenge": "abc123"}).encode()
+    headers = slack_headers(body, "application/json")
+
+    response = client.post("/webhooks/slack", content=body, headers=headers)
+
+    assert response.status_code == 200
+    assert response.json() == {"challenge": "abc123"}
+    assert queued == []
+
+
+def test_redelivery_is_acknowledged_and_dropped(client, queued, redis_client, webhook_signature, issue_payload):
+    app.dependency_overrides[get_deduplicator] = lambda: DeliveryDeduplicator(
+        redis_client, ttl_seconds=60
+    )
+    headers, body = webhook_signature("test_secret", issue_payload)
+    headers["X-GitHub-Delivery"] = "delivery-3"
+
+    first = client.post("/webhooks/github", content=body, headers=headers)
+    second = client.post("/webhooks/github", content=body, headers=headers)
+
+    assert first.json()["status"] == "accepted"
+    assert second.status_code == 202
+    assert second.json() == {"status": "duplicate"}
+    assert len(queued) == 1
+
+
+def test_irrelevant_events_are_ignored(client, queued, webhook_signature):
+    push = {"ref": "refs/heads/main", "pusher": {"name": "user1"}, "sender": {"login": "user1"}}
+    headers, body = webhook_signature("test_secret", push)
+    headers["X-GitHub-Event"] = "push"
+
+    response = client.post("/webhooks/github", content=body, headers=headers)
+
+    assert response.status_code == 202
+    assert response.json() == {"status": "ignored"}
+    assert queued == []
+
+
+def test_over_limit_installation_is_shed(client, queued, redis_client, webhook_signature, issue_payload):
+    limiter = TenantRateLimiter(
+        redis_client,
+        RateLimitResolver(
+            RateLimit(per_minute=1, burst=1), loader=lambda default: {}
+        ),
+    )
+    app.dependency_overrides[get_rate_limiter] = lambda: limiter
+    issue_payload["installation"] = {"id": 99}
+    headers, body = webhook_signature("test_secret", issue_payload)
+
+    first = client.post("/webhooks/github", content=body, headers=headers)
+    second = client.post("/webhooks/github", content=body, headers=headers)
+
+    assert first.json()["status"] == "accepted"
+    assert second.status_code == 429
+    assert second.json()["status"] == "rate_limited"
+    assert int(second.headers["Retry-After"]) >= 1
+    assert len(queued) == 1
+
+
+def test_closing_an_issue_cancels_its_runs(client, queued, redis_client, webhook_signature, issue_payload):
+    registry = CancellationRegistry(redis_client)
+    app.dependency_overrides[get_cancellation_registry] = lambda: registry
+    started = datetime.utcnow() - timedelta(seconds=1)
+    issue_payload["action"] = "closed"
+    headers, body = webhook_signature("test_secret", issue_payload)
+
+    response = client.post("/webhooks/github", content=body, headers=headers)
+
+    assert response.json() == {"status": "ignored"}
+    assert registry.is_cancelled(ServiceProvider.GITHUB, "org/repo#7", started)
+    assert not registry.is_cancelled(ServiceProvider.GITHUB, "org/repo#8", started)
+
+
+def test_redelivered_close_does_not_cancel_later_runs(client, queued, redis_client, webhook_signature, issue_payload):
+    registry = CancellationRegistry(redis_client)
+    app.dependency_overrides[get_cancellation_registry] = lambda: registry
+    app.dependency_overrides[get_deduplicator] = lambda: DeliveryDeduplicator(
+        redis_client, ttl_seconds=60
+    )
+    issue_payload["action"] = "closed"
+    headers, body = webhook_signature("test_secret", issue_payload)
+    headers["X-GitHub-Delivery"] = "delivery-close"
+    client.post("/webhooks/github", content=body, headers=headers)
+    # The first cancellation lapses before GitHub redelivers the close
+    redis_client.delete(registry._key(ServiceProvider.GITHUB, "org/repo#7"))
+    started = datetime.utcnow() - timedelta(seconds=1)
+
+    response = client.post("/webhooks/github", content=body, headers=headers)
+
+    assert response.json() == {"status": "duplicate"}
+    assert not registry.is_cancelled(ServiceProvider.GITHUB, "org/repo#7", started)
+
+
+def test_new_request_supersedes_runs_for_the_same_subject(client, queued, redis_client, webhook_signature, issue_payload):
+    registry = CancellationRegistry(redis_client)
+    app.dependency_overrides[get_cancellation_registry] = lambda: registry
+    started = datetime.utcnow() - timedelta(seconds=1)
+    issue_payload["action"] = "edited"
+    headers, body = webhook_signature("test_secret", issue_payload)
+
+    response = client.post("/webhooks/github", content=body, headers=headers)
+
+    assert response.json()["status"] == "accepted"
+    assert registry.is_cancelled(ServiceProvider.GITHUB, "org/repo#7", started)
+    assert not registry.is_cancelled(
+        ServiceProvider.GITHUB, "org/repo#7", datetime.utcnow() + timedelta(seconds=1)
+    )
+
+
+def test_accepted_github_event_starts_preparing_its_workspace(client, queued, webhook_signature, issue_payload):
+    prepared = []
+    app.dependency_overrides[get_workspace_preparation] = lambda: prepared.append
+    issue_payload["repository"]["html_url"] = "https://github.com/org/repo"
+    headers, body = webhook_signature("test_secret", issue_payload)
+
+    client.post("/webhooks/github", content=body, headers=headers)
+    issue_payload["action"] = "labeled"
+    headers, body = webhook_signature("test_secret", issue_payload)
+    client.post("/webhooks/github", content=body, headers=headers)
+
+    assert prepared == ["https://github.com/org/repo"]